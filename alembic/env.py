@@ -5,7 +5,7 @@ from sqlalchemy import pool
 
 from alembic import context
 
-from app.config import DATABASE_URL, settings
+from app.config import settings
 from sqlmodel import SQLModel
 
 
@@ -0,0 +1,53 @@
+"""add foreign key indexes
+
+Revision ID: 0f6c3d8e2a47
+Revises: e4b7a2c91f06
+Create Date: 2026-10-18 15:37:04.118362
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0f6c3d8e2a47"
+down_revision: Union[str, None] = "e4b7a2c91f06"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Build the indexes without blocking writes; CONCURRENTLY cannot run in a transaction
+    with op.get_context().autocommit_block():
+        op.create_index(
+            op.f("ix_post_owner_id"),
+            "post",
+            ["owner_id"],
+            unique=False,
+            postgresql_concurrently=True,
+        )
+        op.create_index(
+            op.f("ix_vote_post_id"),
+            "vote",
+            ["post_id"],
+            unique=False,
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            op.f("ix_vote_post_id"),
+            table_name="vote",
+            postgresql_concurrently=True,
+        )
+        op.drop_index(
+            op.f("ix_post_owner_id"),
+            table_name="post",
+            postgresql_concurrently=True,
+        )
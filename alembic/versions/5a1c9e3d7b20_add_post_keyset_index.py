@@ -0,0 +1,30 @@
+"""add post keyset index
+
+Revision ID: 5a1c9e3d7b20
+Revises: 877410e46a57
+Create Date: 2026-10-18 09:12:40.318204
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "5a1c9e3d7b20"
+down_revision: Union[str, None] = "877410e46a57"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index(
+        "ix_post_created_at_id", "post", ["created_at", "id"], unique=False
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_post_created_at_id", table_name="post")
@@ -0,0 +1,75 @@
+"""add post search vector
+
+Revision ID: 9d4f2b6a1e83
+Revises: 5a1c9e3d7b20
+Create Date: 2026-10-18 10:02:15.744391
+
+Adding the STORED generated column rewrites the post table under an ACCESS
+EXCLUSIVE lock, so reads and writes of posts wait until every row's tsvector is
+computed; run it in a maintenance window on large tables. The GIN index is built
+CONCURRENTLY afterwards, outside the migration's transaction, so writes resume as
+soon as the column is added.
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# The tsvector stored in post.search_vector, as app.search builds it at this revision
+SEARCH_VECTOR_EXPRESSION = (
+    "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(content, '')), 'B')"
+)
+
+# revision identifiers, used by Alembic.
+revision: str = "9d4f2b6a1e83"
+down_revision: Union[str, None] = "5a1c9e3d7b20"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        "post",
+        sa.Column(
+            "search_vector",
+            postgresql.TSVECTOR(),
+            sa.Computed(SEARCH_VECTOR_EXPRESSION, persisted=True),
+            nullable=True,
+        ),
+    )
+    # Build and drop the indexes without blocking writes; CONCURRENTLY cannot run in a
+    # transaction
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_post_search_vector",
+            "post",
+            ["search_vector"],
+            unique=False,
+            postgresql_using="gin",
+            postgresql_concurrently=True,
+        )
+        # LIKE '%term%' could never use this index, and full-text search replaces it
+        op.drop_index(
+            op.f("ix_post_content"), table_name="post", postgresql_concurrently=True
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.create_index(
+            op.f("ix_post_content"),
+            "post",
+            ["content"],
+            unique=False,
+            postgresql_concurrently=True,
+        )
+        op.drop_index(
+            "ix_post_search_vector", table_name="post", postgresql_concurrently=True
+        )
+    op.drop_column("post", "search_vector")
@@ -0,0 +1,49 @@
+"""add post vote counters
+
+Revision ID: c3e8a5f0d914
+Revises: 9d4f2b6a1e83
+Create Date: 2026-10-18 11:24:51.902617
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "c3e8a5f0d914"
+down_revision: Union[str, None] = "9d4f2b6a1e83"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        "post",
+        sa.Column("votes", sa.Integer(), nullable=False, server_default="0"),
+    )
+    op.create_table(
+        "votecountshard",
+        sa.Column("post_id", sa.Integer(), nullable=False),
+        sa.Column("shard", sa.Integer(), nullable=False),
+        sa.Column("delta", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["post_id"], ["post.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("post_id", "shard"),
+    )
+    # Backfill the counter from the existing votes
+    op.execute(
+        """
+        UPDATE post SET votes = counts.votes
+        FROM (SELECT post_id, count(*) AS votes FROM vote GROUP BY post_id) AS counts
+        WHERE post.id = counts.post_id
+        """
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("votecountshard")
+    op.drop_column("post", "votes")
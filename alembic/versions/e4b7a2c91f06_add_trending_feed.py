@@ -0,0 +1,58 @@
+"""add trending feed
+
+Revision ID: e4b7a2c91f06
+Revises: c3e8a5f0d914
+Create Date: 2026-10-18 14:02:17.550941
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "e4b7a2c91f06"
+down_revision: Union[str, None] = "c3e8a5f0d914"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Existing votes get the migration time, since when they were cast is unknown
+    op.add_column(
+        "vote",
+        sa.Column(
+            "created_at",
+            sa.DateTime(),
+            nullable=False,
+            server_default=sa.text("now()"),
+        ),
+    )
+    op.create_index("ix_vote_created_at", "vote", ["created_at"], unique=False)
+    op.create_table(
+        "posttrend",
+        sa.Column("post_id", sa.Integer(), nullable=False),
+        sa.Column("score", sa.Float(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(["post_id"], ["post.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("post_id"),
+    )
+    op.create_table(
+        "trendingpost",
+        sa.Column("rank", sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column("post_id", sa.Integer(), nullable=False),
+        sa.Column("score", sa.Float(), nullable=False),
+        sa.ForeignKeyConstraint(["post_id"], ["post.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("rank"),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("trendingpost")
+    op.drop_table("posttrend")
+    op.drop_index("ix_vote_created_at", table_name="vote")
+    op.drop_column("vote", "created_at")
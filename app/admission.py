@@ -0,0 +1,223 @@
+# Import logging to report when the worker starts and stops shedding load
+import logging
+
+# Import time to measure queue time and pace limit adjustments
+import time
+
+# Import parse_qs to tell searches from plain post listings
+from urllib.parse import parse_qs
+
+# Import Match to find the route a rejected request was meant for
+from starlette.routing import Match
+
+# Import the settings from the config module
+from .config import settings
+
+# Import the pool metrics to watch how long checkouts wait for a connection
+from .pool_metrics import pool_metrics
+
+# Request priorities, highest first
+CRITICAL, NORMAL, LOW = 0, 1, 2
+
+# Priority names used in metrics
+PRIORITY_NAMES = {CRITICAL: "critical", NORMAL: "normal", LOW: "low"}
+
+# Routes that must keep working under overload: probes, metrics and logins
+CRITICAL_PATHS = frozenset(
+    {"/health", "/health/ready", "/health/pool", "/metrics", "/login"}
+)
+
+# Expensive reads shed first under overload
+LOW_PATHS = frozenset({"/posts/export"})
+
+# Body of the response sent to rejected requests
+REJECTED_BODY = b'{"detail":"Server is overloaded, please retry shortly"}'
+
+# Logger for load shedding
+logger = logging.getLogger(__name__)
+
+
+# Function to return the priority of a request from its method, path and query
+def route_priority(scope) -> int:
+    path = scope["path"]
+    if path in CRITICAL_PATHS:
+        return CRITICAL
+    if scope["method"] == "GET":
+        if path in LOW_PATHS:
+            return LOW
+        # Searches rank every match, unlike plain listings served by an index
+        if path.rstrip("/") == "/posts":
+            query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+            if any(query.get("search", [])):
+                return LOW
+    return NORMAL
+
+
+# Function to return the route a request would have matched, or None
+def matched_route(scope):
+    for route in scope["app"].router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route
+    return None
+
+
+# Function to return how long the proxy queued the request, from X-Request-Start
+def queue_time(scope) -> float | None:
+    for name, value in scope["headers"]:
+        if name == b"x-request-start":
+            try:
+                started = float(value.decode("latin-1").removeprefix("t="))
+            except ValueError:
+                return None
+            # Proxies send seconds (nginx), milliseconds (Heroku) or microseconds
+            if started > 1e14:
+                started /= 1e6
+            elif started > 1e11:
+                started /= 1e3
+            return max(0.0, time.time() - started)
+    return None
+
+
+# Adaptive concurrency limit for one worker process. Every admission window the
+# limit shrinks by a quarter when connection checkouts or proxy queueing take longer
+# than the target delay, and grows by 5% when requests were held back by it. It never
+# drops below the connections the pool can hand out, so the database stays busy.
+class AdmissionController:
+    def __init__(self):
+        # Most requests of normal priority served at once, set on the first request
+        self.limit: int | None = None
+        # Requests being served
+        self.in_flight = 0
+        # Whether the last window was over the target delay; low priority is shed
+        self.overloaded = False
+        # Number of rejected requests by priority
+        self.rejected = {priority: 0 for priority in PRIORITY_NAMES}
+        # Start of the current window and the most requests in flight during it
+        self.window_started = time.monotonic()
+        self.peak_in_flight = 0
+        # Proxy queue time observed during the current window
+        self.queue_seconds = 0.0
+        self.queue_count = 0
+        # Pool counters at the start of the current window
+        self.pool_totals = self.read_pool_totals()
+
+    # Return the total checkout wait, checkout attempts and timeouts of every pool
+    def read_pool_totals(self) -> tuple[float, int, int]:
+        wait, attempts, timeouts = 0.0, 0, 0
+        for metrics in pool_metrics.values():
+            wait += metrics.wait_seconds_total
+            attempts += metrics.checkouts + metrics.timeouts
+            timeouts += metrics.timeouts
+        return wait, attempts, timeouts
+
+    # Close the window when it is over, moving the limit according to its delays
+    def adjust(self, now: float):
+        if now - self.window_started < settings.admission_window:
+            return
+        totals = self.read_pool_totals()
+        wait, attempts, timeouts = (
+            new - old for new, old in zip(totals, self.pool_totals)
+        )
+        pool_wait = wait / attempts if attempts else 0.0
+        queued = self.queue_seconds / self.queue_count if self.queue_count else 0.0
+        overloaded = (
+            timeouts > 0 or max(pool_wait, queued) > settings.admission_target_delay
+        )
+
+        if overloaded:
+            # Shrink below what actually ran, so the backlog drains
+            self.limit = max(
+                settings.db_pool_size + settings.db_max_overflow,
+                int(min(self.limit, self.peak_in_flight) * 0.75),
+            )
+        elif self.peak_in_flight >= self.limit:
+            self.limit = min(
+                settings.admission_max_in_flight, self.limit + max(1, self.limit // 20)
+            )
+        if overloaded != self.overloaded:
+            if overloaded:
+                logger.warning(
+                    "Shedding load: checkout wait %.3fs, queue time %.3fs, limit %d",
+                    pool_wait,
+                    queued,
+                    self.limit,
+                )
+            else:
+                logger.info("Load back to normal, limit %d", self.limit)
+        self.overloaded = overloaded
+
+        self.window_started = now
+        self.peak_in_flight = self.in_flight
+        self.queue_seconds = 0.0
+        self.queue_count = 0
+        self.pool_totals = totals
+
+    # Admit or reject a request of the given priority, counting it in flight if admitted
+    def admit(self, priority: int, queued: float | None) -> bool:
+        if self.limit is None:
+            # Start at the ceiling; read here so importing the app needs no settings
+            self.limit = settings.admission_max_in_flight
+        self.adjust(time.monotonic())
+        if queued is not None:
+            self.queue_seconds += queued
+            self.queue_count += 1
+
+        if priority == CRITICAL:
+            admitted = self.in_flight < settings.admission_max_in_flight
+        elif queued is not None and queued > settings.admission_max_queue_time:
+            # The client has most likely given up already
+            admitted = False
+        elif priority == NORMAL:
+            admitted = self.in_flight < self.limit
+        else:
+            admitted = self.in_flight < self.limit and not self.overloaded
+
+        if admitted:
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        else:
+            self.rejected[priority] += 1
+        return admitted
+
+    # Mark an admitted request as finished
+    def release(self):
+        self.in_flight -= 1
+
+
+# Shared admission controller for this worker process
+admission_controller = AdmissionController()
+
+
+# Pure ASGI middleware that rejects requests early with 503 when the worker is overloaded
+class AdmissionControlMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.admission_control_enabled:
+            return await self.app(scope, receive, send)
+
+        if not admission_controller.admit(route_priority(scope), queue_time(scope)):
+            # Never routed, so label the metrics of the rejection with the route here
+            route = matched_route(scope)
+            if route is not None:
+                scope["route"] = route
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": 503,
+                    "headers": [
+                        (b"content-type", b"application/json"),
+                        (b"content-length", str(len(REJECTED_BODY)).encode()),
+                        (b"retry-after", str(settings.admission_retry_after).encode()),
+                    ],
+                }
+            )
+            await send({"type": "http.response.body", "body": REJECTED_BODY})
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            admission_controller.release()
@@ -0,0 +1,60 @@
+# Import Any to describe unvalidated request items
+from typing import Any
+
+# Import ValidationError to report invalid items individually
+from pydantic import ValidationError
+
+# Import Body to declare bulk request bodies, and HTTPException and status for
+# per-item status codes and oversized requests
+from fastapi import Body, HTTPException, status
+
+# Import settings for the most items accepted per request
+from .config import settings
+
+# Import the bulk result schemas
+from .schema import BulkItemResult, BulkResult
+
+
+# Function to declare a bulk request body of raw items. The items are validated one by
+# one by validate_items, so the body is typed as plain dicts; the model's schema is
+# still published for them in OpenAPI
+def bulk_body(model):
+    return Body(json_schema_extra={"items": model.model_json_schema()})
+
+
+# Function to validate every item against a schema in one pass
+def validate_items(model, items: list[Any]):
+    # Checked here rather than in the route signature, so importing needs no settings
+    if len(items) > settings.bulk_max_items:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"At most {settings.bulk_max_items} items are accepted per request",
+        )
+    # Collect (index, validated item) pairs and results for the rejected items
+    valid = []
+    rejected = []
+    for index, item in enumerate(items):
+        try:
+            valid.append((index, model.model_validate(item)))
+        except ValidationError as e:
+            rejected.append(
+                BulkItemResult(
+                    index=index,
+                    status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                    detail="; ".join(
+                        f"{'.'.join(map(str, error['loc']))}: {error['msg']}"
+                        for error in e.errors()
+                    ),
+                )
+            )
+    return valid, rejected
+
+
+# Function to build the summary returned by bulk endpoints
+def bulk_result(results: list[BulkItemResult]) -> BulkResult:
+    # Report items in request order
+    results.sort(key=lambda result: result.index)
+    succeeded = sum(result.status < 400 for result in results)
+    return BulkResult(
+        succeeded=succeeded, failed=len(results) - succeeded, results=results
+    )
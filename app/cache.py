@@ -0,0 +1,142 @@
+# Import threading to guard the cache against concurrent access from worker threads
+import threading
+
+# Import time for monotonic expiry timestamps
+import time
+
+# Import OrderedDict to keep entries in least-recently-used order
+from collections import OrderedDict
+
+# Import hashlib to derive strong ETags from response bodies
+import hashlib
+
+# Import NamedTuple to describe cached responses
+from typing import NamedTuple
+
+# Import Request, Response and status for conditional responses
+from fastapi import Request, Response, status
+
+
+# Bounded in-process LRU cache whose entries expire after a time-to-live
+class TTLCache:
+    def __init__(self, maxsize: int, ttl: float):
+        # Maximum number of entries before the least recently used one is evicted
+        self.maxsize = maxsize
+        # Default number of seconds an entry stays valid
+        self.ttl = ttl
+        # Entries mapped to (expires_at, value), oldest use first
+        self.data: OrderedDict = OrderedDict()
+        # Lock shared by every operation that touches the entries or counters
+        self.lock = threading.Lock()
+        # Number of lookups answered from the cache
+        self.hits = 0
+        # Number of lookups that missed or found an expired entry
+        self.misses = 0
+
+    # Return the cached value for key, or default if missing or expired
+    def get(self, key, default=None):
+        with self.lock:
+            entry = self.data.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                if entry is not None:
+                    del self.data[key]
+                self.misses += 1
+                return default
+            self.data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    # Store value under key for ttl seconds (the cache default if not given)
+    def set(self, key, value, ttl: float | None = None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self.lock:
+            self.data[key] = (expires_at, value)
+            self.data.move_to_end(key)
+            # Evict the least recently used entries beyond the size limit
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    # Remove key from the cache, if present
+    def pop(self, key):
+        with self.lock:
+            self.data.pop(key, None)
+
+    # Remove every entry from the cache
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+    # Fraction of lookups answered from the cache
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+# Serialized response body with its strong ETag and extra headers
+class CachedResponse(NamedTuple):
+    # Cache version the body was built at; list entries from older versions are stale
+    version: int
+    # Strong ETag computed from the body bytes
+    etag: str
+    # JSON body exactly as sent to the client
+    body: bytes
+    # Extra headers to send with the body (e.g. the next page cursor)
+    headers: dict[str, str]
+
+
+# Cache of serialized post responses with precise invalidation
+class ResponseCache:
+    def __init__(self, maxsize: int, ttl: float):
+        # Serialized responses keyed by ("post", post_id) or ("posts", *query)
+        self.entries = TTLCache(maxsize=maxsize, ttl=ttl)
+        # Bumped on every write, which makes every cached list stale at once
+        self.version = 0
+
+    # Return the cached response for key, or None if missing or stale
+    def get(self, key) -> CachedResponse | None:
+        entry = self.entries.get(key)
+        if entry is None or (key[0] == "posts" and entry.version != self.version):
+            return None
+        return entry
+
+    # Cache a JSON body for ttl seconds (the cache default if not given) unless a
+    # write happened since version was read; a ttl of 0 only builds the entry
+    def set(
+        self,
+        key,
+        version: int,
+        body: bytes,
+        headers: dict[str, str] | None = None,
+        ttl: float | None = None,
+    ):
+        etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+        # Keep a copy so entries never share, or see later changes to, a caller's dict
+        entry = CachedResponse(version, etag, body, dict(headers or {}))
+        if version == self.version and (ttl is None or ttl > 0):
+            self.entries.set(key, entry, ttl)
+        return entry
+
+    # Drop cached lists and the cached responses of the given posts
+    def invalidate(self, *post_ids: int):
+        self.version += 1
+        for post_id in post_ids:
+            self.entries.pop(("post", post_id))
+
+    # Drop every cached response
+    def clear(self):
+        self.version += 1
+        self.entries.clear()
+
+
+# Function to build the response for a cached entry, or 304 if the client has it
+def cached_json_response(request: Request, entry: CachedResponse) -> Response:
+    headers = {"ETag": entry.etag, "Cache-Control": "no-cache", **entry.headers}
+    # Compare against every ETag the client sent, or "*" for any
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (
+        if_none_match.strip() == "*"
+        or entry.etag in (tag.strip() for tag in if_none_match.split(","))
+    ):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(entry.body, media_type="application/json", headers=headers)
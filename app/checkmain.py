@@ -1,30 +1,32 @@
+import logging
 from fastapi import FastAPI
 from contextlib import asynccontextmanager
 from sqlalchemy import inspect
 from .routers import posts, users, auth, votes
-from .database import create_db_and_tables, engine
+from .config import get_engine
+from .database import create_db_and_tables
+from .log import setup_logging
 
-
-inspector = inspect(engine)
-
-table_names = inspector.get_table_names()
+logger = logging.getLogger(__name__)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Startup
+    setup_logging()
+    # Startup: inspect here, not at import, so importing the app opens no connection
+    table_names = inspect(get_engine()).get_table_names()
     if "users" in table_names and "post" in table_names and "vote" in table_names:
-        print("Database and tables already exist. Connecting...")
+        logger.info("Database and tables already exist. Connecting...")
     else:
-        print("Database or tables do not exist. Creating...")
+        logger.info("Database or tables do not exist. Creating...")
     create_db_and_tables()
-    print("Database and tables created.")
+    logger.info("Database and tables created.")
 
     yield
     # Shutdown
-    print("Application shutting down. Closing database connection.")
-    engine.dispose()
-    print("Database connection closed.")
+    logger.info("Application shutting down. Closing database connection.")
+    get_engine().dispose()
+    logger.info("Database connection closed.")
 
 
 app: FastAPI = FastAPI(lifespan=lifespan)
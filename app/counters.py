@@ -0,0 +1,231 @@
+# Import asyncio to run the background fold loop
+import asyncio
+
+# Import logging to report failed folds
+import logging
+
+# Import random to spread concurrent voters over counter shards
+import random
+
+# Import SQLModel helpers for building counter statements
+from sqlmodel import text
+
+# Import the PostgreSQL insert construct for ON CONFLICT upserts
+from sqlalchemy.dialects.postgresql import insert
+
+# Import AsyncSession for non-blocking database sessions
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+# Import the settings and the async engine getter from the config module
+from .config import get_async_engine, get_response_cache, settings
+
+# Import the VoteCountShard model
+from .models import VoteCountShard
+
+# Add the vote deltas of a "changes" CTE to the posts' trend scores, decaying them first
+ADD_TREND_SQL = """
+    INSERT INTO posttrend (post_id, score, updated_at)
+    SELECT id, delta, localtimestamp FROM changes
+    ON CONFLICT (post_id) DO UPDATE SET
+        score = posttrend.score * power(0.5, least(1000, CAST(extract(
+            epoch FROM excluded.updated_at - posttrend.updated_at
+        ) AS float) / :half_life)) + excluded.score,
+        updated_at = excluded.updated_at
+    """
+
+
+# Function to build the statement that moves the pending shard deltas matching where
+# into post.votes and the trend scores in one statement
+def fold_shards_sql(where: str = "TRUE"):
+    return text(f"""
+    WITH folded AS (
+        DELETE FROM votecountshard WHERE {where} RETURNING post_id, delta
+    ), changes AS (
+        SELECT post_id AS id, sum(delta) AS delta
+        FROM folded GROUP BY post_id HAVING sum(delta) <> 0
+    ), trend AS ({ADD_TREND_SQL})
+    UPDATE post SET votes = post.votes + changes.delta
+    FROM changes
+    WHERE post.id = changes.id
+    RETURNING post.id
+    """)
+
+
+# Move every pending shard delta into post.votes and the trend scores
+FOLD_SHARDS_SQL = fold_shards_sql()
+
+# Move the pending shard deltas of the given posts into post.votes and the trends
+FOLD_POST_SHARDS_SQL = fold_shards_sql("post_id = ANY(CAST(:post_ids AS integer[]))")
+
+# Lock the next batch of posts in ID order. FOR UPDATE conflicts with the FOR KEY
+# SHARE lock of the foreign key checks, so no vote or new shard row can be added to
+# the posts until the batch commits, and it waits for writers already under way
+LOCK_POST_BATCH_SQL = text("""
+    SELECT id FROM post WHERE id > :after ORDER BY id LIMIT :size FOR UPDATE
+    """)
+
+# Lock the existing shard rows of the given posts, which upserts change in place
+LOCK_POST_SHARDS_SQL = text("""
+    SELECT 1 FROM votecountshard
+    WHERE post_id = ANY(CAST(:post_ids AS integer[]))
+    ORDER BY post_id, shard
+    FOR UPDATE
+    """)
+
+# Recompute post.votes from the vote table for the given posts that drifted
+RECONCILE_SQL = text("""
+    UPDATE post SET votes = counts.votes
+    FROM (
+        SELECT post.id, count(vote.post_id) AS votes
+        FROM post LEFT OUTER JOIN vote ON vote.post_id = post.id
+        WHERE post.id = ANY(CAST(:post_ids AS integer[]))
+        GROUP BY post.id
+    ) AS counts
+    WHERE post.id = counts.id AND post.votes <> counts.votes
+    RETURNING post.id
+    """)
+
+# Add many vote deltas to post.votes and the trend scores at once, locking the
+# post rows in ID order. FOR NO KEY UPDATE is the lock the UPDATE takes anyway; a
+# stronger FOR UPDATE would conflict with the FOR KEY SHARE lock the vote INSERT's
+# foreign key check holds on the same post, deadlocking concurrent votes on a post
+ADD_VOTES_SQL = text(f"""
+    WITH changes AS (
+        SELECT post.id, d.delta
+        FROM post JOIN unnest(CAST(:post_ids AS integer[]), CAST(:deltas AS integer[]))
+            AS d(post_id, delta) ON d.post_id = post.id
+        ORDER BY post.id
+        FOR NO KEY UPDATE OF post
+    ), trend AS ({ADD_TREND_SQL})
+    UPDATE post SET votes = post.votes + changes.delta
+    FROM changes
+    WHERE post.id = changes.id
+    """)
+
+# Logger for vote counter maintenance
+logger = logging.getLogger(__name__)
+
+
+# Function to apply net vote changes ({post_id: delta}) within the caller's transaction
+async def apply_vote_deltas(session: AsyncSession, deltas: dict[int, int]):
+    # Drop posts whose changes cancel out, and sort to take row locks in a stable order
+    changes = sorted(
+        (post_id, delta) for post_id, delta in deltas.items() if delta != 0
+    )
+    if not changes:
+        return
+
+    # In sharded mode, add the delta to a random shard row instead of the post row
+    if settings.vote_counter_mode == "sharded":
+        statement = insert(VoteCountShard).values(
+            [
+                {
+                    "post_id": post_id,
+                    "shard": random.randrange(settings.vote_counter_shards),
+                    "delta": delta,
+                }
+                for post_id, delta in changes
+            ]
+        )
+        await session.exec(
+            statement.on_conflict_do_update(
+                index_elements=["post_id", "shard"],
+                set_={"delta": VoteCountShard.delta + statement.excluded.delta},
+            )
+        )
+        return
+
+    # In direct mode, update post.votes and the trend scores with one statement
+    await session.exec(
+        ADD_VOTES_SQL,
+        params={
+            "post_ids": [post_id for post_id, _ in changes],
+            "deltas": [delta for _, delta in changes],
+            "half_life": settings.trending_half_life,
+        },
+    )
+
+
+# Function to drop cached responses of posts whose committed vote counts changed
+def invalidate_vote_counts(post_ids):
+    # Sharded deltas only reach post.votes when folded, which invalidates them then
+    if post_ids and settings.vote_counter_mode != "sharded":
+        get_response_cache().invalidate(*post_ids)
+
+
+# Function to fold pending shard deltas into post.votes, returning the posts updated
+async def fold_vote_shards(session: AsyncSession) -> int:
+    result = await session.exec(
+        FOLD_SHARDS_SQL, params={"half_life": settings.trending_half_life}
+    )
+    post_ids = [post_id for (post_id,) in result.all()]
+    await session.commit()
+    # Drop cached responses that show the old counts
+    if post_ids:
+        get_response_cache().invalidate(*post_ids)
+    return len(post_ids)
+
+
+# Function to rebuild post.votes from the vote table, returning the posts corrected.
+# Posts are recounted in batches of vote_reconcile_batch_size, one transaction each,
+# so voting only waits on the posts of the batch being counted
+async def reconcile_vote_counts(session: AsyncSession) -> int:
+    corrected = 0
+    after = 0
+    while True:
+        # Hold off new votes on the batch so none is missed or counted twice
+        result = await session.exec(
+            LOCK_POST_BATCH_SQL,
+            params={"after": after, "size": settings.vote_reconcile_batch_size},
+        )
+        post_ids = [post_id for (post_id,) in result.all()]
+        if not post_ids:
+            await session.commit()
+            return corrected
+        params = {"post_ids": post_ids}
+        await session.exec(LOCK_POST_SHARDS_SQL, params=params)
+        # Fold the pending deltas first, so their trend scores are kept; the recount
+        # then replaces the folded counts
+        result = await session.exec(
+            FOLD_POST_SHARDS_SQL,
+            params={**params, "half_life": settings.trending_half_life},
+        )
+        folded = {post_id for (post_id,) in result.all()}
+        result = await session.exec(RECONCILE_SQL, params=params)
+        changed = {post_id for (post_id,) in result.all()}
+        await session.commit()
+        # Drop cached responses that show the old counts
+        if folded or changed:
+            get_response_cache().invalidate(*(folded | changed))
+        corrected += len(changed)
+        after = post_ids[-1]
+
+
+# Background task that periodically folds sharded vote counters
+async def run_vote_fold_loop():
+    try:
+        while True:
+            await asyncio.sleep(settings.vote_counter_fold_interval)
+            try:
+                async with AsyncSession(get_async_engine()) as session:
+                    await fold_vote_shards(session)
+            except Exception:
+                # Keep folding on the next tick if the database is briefly unavailable
+                logger.exception("Vote counter fold failed")
+    finally:
+        # Fold whatever is left when the application shuts down
+        async with AsyncSession(get_async_engine()) as session:
+            await fold_vote_shards(session)
+
+
+# Allow running the reconciler from the command line: python -m app.counters
+if __name__ == "__main__":
+
+    # Reconcile all vote counts once and report how many posts were corrected
+    async def main():
+        async with AsyncSession(get_async_engine()) as session:
+            corrected = await reconcile_vote_counts(session)
+        print(f"Reconciled vote counts, {corrected} posts corrected.")
+        await get_async_engine().dispose()
+
+    asyncio.run(main())
@@ -5,17 +5,26 @@ from typing import Annotated
 from fastapi import Depends
 
 # Import database engine and session factory from config module
-from .config import engine, get_session
+from .config import get_async_session, get_engine
 
-# Import SQLModel for database modeling and Session for database sessions
-from sqlmodel import SQLModel, Session
+# Import the read-only session dependency, routed to a replica when configured
+from .replicas import get_read_session
+
+# Import SQLModel for database modeling
+from sqlmodel import SQLModel
+
+# Import AsyncSession for non-blocking database sessions
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 
 # Function to create database and all tables based on SQLModel models
 def create_db_and_tables():
     # Create all tables in the database using the engine
-    SQLModel.metadata.create_all(engine)
+    SQLModel.metadata.create_all(get_engine())
+
 
+# Create a type hint for AsyncSession with dependency injection
+SessionDep = Annotated[AsyncSession, Depends(get_async_session)]
 
-# Create a type hint for Session with dependency injection
-SessionDep = Annotated[Session, Depends(get_session)]
+# Create a type hint for AsyncSession on a read replica, for read-only endpoints
+ReadSessionDep = Annotated[AsyncSession, Depends(get_read_session)]
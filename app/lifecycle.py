@@ -0,0 +1,153 @@
+# Import asyncio to open connections concurrently and wait for requests to finish
+import asyncio
+
+# Import logging to report how long warm-up and drain took
+import logging
+
+# Import signal to start draining as soon as the server is asked to stop
+import signal
+
+# Import threading to install signal handlers only from the main thread
+import threading
+
+# Import time to bound the drain and measure the warm-up
+import time
+
+# Import httpx to send the warm-up requests to the app in-process
+import httpx
+
+# Import AsyncEngine for the type of the engine being warmed up
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+# Import the settings and the async engine getter from the config module
+from .config import get_async_engine, settings
+
+# Import the request metrics, which count the requests in flight
+from .metrics import request_metrics
+
+# Import the replica router to connect to every replica before serving
+from .replicas import replica_router
+
+# Worker phases reported by the readiness probe; only ready workers get traffic
+STARTING, READY, DRAINING = "starting", "ready", "draining"
+
+# Logger for startup and shutdown
+logger = logging.getLogger(__name__)
+
+
+# Function to open count connections at once and hand them back to the pool, which
+# keeps them open for the first requests
+async def open_connections(engine: AsyncEngine, count: int):
+    connections = [engine.connect() for _ in range(count)]
+    results = await asyncio.gather(
+        *(connection.start() for connection in connections), return_exceptions=True
+    )
+    for connection in connections:
+        if connection.sync_connection is not None:
+            await connection.close()
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+
+
+# Function to cancel background tasks and wait for them to stop. A cancel that lands
+# while a connection is being opened can be swallowed, leaving the task to sleep
+# until its next pass, so tasks still running are cancelled again
+async def stop_tasks(tasks: list[asyncio.Task]):
+    pending = set(tasks)
+    while pending:
+        for task in pending:
+            task.cancel()
+        _, pending = await asyncio.wait(pending, timeout=0.1)
+    # Collect the outcomes so failures are not reported as never retrieved
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+# Startup and shutdown state of one worker process
+class Lifecycle:
+    def __init__(self):
+        # Current phase, reported by /health/ready
+        self.phase = STARTING
+
+    # Open pool connections and serve the hot routes once, then report ready. A
+    # failed or slow warm-up is logged and the worker serves anyway, since the
+    # first requests would otherwise pay the same cost
+    async def warm_up(self, app):
+        self.phase = STARTING
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(self.prime(app), settings.warmup_timeout)
+        except Exception as e:
+            logger.warning("Warm-up incomplete: %s", str(e) or type(e).__name__)
+        # A SIGTERM during warm-up already started draining
+        if self.phase == STARTING:
+            self.phase = READY
+            logger.info("Ready after a %.3fs warm-up", time.perf_counter() - started)
+
+    # Connect to the databases and send the warm-up requests through the whole app
+    async def prime(self, app):
+        await open_connections(
+            get_async_engine(),
+            min(settings.db_warmup_connections, settings.db_pool_size),
+        )
+        # Replicas that fail the check are skipped until they recover
+        if replica_router.replicas:
+            await replica_router.check_health()
+
+        # Compiles the SQL, builds the serializers and fills the response cache
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://warmup"
+        ) as client:
+            for path in settings.warmup_paths:
+                response = await client.get(path)
+                if response.status_code >= 400:
+                    logger.warning(
+                        "Warm-up request %s failed: %d", path, response.status_code
+                    )
+
+    # Wrap the server's SIGTERM handler, which stops accepting connections at once, so
+    # the worker first reports draining and keeps serving for shutdown_drain_delay
+    # seconds while load balancers take it out of rotation. A second SIGTERM stops it
+    # right away. Signals can only be handled from the main thread, so this does
+    # nothing when the app runs elsewhere (e.g. under TestClient)
+    def handle_sigterm(self):
+        if threading.current_thread() is not threading.main_thread():
+            return
+        server_handler = signal.getsignal(signal.SIGTERM)
+        if not callable(server_handler):
+            return
+        loop = asyncio.get_running_loop()
+
+        def on_sigterm(signum, frame):
+            if self.phase == DRAINING:
+                server_handler(signum, frame)
+                return
+            self.phase = DRAINING
+            logger.info(
+                "Draining for %.1fs before shutdown", settings.shutdown_drain_delay
+            )
+            loop.call_soon_threadsafe(
+                loop.call_later,
+                settings.shutdown_drain_delay,
+                server_handler,
+                signum,
+                frame,
+            )
+
+        signal.signal(signal.SIGTERM, on_sigterm)
+
+    # Report not ready, then wait for the requests in flight to finish
+    async def drain(self):
+        self.phase = DRAINING
+        deadline = time.monotonic() + settings.shutdown_drain_timeout
+        while request_metrics.in_flight > 0 and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        if request_metrics.in_flight > 0:
+            logger.warning(
+                "Shutting down with %d requests in flight", request_metrics.in_flight
+            )
+
+
+# Lifecycle of this worker process
+lifecycle = Lifecycle()
@@ -0,0 +1,121 @@
+# Import atexit to flush queued log records when a script exits
+import atexit
+
+# Import json to write structured log lines
+import json
+
+# Import logging and its queue-backed handlers
+import logging
+import logging.handlers
+
+# Import queue for the buffer between request handlers and the writer thread
+import queue
+
+# Import random to sample records from hot paths
+import random
+
+# Import re to find tokens that must never reach the logs
+import re
+
+# Import datetime to timestamp structured log lines
+from datetime import datetime, timezone
+
+# Import settings for the log levels, format and sample rate
+from .config import settings
+
+# JWTs (three base64url segments starting with a JSON header) and bearer credentials
+TOKEN_PATTERN = re.compile(
+    r"eyJ[\w-]*\.[\w-]+\.[\w-]+|(?<=Bearer )[\w.~+/=-]+", re.IGNORECASE
+)
+
+# Attributes every LogRecord has; anything else was passed through extra=
+RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "sampled"}
+
+# Listener that writes queued records on a background thread, once configured
+listener: logging.handlers.QueueListener | None = None
+
+
+# Function to replace anything that looks like a token with a placeholder
+def redact(text: str) -> str:
+    return TOKEN_PATTERN.sub("[REDACTED]", text)
+
+
+# Formatter that writes one JSON object per record
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        # Include the fields passed through extra=
+        for key, value in vars(record).items():
+            if key not in RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+# Filter that keeps only a fraction of the records marked extra={"sampled": True}
+class SampleFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        if getattr(record, "sampled", False):
+            return random.random() < settings.log_sample_rate
+        return True
+
+
+# Queue handler that redacts tokens before a record leaves the calling thread
+class RedactingQueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Render the message and traceback here, since args may not be thread safe
+        record = logging.makeLogRecord(vars(record))
+        record.msg = redact(record.getMessage())
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        if record.exc_text:
+            record.exc_text = redact(record.exc_text)
+        return record
+
+
+# Function to route all logging through a queue drained by a background thread
+def setup_logging():
+    global listener
+    if listener is not None:
+        return
+
+    # Write to stderr from the listener thread only, in the configured format
+    output = logging.StreamHandler()
+    if settings.log_format == "json":
+        output.setFormatter(JsonFormatter())
+    else:
+        output.setFormatter(
+            logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s")
+        )
+
+    # Request handlers only enqueue records, so a slow stream never blocks them
+    log_queue = queue.SimpleQueue()
+    handler = RedactingQueueHandler(log_queue)
+    handler.addFilter(SampleFilter())
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(settings.log_level.upper())
+
+    # Apply per-component levels, e.g. {"app.config": "DEBUG"}
+    for name, level in settings.log_levels.items():
+        logging.getLogger(name).setLevel(level.upper())
+
+    listener = logging.handlers.QueueListener(log_queue, output)
+    listener.start()
+    atexit.register(shutdown_logging)
+
+
+# Function to write every queued record and stop the background thread
+def shutdown_logging():
+    global listener
+    if listener is not None:
+        listener.stop()
+        listener = None
@@ -1,5 +1,5 @@
 # Import FastAPI framework for building the web application
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 
 # Import asynccontextmanager to create asynchronous context managers
 from contextlib import asynccontextmanager
@@ -13,46 +13,122 @@ from .routers import posts, users, auth, votes
 # Import database creation function
 from .database import create_db_and_tables
 
-# Import database engine configuration
-from .config import engine
-
 # Import Session class from SQLModel for database sessions
 from sqlmodel import Session
 
-app = FastAPI()
+# Import asyncio to run background maintenance tasks
+import asyncio
+
+# Import settings to decide which background tasks to run, and the engine cleanup
+from .config import dispose_engines, settings
+
+# Import the vote counter fold loop for sharded counters
+from .counters import run_vote_fold_loop
+
+# Import the trending feed refresh loop
+from .trending import run_trending_refresh_loop
+
+# Import the write-behind vote buffer
+from .vote_buffer import vote_buffer
+
+# Import the password hashing pool
+from .utils import hashing_pool
+
+# Import the connection pool metrics
+from .pool_metrics import pool_metrics
+
+# Import the request metrics middleware and the Prometheus renderer
+from .metrics import MetricsMiddleware, render_metrics
+
+# Import the per-request SQL profiler middleware
+from .profiler import QueryProfilerMiddleware
+
+# Import the admission control middleware that sheds load under overload
+from .admission import AdmissionControlMiddleware
+
+# Import the read replica router and the read-your-writes cookie middleware
+from .replicas import ReadYourWritesMiddleware, replica_router
+
+# Import PlainTextResponse to serve metrics in the Prometheus text format
+from fastapi.responses import PlainTextResponse
+
+# Import the queue-backed logging setup
+from .log import setup_logging, shutdown_logging
+
+# Import the worker lifecycle for warm-up, readiness and drain
+from .lifecycle import READY, lifecycle, stop_tasks
+
+# Import the cursor header so browsers may read it across origins
+from .pagination import NEXT_CURSOR_HEADER
+
+
+# Warm the worker up, run background maintenance tasks for as long as the
+# application is up, then drain and close every connection
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Send every log record through the background log writer
+    setup_logging()
+    # Report draining on SIGTERM while still serving, before the server stops
+    lifecycle.handle_sigterm()
+    # Open pool connections and prime the hot routes before reporting ready
+    await lifecycle.warm_up(app)
+    # Start folding sharded vote counters into post.votes
+    tasks = []
+    if settings.vote_counter_mode == "sharded":
+        tasks.append(asyncio.create_task(run_vote_fold_loop()))
+    # Start refreshing the trending feed
+    tasks.append(asyncio.create_task(run_trending_refresh_loop()))
+    # Start checking read replicas so failed ones come back into rotation
+    if replica_router.replicas:
+        tasks.append(asyncio.create_task(replica_router.run_health_checks()))
+    # Start flushing buffered votes in batches
+    if settings.vote_buffer_enabled:
+        vote_buffer.start()
+    # Yield control back to the application
+    yield
+    # Stop reporting ready and let the requests in flight finish
+    await lifecycle.drain()
+    # Write every buffered vote before the counters take their final fold
+    if settings.vote_buffer_enabled:
+        await vote_buffer.close()
+    # Stop the background tasks
+    await stop_tasks(tasks)
+    # Close the read replica and primary connections
+    await replica_router.dispose()
+    await dispose_engines()
+    # Stop the password hashing processes
+    hashing_pool.shutdown()
+    # Write out the queued log records
+    shutdown_logging()
+
+
+app = FastAPI(lifespan=lifespan)
 
 origins = ["*"]
 
+# Count the SQL statements of each request and report them in response headers
+app.add_middleware(QueryProfilerMiddleware)
+
+# Send a client's reads to the primary for a while after it writes
+app.add_middleware(ReadYourWritesMiddleware)
+
+# Reject excess requests early, lowest priority first, when the database falls behind
+app.add_middleware(AdmissionControlMiddleware)
+
+# Answer CORS preflights and add CORS headers to every response, including the 503s
+# sent by admission control, which runs inside it
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Let browser clients read the pagination cursor and revalidate with the ETag
+    expose_headers=[NEXT_CURSOR_HEADER, "ETag"],
 )
 
-
-"""
-# Define an asynchronous context manager for the application's lifespan
-@asynccontextmanager
-async def lifespan(app: FastAPI):
-    # Initialize the database and create tables when the application starts
-    create_db_and_tables()
-    # Log a message indicating the application has started
-    print("Application started. Database and tables created.")
-    # Yield control back to the context manager
-    yield
-    # Log a message indicating the application is shutting down
-    print("Application shutting down. Closing database connection.")
-    # Dispose of the database engine to close connections
-    engine.dispose()
-    # Log confirmation that the database connection is closed
-    print("Database connection closed.")
-
-
-# Create the FastAPI application instance with the custom lifespan
-app: FastAPI = FastAPI(lifespan=lifespan)
-"""
+# Record request counts, latency and in-flight requests for every route
+app.add_middleware(MetricsMiddleware)
 
 
 # Define a health check endpoint to verify the application status
@@ -62,6 +138,32 @@ def health_check():
     return {"status": "ok"}
 
 
+# Report whether the worker has warmed up and is not shutting down, for load balancers
+@app.get("/health/ready")
+def readiness_check(response: Response):
+    if lifecycle.phase != READY:
+        response.status_code = 503
+    return {"status": lifecycle.phase}
+
+
+# Report connection pool usage, to size the pool against the number of workers
+@app.get("/health/pool")
+def pool_health():
+    return {name: metrics.snapshot() for name, metrics in pool_metrics.items()}
+
+
+# Serve request and pool metrics for Prometheus to scrape
+@app.get(
+    "/metrics",
+    response_class=PlainTextResponse,
+    include_in_schema=False,
+)
+def metrics():
+    return PlainTextResponse(
+        render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
 # Include the users router to handle user-related endpoints
 app.include_router(users.router)
 # Include the posts router to handle post-related endpoints
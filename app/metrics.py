@@ -0,0 +1,163 @@
+# Import bisect to find a latency's histogram bucket
+import bisect
+
+# Import time to measure request latency
+import time
+
+# Import the pool metrics so they are exported alongside request metrics
+from .pool_metrics import pool_metrics
+
+# Import the admission controller to export its limit and rejections
+from .admission import PRIORITY_NAMES, admission_controller
+
+# Import the settings for the admission limit before the first request
+from .config import settings
+
+# Import the vote buffer to export the votes it dropped
+from .vote_buffer import vote_buffer
+
+# Upper bounds of the latency buckets, in seconds (Prometheus client defaults)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0)
+
+# Route label for requests that matched no route, to keep label cardinality bounded
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+# Latency histogram for one (method, route) pair
+class Histogram:
+    def __init__(self):
+        # Observations per bucket, the last one being +Inf
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        # Sum of every observed latency, in seconds
+        self.sum = 0.0
+
+    # Record one latency in seconds
+    def observe(self, seconds: float):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.sum += seconds
+
+
+# Request counters, latency histograms and in-flight gauge for one worker process
+class RequestMetrics:
+    def __init__(self):
+        # Number of requests by (method, route template, status code)
+        self.requests: dict[tuple[str, str, int], int] = {}
+        # Latency histogram by (method, route template)
+        self.latency: dict[tuple[str, str], Histogram] = {}
+        # Number of requests currently being served
+        self.in_flight = 0
+
+    # Record a finished request
+    def observe(self, method: str, route: str, status_code: int, seconds: float):
+        key = (method, route, status_code)
+        self.requests[key] = self.requests.get(key, 0) + 1
+        histogram = self.latency.get((method, route))
+        if histogram is None:
+            histogram = self.latency[(method, route)] = Histogram()
+        histogram.observe(seconds)
+
+
+# Shared request metrics for this worker process
+request_metrics = RequestMetrics()
+
+
+# Pure ASGI middleware that records metrics for every HTTP request
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        # Remember the status code as the response starts
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        request_metrics.in_flight += 1
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            request_metrics.in_flight -= 1
+            # Label by the matched route's template, e.g. /posts/{post_id}
+            route = scope.get("route")
+            request_metrics.observe(
+                scope["method"],
+                route.path if route is not None else UNMATCHED_ROUTE,
+                status_code,
+                time.perf_counter() - started,
+            )
+
+
+# Function to escape a Prometheus label value
+def label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# Function to render every metric in the Prometheus text exposition format
+def render_metrics() -> str:
+    lines = [
+        "# HELP http_requests_total Requests served, by route template and status.",
+        "# TYPE http_requests_total counter",
+    ]
+    for (method, route, status_code), count in sorted(request_metrics.requests.items()):
+        lines.append(
+            f'http_requests_total{{method="{method}",route="{label(route)}",'
+            f'status="{status_code}"}} {count}'
+        )
+
+    lines += [
+        "# HELP http_request_duration_seconds Request latency, by route template.",
+        "# TYPE http_request_duration_seconds histogram",
+    ]
+    for (method, route), histogram in sorted(request_metrics.latency.items()):
+        labels = f'method="{method}",route="{label(route)}"'
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), histogram.counts):
+            cumulative += count
+            lines.append(
+                f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} '
+                f"{cumulative}"
+            )
+        lines.append(f"http_request_duration_seconds_sum{{{labels}}} {histogram.sum}")
+        lines.append(f"http_request_duration_seconds_count{{{labels}}} {cumulative}")
+
+    lines += [
+        "# HELP http_requests_in_flight Requests currently being served.",
+        "# TYPE http_requests_in_flight gauge",
+        f"http_requests_in_flight {request_metrics.in_flight}",
+    ]
+
+    lines += [
+        "# HELP admission_limit Adaptive limit on concurrent normal-priority requests.",
+        "# TYPE admission_limit gauge",
+        "admission_limit "
+        f"{admission_controller.limit or settings.admission_max_in_flight}",
+        "# HELP admission_rejected_total Requests rejected with 503, by priority.",
+        "# TYPE admission_rejected_total counter",
+    ]
+    for priority, name in PRIORITY_NAMES.items():
+        lines.append(
+            f'admission_rejected_total{{priority="{name}"}} '
+            f"{admission_controller.rejected[priority]}"
+        )
+
+    lines += [
+        "# HELP vote_buffer_dropped_total Accepted votes dropped after failed flushes.",
+        "# TYPE vote_buffer_dropped_total counter",
+        f"vote_buffer_dropped_total {vote_buffer.dropped}",
+    ]
+
+    # Export the connection pool gauges and counters, one metric family at a time
+    snapshots = {name: metrics.snapshot() for name, metrics in pool_metrics.items()}
+    for key in next(iter(snapshots.values()), {}):
+        for name, snapshot in sorted(snapshots.items()):
+            lines.append(f'db_pool_{key}{{engine="{name}"}} {snapshot[key]}')
+
+    return "\n".join(lines) + "\n"
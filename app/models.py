@@ -10,6 +10,18 @@ from pydantic import EmailStr
 # Import SQLModel, Field, and Relationship from sqlmodel for database modeling
 from sqlmodel import Field, SQLModel, Relationship
 
+# Import Index, Column and Computed from SQLAlchemy for indexes and generated columns
+from sqlalchemy import Column, Computed, Index, text
+
+# Import TSVECTOR for the full-text search column
+from sqlalchemy.dialects.postgresql import TSVECTOR
+
+# Import deferred so the search vector is never loaded with a post
+from sqlalchemy.orm import deferred
+
+# Import the expression that builds a post's search vector
+from app.search import search_vector_expression
+
 
 # Define a Users database model with SQLModel
 class Users(SQLModel, table=True):
@@ -25,38 +37,124 @@ class Users(SQLModel, table=True):
     )
     # Relationship to posts made by this user
     posts: List["Post"] = Relationship(back_populates="owner")
-    phone_num: str = Field(nullable=True)
+    # Optional phone number; signups do not ask for one
+    phone_num: Optional[str] = Field(default=None, nullable=True)
+
+
+# Generated tsvector column maintained by Postgres from a post's title and content
+post_search_vector = Column(
+    "search_vector",
+    TSVECTOR,
+    Computed(search_vector_expression(), persisted=True),
+)
 
 
 # Define a Post database model with SQLModel
 class Post(SQLModel, table=True):
+    # Composite index serving newest-first keyset pagination and GIN index for search
+    __table_args__ = (
+        Index("ix_post_created_at_id", "created_at", "id"),
+        Index("ix_post_search_vector", "search_vector", postgresql_using="gin"),
+    )
+    # Load the search vector only when a query asks for it explicitly
+    __mapper_args__ = {"properties": {"search_vector": deferred(post_search_vector)}}
+
     # Unique identifier for the post, automatically set as primary key
     id: Optional[int] = Field(default=None, primary_key=True, nullable=False)
     # Title of the post, required and indexed for search
     title: str = Field(index=True, nullable=False)
-    # Content of the post, required with maximum length
-    content: str = Field(index=True, nullable=False, max_length=254)
+    # Content of the post, required with maximum length (searched via search_vector)
+    content: str = Field(nullable=False, max_length=254)
     # Boolean indicating if the post is published, defaults to True
     published: bool = Field(default=True)
     # Timestamp when the post was created, defaults to current time
     created_at: datetime = Field(
         default_factory=lambda: datetime.now().astimezone(), nullable=False
     )
-    # Foreign key referencing the Users table, nullable by default
+    # Denormalized number of votes, kept in step with the Vote table
+    votes: int = Field(
+        default=0, nullable=False, sa_column_kwargs={"server_default": "0"}
+    )
+    # Foreign key referencing the Users table, nullable by default, indexed for
+    # per-owner lookups and the cascade when a user is deleted
     owner_id: Optional[int] = Field(
-        default=None, foreign_key="users.id", ondelete="CASCADE", nullable=True
+        default=None,
+        foreign_key="users.id",
+        ondelete="CASCADE",
+        nullable=True,
+        index=True,
     )
     # Relationship to the owner of this post
     owner: Optional[Users] = Relationship(back_populates="posts")
+    # Full-text search vector generated from title and content, never serialized
+    search_vector: Optional[str] = Field(
+        default=None, sa_column=post_search_vector, exclude=True
+    )
 
 
 # Define a Vote database model with SQLModel
 class Vote(SQLModel, table=True):
+    # Index on the vote time, for rebuilding trend scores from recent votes
+    __table_args__ = (Index("ix_vote_created_at", "created_at"),)
+
     # Foreign key referencing the Users table, part of primary key
     user_id: Optional[int] = Field(
         default=None, foreign_key="users.id", primary_key=True, nullable=False
     )
+    # Foreign key referencing the Post table, part of primary key; indexed on its
+    # own since the (user_id, post_id) key cannot serve lookups by post
+    post_id: Optional[int] = Field(
+        default=None,
+        foreign_key="post.id",
+        primary_key=True,
+        nullable=False,
+        index=True,
+    )
+    # Timestamp when the vote was cast, set by the database
+    created_at: Optional[datetime] = Field(
+        default=None, nullable=False, sa_column_kwargs={"server_default": text("now()")}
+    )
+
+
+# Define a VoteCountShard database model holding pending vote count deltas
+class VoteCountShard(SQLModel, table=True):
     # Foreign key referencing the Post table, part of primary key
     post_id: Optional[int] = Field(
-        default=None, foreign_key="post.id", primary_key=True, nullable=False
+        default=None,
+        foreign_key="post.id",
+        ondelete="CASCADE",
+        primary_key=True,
+        nullable=False,
+    )
+    # Shard number spreading concurrent voters over several rows, part of primary key
+    shard: int = Field(primary_key=True, nullable=False)
+    # Net change in votes not yet folded into post.votes
+    delta: int = Field(default=0, nullable=False)
+
+
+# Define a PostTrend database model holding the time-decayed vote score of a post
+class PostTrend(SQLModel, table=True):
+    # Foreign key referencing the Post table, used as primary key
+    post_id: Optional[int] = Field(
+        default=None,
+        foreign_key="post.id",
+        ondelete="CASCADE",
+        primary_key=True,
+        nullable=False,
+    )
+    # Net votes, each halving in weight every trending_half_life seconds, as of updated_at
+    score: float = Field(default=0, nullable=False)
+    # Timestamp the score was last decayed to
+    updated_at: datetime = Field(nullable=False)
+
+
+# Define a TrendingPost database model holding the top posts by trend score, by rank
+class TrendingPost(SQLModel, table=True):
+    # Position in the trending feed, starting at 1, used as primary key
+    rank: int = Field(
+        primary_key=True, nullable=False, sa_column_kwargs={"autoincrement": False}
     )
+    # Foreign key referencing the Post table
+    post_id: int = Field(foreign_key="post.id", ondelete="CASCADE", nullable=False)
+    # Decayed score of the post when the feed was refreshed
+    score: float = Field(nullable=False)
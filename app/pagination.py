@@ -0,0 +1,54 @@
+# Import base64 to make cursor tokens opaque and URL-safe
+import base64
+
+# Import json to serialize the cursor position
+import json
+
+# Import datetime to round-trip timestamp cursor positions
+from datetime import datetime
+
+# Import HTTPException and status for rejecting malformed cursors
+from fastapi import HTTPException, status
+
+# Name of the response header that carries the next page cursor
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+# Function to encode a keyset position (e.g. (created_at, id) or (id,)) into an opaque token
+def encode_cursor(*values) -> str:
+    # Convert datetimes to ISO strings so the position survives JSON encoding
+    position = [
+        {"dt": value.isoformat()} if isinstance(value, datetime) else value
+        for value in values
+    ]
+    # Serialize compactly and strip base64 padding to keep the token short
+    raw = json.dumps(position, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+# Function to decode an opaque token back into a keyset position of the given types
+def decode_cursor(cursor: str, *types: type) -> tuple:
+    # Create an HTTP exception for malformed or tampered cursors
+    invalid_cursor = HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid pagination cursor"
+    )
+
+    try:
+        # Restore the base64 padding and decode the JSON position
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        position = json.loads(raw)
+        # Convert encoded datetimes back into datetime objects
+        values = tuple(
+            datetime.fromisoformat(value["dt"]) if isinstance(value, dict) else value
+            for value in position
+        )
+    except (ValueError, TypeError, KeyError):
+        raise invalid_cursor
+
+    # Validate that the position matches the columns the route pages on
+    if len(values) != len(types) or not all(
+        isinstance(value, type_) and not isinstance(value, bool)
+        for value, type_ in zip(values, types)
+    ):
+        raise invalid_cursor
+    return values
@@ -0,0 +1,123 @@
+# Import threading to update counters safely from the sync engine's threads
+import threading
+
+# Import time to measure how long a checkout waits for a connection
+import time
+
+# Import weakref so the metrics never keep a disposed pool alive
+import weakref
+
+# Import SQLAlchemy's event API and the pool timeout error
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+
+# Counters and gauges for one engine's connection pool
+class PoolMetrics:
+    def __init__(self, name: str):
+        # Name of the engine, e.g. "async" or "sync"
+        self.name = name
+        # Current pool, replaced when the engine is disposed and the pool recreated
+        self.pool_ref = None
+        # Lock shared by every counter update
+        self.lock = threading.Lock()
+        # Number of connections handed out to sessions
+        self.checkouts = 0
+        # Number of connections returned to the pool
+        self.checkins = 0
+        # Number of new database connections opened
+        self.connects = 0
+        # Number of connections discarded as broken or stale
+        self.invalidations = 0
+        # Number of checkouts that gave up after pool_timeout
+        self.timeouts = 0
+        # Total and worst time spent waiting in connect(), in seconds
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        # Highest number of connections checked out at once
+        self.checked_out_max = 0
+
+    # Record a finished checkout attempt that took waited seconds
+    def record_wait(self, waited: float, timed_out: bool):
+        with self.lock:
+            self.wait_seconds_total += waited
+            self.wait_seconds_max = max(self.wait_seconds_max, waited)
+            if timed_out:
+                self.timeouts += 1
+
+    # Return the current gauges and counters as a dict
+    def snapshot(self) -> dict:
+        pool = self.pool_ref() if self.pool_ref else None
+        attempts = self.checkouts + self.timeouts
+        return {
+            "pool_size": pool.size() if pool else 0,
+            "max_overflow": pool._max_overflow if pool else 0,
+            "checked_out": pool.checkedout() if pool else 0,
+            "checked_in": pool.checkedin() if pool else 0,
+            "overflow": max(pool.overflow(), 0) if pool else 0,
+            "checked_out_max": self.checked_out_max,
+            "checkouts": self.checkouts,
+            "checkins": self.checkins,
+            "connects": self.connects,
+            "invalidations": self.invalidations,
+            "timeouts": self.timeouts,
+            "wait_seconds_total": self.wait_seconds_total,
+            "wait_seconds_avg": self.wait_seconds_total / attempts if attempts else 0.0,
+            "wait_seconds_max": self.wait_seconds_max,
+        }
+
+
+# Metrics for every instrumented pool, by engine name
+pool_metrics: dict[str, PoolMetrics] = {}
+
+
+# Function to build a pool class that times checkouts for the metrics named name
+def instrumented_pool(name: str, pool_class):
+    metrics = pool_metrics.setdefault(name, PoolMetrics(name))
+
+    class InstrumentedPool(pool_class):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            metrics.pool_ref = weakref.ref(self)
+
+        # Time every checkout, since no pool event fires before the wait starts
+        def connect(self):
+            started = time.perf_counter()
+            try:
+                connection = super().connect()
+            except PoolTimeoutError:
+                metrics.record_wait(time.perf_counter() - started, timed_out=True)
+                raise
+            metrics.record_wait(time.perf_counter() - started, timed_out=False)
+            return connection
+
+    InstrumentedPool.__name__ = f"Instrumented{pool_class.__name__}"
+    return InstrumentedPool
+
+
+# Function to count pool activity on engine from SQLAlchemy's pool events
+def instrument_engine(name: str, engine):
+    metrics = pool_metrics.setdefault(name, PoolMetrics(name))
+
+    @event.listens_for(engine, "checkout")
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        with metrics.lock:
+            metrics.checkouts += 1
+            metrics.checked_out_max = max(
+                metrics.checked_out_max, engine.pool.checkedout()
+            )
+
+    @event.listens_for(engine, "checkin")
+    def on_checkin(dbapi_connection, connection_record):
+        with metrics.lock:
+            metrics.checkins += 1
+
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        with metrics.lock:
+            metrics.connects += 1
+
+    @event.listens_for(engine, "invalidate")
+    def on_invalidate(dbapi_connection, connection_record, exception):
+        with metrics.lock:
+            metrics.invalidations += 1
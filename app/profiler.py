@@ -0,0 +1,131 @@
+# Import logging to report routes that go over their query budget
+import logging
+
+# Import time to measure statement latency
+import time
+
+# Import ContextVar to scope query statistics to the current request
+from contextvars import ContextVar
+
+# Import Callable for budgets computed from the settings
+from typing import Callable
+
+# Import Depends to declare query budgets as route dependencies
+from fastapi import Depends
+
+# Import SQLAlchemy's event API and the Engine class to hook cursor execution
+from sqlalchemy import Engine, event
+
+# Import the settings from the config module
+from .config import settings
+
+# Header reporting how many SQL statements the request ran
+QUERY_COUNT_HEADER = "X-DB-Query-Count"
+
+# Header reporting the query budget declared by the route, if any
+QUERY_BUDGET_HEADER = "X-DB-Query-Budget"
+
+# Logger for routes that go over their query budget
+logger = logging.getLogger(__name__)
+
+
+# SQL statement count and database time for one request
+class QueryStats:
+    def __init__(self):
+        # Number of statements sent to the database
+        self.count = 0
+        # Total time spent executing them, in seconds
+        self.seconds = 0.0
+        # Most statements the route should run, declared with query_budget
+        self.budget: int | None = None
+
+
+# Statistics of the request being served, shared by every task it spawns
+current_query_stats: ContextVar[QueryStats | None] = ContextVar(
+    "current_query_stats", default=None
+)
+
+
+# Function to start timing a statement on the connection it runs on
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # Statements on one connection never overlap, so one timestamp is enough
+    conn.info["query_started"] = time.perf_counter()
+
+
+# Function to add a finished statement to the current request's statistics
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = current_query_stats.get()
+    if stats is not None:
+        stats.count += 1
+        stats.seconds += time.perf_counter() - conn.info["query_started"]
+
+
+# Profile statements on every engine, including replicas and engines built after
+# import; async engines run them on their sync core, which is an Engine too
+event.listen(Engine, "before_cursor_execute", before_cursor_execute)
+event.listen(Engine, "after_cursor_execute", after_cursor_execute)
+
+
+# Function to declare the most SQL statements a route should run, either as a number
+# or as a function computing it from the settings when the request is served
+def query_budget(limit: int | Callable[[], int]):
+    # Record the budget on the request's statistics
+    async def declare_budget():
+        stats = current_query_stats.get()
+        if stats is not None:
+            stats.budget = limit() if callable(limit) else limit
+
+    return Depends(declare_budget)
+
+
+# Pure ASGI middleware that profiles the SQL of each request and reports it in headers
+class QueryProfilerMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.query_profiler_enabled:
+            return await self.app(scope, receive, send)
+
+        stats = QueryStats()
+        token = current_query_stats.set(stats)
+
+        # Add the statistics to the response headers as the response starts
+        async def send_with_stats(message):
+            if message["type"] == "http.response.start":
+                timing = (
+                    f'db;dur={stats.seconds * 1000:.2f};desc="{stats.count} queries"'
+                )
+                headers = list(message.get("headers", []))
+                headers.append((QUERY_COUNT_HEADER.encode(), str(stats.count).encode()))
+                headers.append((b"server-timing", timing.encode()))
+                if stats.budget is not None:
+                    headers.append(
+                        (QUERY_BUDGET_HEADER.encode(), str(stats.budget).encode())
+                    )
+                    if stats.count > stats.budget:
+                        logger.warning(
+                            "%s %s ran %d queries, over its budget of %d",
+                            scope["method"],
+                            scope["path"],
+                            stats.count,
+                            stats.budget,
+                        )
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_stats)
+        finally:
+            current_query_stats.reset(token)
+
+
+# Test helper that fails when a response ran more queries than its route's budget
+def assert_within_query_budget(response):
+    count = int(response.headers[QUERY_COUNT_HEADER])
+    budget = response.headers.get(QUERY_BUDGET_HEADER)
+    assert budget is not None, f"{response.request.url} declares no query budget"
+    assert count <= int(budget), (
+        f"{response.request.method} {response.request.url} ran {count} queries, "
+        f"over its budget of {budget}"
+    )
@@ -0,0 +1,245 @@
+# Import asyncio to run the background replica health checks
+import asyncio
+
+# Import itertools to rotate through replicas round-robin
+import itertools
+
+# Import cached_property to build the replicas on first use
+from functools import cached_property
+
+# Import logging to report replicas going down and coming back
+import logging
+
+# Import time to stamp writes and bound how long a failed replica is skipped
+import time
+
+# Import Request to read the read-your-writes cookie
+from fastapi import Request
+
+# Import SQLAlchemy's event API, text and URL parsing for the replica engines
+from sqlalchemy import event, text
+from sqlalchemy.engine import make_url
+
+# Import DBAPIError to recognise reads that failed because the replica went away
+from sqlalchemy.exc import DBAPIError
+
+# Import create_async_engine to build one engine per replica
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+
+# Import the async pool class used by the replica engines
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+# Import AsyncSession from SQLModel for non-blocking database operations
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+# Import the settings, the primary engine and the shared pool options
+from .config import get_async_engine, get_pool_options, settings
+
+# Import the pool instrumentation so replica pools show up in /metrics
+from .pool_metrics import instrument_engine, instrumented_pool
+
+# Cookie holding the time of the client's last write, for read-your-writes
+LAST_WRITE_COOKIE = "last_write"
+
+# Methods that never write, so they do not start a read-your-writes window
+SAFE_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+
+# Logger for replica health changes
+logger = logging.getLogger(__name__)
+
+
+# One read replica: its engine and whether reads may be sent to it
+class Replica:
+    def __init__(self, name: str, engine: AsyncEngine):
+        self.name = name
+        self.engine = engine
+        # Monotonic time until which the replica is skipped after a failure
+        self.down_until = 0.0
+
+    # Whether reads may be routed to the replica
+    @property
+    def healthy(self) -> bool:
+        return self.down_until <= time.monotonic()
+
+    # Stop routing reads to the replica for the configured cooldown
+    def mark_down(self, reason):
+        if self.healthy:
+            logger.warning("Replica %s is unavailable: %s", self.name, reason)
+        self.down_until = time.monotonic() + settings.replica_retry_after
+
+    # Route reads to the replica again
+    def mark_up(self):
+        if not self.healthy:
+            logger.info("Replica %s is available again", self.name)
+        self.down_until = 0.0
+
+
+# Function to build an instrumented async engine for the replica at url
+def create_replica(index: int, url: str) -> Replica:
+    name = f"replica{index}"
+    # Accept plain postgresql:// URLs and talk to them with psycopg 3, like the primary
+    url = make_url(url).set(drivername="postgresql+psycopg")
+    engine = create_async_engine(
+        url,
+        poolclass=instrumented_pool(name, AsyncAdaptedQueuePool),
+        **get_pool_options(),
+    )
+    instrument_engine(name, engine.sync_engine)
+
+    # Count a failed connection attempt as a disconnect, like a dropped connection,
+    # so ReadSession retries the read on the primary
+    @event.listens_for(engine.sync_engine, "handle_error")
+    def on_error(context):
+        if context.connection is None:
+            context.is_disconnect = True
+
+    return Replica(name, engine)
+
+
+# Function to run a trivial query on engine
+async def ping(engine: AsyncEngine):
+    async with engine.connect() as conn:
+        await conn.execute(text("SELECT 1"))
+
+
+# Chooses the engine each read-only request runs on
+class ReplicaRouter:
+    # Replicas built from the settings on first use, so importing the app opens nothing
+    @cached_property
+    def replicas(self) -> list[Replica]:
+        return [
+            create_replica(i, url)
+            for i, url in enumerate(settings.database_replica_urls)
+        ]
+
+    # Endless round-robin over the replicas
+    @cached_property
+    def rotation(self):
+        return itertools.cycle(self.replicas)
+
+    # Return a healthy replica's engine, or the primary when none is healthy
+    def choose(self) -> AsyncEngine:
+        healthy = [replica for replica in self.replicas if replica.healthy]
+        if not healthy:
+            return get_async_engine()
+        if settings.replica_routing == "least_connections":
+            # Fewest connections checked out by this worker's pools
+            return min(healthy, key=lambda r: r.engine.pool.checkedout()).engine
+        # Round-robin, skipping replicas that are down
+        for replica in self.rotation:
+            if replica.healthy:
+                return replica.engine
+
+    # Return the replica whose engine is engine, or None for the primary
+    def replica_for(self, engine: AsyncEngine) -> Replica | None:
+        for replica in self.replicas:
+            if replica.engine is engine:
+                return replica
+        return None
+
+    # Check every replica with a round trip, so failed ones come back into rotation
+    async def check_health(self):
+        for replica in self.replicas:
+            try:
+                await asyncio.wait_for(
+                    ping(replica.engine), settings.replica_health_timeout
+                )
+            except Exception as e:
+                replica.mark_down(str(e) or type(e).__name__)
+            else:
+                replica.mark_up()
+
+    # Check replica health every replica_health_interval seconds until cancelled
+    async def run_health_checks(self):
+        while True:
+            await self.check_health()
+            await asyncio.sleep(settings.replica_health_interval)
+
+    # Close every replica connection
+    async def dispose(self):
+        for replica in self.replicas:
+            await replica.engine.dispose()
+
+
+# Router over the configured replicas; with none configured every read uses the primary
+replica_router = ReplicaRouter()
+
+
+# Session for read-only endpoints. When its replica drops or refuses the connection,
+# the replica is taken out of rotation and the read is retried once on the primary,
+# so a failover does not cost the request a 500
+class ReadSession(AsyncSession):
+    async def exec(self, statement, *args, **kwargs):
+        try:
+            return await super().exec(statement, *args, **kwargs)
+        except DBAPIError as e:
+            replica = replica_router.replica_for(self.bind)
+            if replica is None or not e.connection_invalidated:
+                raise
+            replica.mark_down(e.orig)
+        # Drop the failed connection and run the read again on the primary
+        await self.close()
+        self.bind = get_async_engine()
+        self.sync_session.bind = self.bind.sync_engine
+        return await super().exec(statement, *args, **kwargs)
+
+
+# Function to tell whether the client wrote within the read-your-writes window
+def wrote_recently(request: Request) -> bool:
+    if settings.read_your_writes_seconds <= 0:
+        return False
+    try:
+        last_write = float(request.cookies.get(LAST_WRITE_COOKIE, 0))
+    except ValueError:
+        return False
+    return time.time() - last_write < settings.read_your_writes_seconds
+
+
+# Dependency to get a session for a read-only endpoint, on a replica when possible
+async def get_read_session(request: Request):
+    if wrote_recently(request):
+        # Replicas may not have caught up with the client's own write yet
+        engine = get_async_engine()
+    else:
+        engine = replica_router.choose()
+    async with ReadSession(engine, expire_on_commit=False) as session:
+        yield session
+
+
+# Function to return how long a response read through session may be cached. A
+# replica may lag the primary, and a body read from it can be older than a write this
+# worker already invalidated, so it lives no longer than the read-your-writes window
+# that bounds the lag; with no window it is not cached at all
+def response_cache_ttl(session: AsyncSession) -> float | None:
+    if session.bind is get_async_engine():
+        return None
+    return min(settings.response_cache_ttl, settings.read_your_writes_seconds)
+
+
+# Pure ASGI middleware that stamps successful writes with the read-your-writes cookie
+class ReadYourWritesMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or scope["method"] in SAFE_METHODS
+            or settings.read_your_writes_seconds <= 0
+        ):
+            return await self.app(scope, receive, send)
+
+        # Set the cookie as a successful response starts
+        async def send_with_cookie(message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                cookie = (
+                    f"{LAST_WRITE_COOKIE}={time.time():.3f}; "
+                    f"Max-Age={int(settings.read_your_writes_seconds) + 1}; "
+                    "Path=/; HttpOnly; SameSite=Lax"
+                )
+                headers = list(message.get("headers", []))
+                headers.append((b"set-cookie", cookie.encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        await self.app(scope, receive, send_with_cookie)
@@ -1,8 +1,8 @@
 # Import necessary modules from FastAPI for API routing, dependencies, status codes, HTTP exceptions, and responses
 from fastapi import APIRouter, Depends, status, HTTPException, Response
 
-# Import SQLModel functionality for database queries
-from sqlmodel import select, Session
+# Import SQLModel functionality for database queries and the rehash update
+from sqlmodel import select, update
 
 # Import OAuth2 password request form for handling login data
 from fastapi.security import OAuth2PasswordRequestForm
@@ -10,34 +10,49 @@ from fastapi.security import OAuth2PasswordRequestForm
 # Import the Users model for database interactions
 from ..models import Users
 
-# Import utility functions for password verification and token creation
-from ..utils import verify_password
+# Import the hashing pool and rehash check for password verification
+from ..utils import hashing_pool, password_needs_rehash
 
-# Import configuration for database session management
-from ..config import get_session, create_access_token
+# Import configuration for token creation and user cache invalidation
+from ..config import create_access_token, invalidate_user
 
+# Import SessionDep for database session dependency
+from ..database import SessionDep
 
 # Import the Token schema for response modeling
 from ..schema import Token
 
+# Import query_budget to declare how many SQL statements the endpoint may run
+from ..profiler import query_budget
+
 # Create an API router with a tag for authentication-related endpoints
 router = APIRouter(tags=["Authentication"])
 
 
 # Define a POST endpoint for user login with a 200 status code and Token response model
-@router.post("/login", status_code=status.HTTP_200_OK, response_model=Token)
-def login(
+# Query budget: user lookup, plus an update when the password hash is rehashed
+@router.post(
+    "/login",
+    status_code=status.HTTP_200_OK,
+    response_model=Token,
+    dependencies=[query_budget(2)],
+)
+async def login(
+    # Get database session using dependency injection
+    session: SessionDep,
     # Use OAuth2PasswordRequestForm to handle username and password from request form data
     user: OAuth2PasswordRequestForm = Depends(),
-    # Get database session using dependency injection
-    session: Session = Depends(get_session),
     # Access response object to set cookies
     response: Response = Response(),
 ):
-    # Query the database for a user with the provided email
-    statement = select(Users).where(Users.email == user.username)
+    # Query the database for the ID and password hash of the user with this email
+    statement = select(Users.id, Users.password).where(Users.email == user.username)
     # Execute the query and get the first result
-    user_db = session.exec(statement).first()
+    result = await session.exec(statement)
+    user_db = result.first()
+    # Return the connection to the pool before the slow hash check, so logins do
+    # not hold connections the rest of the API needs
+    await session.close()
 
     # Check if user exists in the database
     if not user_db:
@@ -46,11 +61,20 @@ def login(
             status_code=status.HTTP_403_FORBIDDEN, detail="Invalid Credentials"
         )
     # Verify the provided password against the stored password
-    if not verify_password(user.password, user_db.password):
+    if not await hashing_pool.verify(user.password, user_db.password):
         # Raise HTTP exception for invalid credentials if password mismatch
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN, detail="Invalid Credentials"
         )
+    # Upgrade the stored hash if it was made with an outdated cost factor, hashing
+    # first and then writing it in a short transaction of its own
+    if password_needs_rehash(user_db.password):
+        new_hash = await hashing_pool.hash(user.password)
+        await session.exec(
+            update(Users).where(Users.id == user_db.id).values(password=new_hash)
+        )
+        await session.commit()
+        invalidate_user(user_db.id)
     # Create an access token with user ID (replacing "sub" with "id" in data)
     access_token = create_access_token(data={"id": user_db.id})
     # Set the access token as a cookie in the HTTP response
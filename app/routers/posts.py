@@ -1,16 +1,42 @@
-# Import FastAPI modules for handling HTTP exceptions, queries, status codes, routing, and dependencies
-from fastapi import HTTPException, Query, status, APIRouter, Depends
+# Import FastAPI modules for handling HTTP exceptions, queries, status codes, routing, dependencies, and responses
+from fastapi import HTTPException, Query, status, APIRouter, Depends, Request
+
+# Import StreamingResponse for the NDJSON export
+from fastapi.responses import StreamingResponse
+
+# Import AsyncSession to open a session that outlives the export handler
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+# Import logging for request diagnostics
+import logging
+
+# Import math to size the bulk create query budget
+import math
 
 # Import typing modules for handling optional and annotated types
-from typing import Annotated, Optional
+from typing import Annotated, Any, Optional
 
 # Import SQLModel modules for database querying and functions
-from sqlmodel import select, func
+from sqlmodel import select, func, tuple_
+
+# Import datetime for decoding keyset cursors and export ranges
+from datetime import datetime
 
 # Import custom modules for database models, schemas, sessions, and authentication
 from .. import models, schema
-from ..database import SessionDep
-from ..config import get_current_user
+from ..database import ReadSessionDep, SessionDep
+from ..config import (
+    get_async_engine,
+    get_current_user,
+    get_response_cache,
+    settings,
+)
+from ..bulk import bulk_body, bulk_result, validate_items
+from ..cache import cached_json_response
+from ..pagination import NEXT_CURSOR_HEADER, decode_cursor, encode_cursor
+from ..replicas import response_cache_ttl, wrote_recently
+from ..search import search_query
+from ..profiler import query_budget
 
 # Create an APIRouter instance for handling posts-related endpoints
 # The prefix "/posts" groups all post-related routes together under this path
@@ -20,18 +46,24 @@ router = APIRouter(
     tags=["Posts"],
 )
 
+# Logger for post diagnostics
+logger = logging.getLogger(__name__)
 
-@router.post("/", status_code=status.HTTP_201_CREATED, response_model=schema.PostPublic)
-def create_post(
+
+# Query budget: user lookup, insert, refresh
+@router.post(
+    "/",
+    status_code=status.HTTP_201_CREATED,
+    response_model=schema.PostPublic,
+    dependencies=[query_budget(3)],
+)
+async def create_post(
     post: schema.PostCreate,  # The post data to be created
     session: SessionDep,  # Database session dependency
     current_user: models.Users = Depends(
         get_current_user
     ),  # Current authenticated user
 ):
-    # Print the current user's email for debugging purposes
-    print(current_user.email)
-
     # Create a new Post database model with the current user as the owner
     db_post = models.Post(owner_id=current_user.id, **post.model_dump())
 
@@ -39,95 +71,317 @@ def create_post(
     session.add(db_post)
 
     # Commit the transaction to persist the data
-    session.commit()
+    await session.commit()
+
+    # Drop cached post lists, which may now include the new post
+    get_response_cache().invalidate()
+
+    # Log a sample of created posts for debugging
+    logger.debug(
+        "User %s created post %s",
+        current_user.id,
+        db_post.id,
+        extra={"sampled": True},
+    )
 
     # Refresh the model to get the latest data from the database
-    session.refresh(db_post)
+    await session.refresh(db_post)
 
-    # Return the created post with all its data
-    return db_post
+    # Return the created post with all its data, owned by the current user
+    return to_post_public(db_post, schema.UserPublic.model_validate(current_user))
 
 
-@router.get("/", response_model=list[schema.PostVote])
-def read_posts(
+# Function to return the query budget of a bulk create: the user lookup, plus one
+# insert per page of rows the engine batches into a multi-row INSERT
+def bulk_create_budget() -> int:
+    page_size = get_async_engine().dialect.insertmanyvalues_page_size
+    return 1 + math.ceil(settings.bulk_max_items / page_size)
+
+
+# Query budget: see bulk_create_budget, sized for a request of bulk_max_items posts
+@router.post(
+    "/bulk",
+    status_code=status.HTTP_200_OK,
+    response_model=schema.BulkResult,
+    dependencies=[query_budget(bulk_create_budget)],
+)
+async def create_posts_bulk(
     session: SessionDep,  # Database session dependency
+    # The posts to be created, validated one by one against PostCreate
+    posts: Annotated[list[dict[str, Any]], bulk_body(schema.PostCreate)],
+    current_user: models.Users = Depends(
+        get_current_user
+    ),  # Current authenticated user
+):
+    # Validate every item in one pass, keeping the invalid ones as results
+    valid, results = validate_items(schema.PostCreate, posts)
+
+    # Create Post database models with the current user as the owner
+    db_posts = [
+        models.Post(owner_id=current_user.id, **post.model_dump()) for _, post in valid
+    ]
+
+    # Add all posts; the flush writes them with batched multi-row inserts
+    session.add_all(db_posts)
+
+    # Commit the transaction to persist every post at once
+    await session.commit()
+
+    # Drop cached post lists, which may now include the new posts
+    get_response_cache().invalidate()
+
+    # Report the ID of each created post
+    for (index, _), db_post in zip(valid, db_posts):
+        results.append(
+            schema.BulkItemResult(
+                index=index, status=status.HTTP_201_CREATED, id=db_post.id
+            )
+        )
+    return bulk_result(results)
+
+
+# Build the query that loads posts with their owner and vote count in one statement
+def post_with_votes_query():
+    return select(
+        models.Post,  # Select the Post model
+        models.Users.id,  # Select the owner's ID
+        models.Users.email,  # Select the owner's email
+        models.Users.created_at,  # Select the owner's creation timestamp
+        models.Post.votes,  # Select the denormalized vote count
+    ).join(  # Join with the Users model to get the owner in the same round trip
+        models.Users,
+        models.Users.id == models.Post.owner_id,  # Join condition
+        isouter=True,  # Use outer join to include posts without an owner
+    )
+
+
+# Convert a row from post_with_votes_query into a PostVote schema
+def to_post_vote(row) -> schema.PostVote:
+    # Unpack the post, owner columns and vote count from the row
+    post, owner_id, owner_email, owner_created_at, vote_count = row
+
+    # If owner exists, create a UserPublic schema from its columns
+    if owner_id is not None:
+        owner_public = schema.UserPublic.model_construct(
+            id=owner_id, email=owner_email, created_at=owner_created_at
+        )
+    else:
+        owner_public = None
+
+    # Create a PostVote schema combining post and vote data
+    return schema.PostVote.model_construct(
+        PostPublic=to_post_public(post, owner_public), votes=vote_count
+    )
+
+
+# Convert a Post into a PostPublic schema with an already-known owner; columns read
+# from the database are already valid, so the schemas skip validation
+def to_post_public(
+    post: models.Post, owner: Optional[schema.UserPublic]
+) -> schema.PostPublic:
+    # Create a PostPublic schema from the post data without lazy-loading the owner
+    return schema.PostPublic.model_construct(
+        id=post.id,
+        title=post.title,
+        content=post.content,
+        published=post.published,
+        created_at=post.created_at,
+        owner_id=post.owner_id,
+        owner=owner,
+    )
+
+
+# Query budget: one select for the page, none when served from the response cache
+@router.get("/", response_model=list[schema.PostVote], dependencies=[query_budget(1)])
+async def read_posts(
+    session: ReadSessionDep,  # Read-only session, on a replica when configured
+    request: Request,  # Request carrying the client's If-None-Match header
     # current_user: models.Users = Depends(get_current_user),  # [Commented Out] Current authenticated user
     offset: int = 0,  # Pagination offset parameter
     limit: Annotated[int, Query(le=100)] = 100,  # Pagination limit parameter (max 100)
-    search: Optional[str] = "",  # Optional search query parameter
+    search: Optional[str] = "",  # Optional full-text query ("phrase", pre*, -word, or)
+    cursor: Optional[str] = None,  # Opaque keyset cursor from a previous page
 ):
-    # Build the base SQL query to get posts with their vote counts
-    query = (
-        select(
-            models.Post,  # Select the Post model
-            func.count(models.Vote.post_id).label("votes"),  # Count votes for each post
-        )
-        .join(  # Join with the Vote model
-            models.Vote,
-            models.Vote.post_id == models.Post.id,  # Join condition
-            isouter=True,  # Use outer join to include posts with no votes
+    # Serve the page from the response cache without touching the database
+    response_cache = get_response_cache()
+    # A client that just wrote skips the cache, which another worker or a lagging
+    # replica read may have filled without its write
+    cache_key = ("posts", offset, limit, search, cursor)
+    cached = None if wrote_recently(request) else response_cache.get(cache_key)
+    if cached is not None:
+        return cached_json_response(request, cached)
+    version = response_cache.version
+
+    # Build the SQL query to get posts with their owners and vote counts
+    query = post_with_votes_query().limit(limit)  # Apply limit for pagination
+    # [Commented Out] query = query.where(models.Post.owner_id == current_user.id)  # [Commented Out] Filter by current user
+
+    # Apply the full-text search filter, served by the GIN index on search_vector
+    ts_query = search_query(search)
+    if ts_query is not None:
+        query = query.where(models.Post.search_vector.op("@@")(ts_query))
+
+    # Order newest first so pages are stable and served by ix_post_created_at_id
+    newest_first = (models.Post.created_at.desc(), models.Post.id.desc())
+
+    # Use keyset pagination when a cursor is given, otherwise fall back to offset
+    if cursor:
+        created_at, post_id = decode_cursor(cursor, datetime, int)
+        query = query.where(
+            tuple_(models.Post.created_at, models.Post.id) < (created_at, post_id)
+        ).order_by(*newest_first)
+    elif ts_query is not None:
+        # Rank search results by relevance, breaking ties by recency. Pick the page
+        # first and join owners to its rows only: the planner cannot tell how many
+        # posts a query matches, and overestimates turned the join into a scan
+        rank = func.ts_rank_cd(models.Post.search_vector, ts_query).label("rank")
+        page = (
+            select(models.Post.id, rank)
+            .where(models.Post.search_vector.op("@@")(ts_query))
+            .order_by(rank.desc(), *newest_first)
+            .offset(offset)
+            .limit(limit)
+            .subquery()
         )
-        .where(  # Apply search filter
-            (
-                (models.Post.title.like(f"%{search}%"))  # Search in title
-                | (models.Post.content.like(f"%{search}%"))  # Search in content
-            )
-            # [Commented Out] & (models.Post.owner_id == current_user.id)  # [Commented Out] Filter by current user
+        query = (
+            post_with_votes_query()
+            .join(page, page.c.id == models.Post.id)
+            .order_by(page.c.rank.desc(), *newest_first)
         )
-        .group_by(models.Post.id)  # Group by post ID
-        .offset(offset)  # Apply offset for pagination
-        .limit(limit)  # Apply limit for pagination
+    else:
+        query = query.order_by(*newest_first).offset(offset)
+
+    # Execute the query to get posts with their owners and vote counts
+    posts_with_votes_data = (await session.exec(query)).all()
+
+    # Return a cursor for the next page when this page is full. Ranked search pages
+    # are not in (created_at, id) order, so they page by offset only
+    ranked = ts_query is not None and not cursor
+    headers = {}
+    if not ranked and posts_with_votes_data and len(posts_with_votes_data) == limit:
+        last_post = posts_with_votes_data[-1][0]
+        headers[NEXT_CURSOR_HEADER] = encode_cursor(last_post.created_at, last_post.id)
+
+    # Serialize the posts straight to JSON, then cache and return them
+    body = schema.post_votes_adapter.dump_json(
+        [to_post_vote(row) for row in posts_with_votes_data]
+    )
+    ttl = response_cache_ttl(session)
+    return cached_json_response(
+        request, response_cache.set(cache_key, version, body, headers, ttl)
     )
 
-    # Execute the query to get posts with their vote counts
-    posts_with_votes_data = session.exec(query).all()
-
-    # List to store posts with their vote counts
-    posts_with_votes = []
-
-    # Iterate over each post and its vote count
-    for post, vote_count in posts_with_votes_data:
-        # Get the post owner from the database
-        owner = session.get(models.Users, post.owner_id)
-
-        # If owner exists, create a UserPublic schema from it
-        if owner:
-            owner_public = schema.UserPublic.model_validate(owner)
-        else:
-            owner_public = None
-
-        # Create a PostPublic schema from the post data
-        post_public = schema.PostPublic(
-            id=post.id,
-            title=post.title,
-            content=post.content,
-            published=post.published,
-            created_at=post.created_at,
-            owner_id=post.owner_id,
-            owner=owner_public,
+
+# Query budget: one range read of the trending feed, none when served from the cache
+@router.get(
+    "/trending",
+    response_model=list[schema.PostVote],
+    dependencies=[query_budget(1)],
+)
+async def read_trending_posts(
+    session: ReadSessionDep,  # Read-only session, on a replica when configured
+    request: Request,  # Request carrying the client's If-None-Match header
+    offset: int = 0,  # Number of top posts to skip
+    limit: Annotated[int, Query(le=100)] = 100,  # Pagination limit parameter (max 100)
+):
+    # Serve the page from the response cache without touching the database
+    response_cache = get_response_cache()
+    # A client that just wrote skips the cache, which another worker or a lagging
+    # replica read may have filled without its write
+    cache_key = ("posts", "trending", offset, limit)
+    cached = None if wrote_recently(request) else response_cache.get(cache_key)
+    if cached is not None:
+        return cached_json_response(request, cached)
+    version = response_cache.version
+
+    # Read the page by rank from the precomputed feed, refreshed in the background
+    query = (
+        post_with_votes_query()
+        .join(models.TrendingPost, models.TrendingPost.post_id == models.Post.id)
+        .where(
+            models.TrendingPost.rank > offset,
+            models.TrendingPost.rank <= offset + limit,
         )
+        .order_by(models.TrendingPost.rank)
+    )
+    rows = (await session.exec(query)).all()
+
+    # Serialize the trending posts straight to JSON, then cache and return them
+    body = schema.post_votes_adapter.dump_json([to_post_vote(row) for row in rows])
+    ttl = response_cache_ttl(session)
+    return cached_json_response(
+        request, response_cache.set(cache_key, version, body, ttl=ttl)
+    )
 
-        # Create a PostVote schema combining post and vote data
-        post_with_votes = schema.PostVote(PostPublic=post_public, votes=vote_count)
 
-        # Add the post with votes to the result list
-        posts_with_votes.append(post_with_votes)
+# Query budget: the export streams from a single server-side cursor
+@router.get(
+    "/export",
+    response_class=StreamingResponse,
+    dependencies=[query_budget(1)],
+    responses={200: {"content": {"application/x-ndjson": {}}}},
+)
+async def export_posts(
+    search: Optional[str] = "",  # Optional full-text query, as in read_posts
+    created_from: Optional[datetime] = None,  # Only posts created at or after this
+    created_to: Optional[datetime] = None,  # Only posts created before this
+):
+    # Build the SQL query to get every matching post, oldest first
+    query = post_with_votes_query().order_by(models.Post.created_at, models.Post.id)
+
+    # Apply the full-text search filter
+    ts_query = search_query(search)
+    if ts_query is not None:
+        query = query.where(models.Post.search_vector.op("@@")(ts_query))
+
+    # Apply the created_at range filter
+    if created_from is not None:
+        query = query.where(models.Post.created_at >= created_from)
+    if created_to is not None:
+        query = query.where(models.Post.created_at < created_to)
+
+    # Stream rows from a server-side cursor, one NDJSON chunk per fetched batch
+    async def rows():
+        # The session lives as long as the stream, not just the request handler
+        async with AsyncSession(get_async_engine()) as session:
+            result = await session.stream(
+                query.execution_options(yield_per=settings.export_batch_size)
+            )
+            async for partition in result.partitions():
+                yield "".join(
+                    to_post_vote(row).model_dump_json() + "\n" for row in partition
+                )
 
-    # Return the list of posts with their vote counts
-    return posts_with_votes
+    # Return the rows as they arrive from the database
+    return StreamingResponse(rows(), media_type="application/x-ndjson")
 
 
-@router.get("/{post_id}", response_model=schema.PostVote)
-def read_post(
+# Query budget: one select for the post, none when served from the response cache
+@router.get(
+    "/{post_id}", response_model=schema.PostVote, dependencies=[query_budget(1)]
+)
+async def read_post(
     post_id: int,  # ID of the post to retrieve
-    session: SessionDep,  # Database session dependency
+    session: ReadSessionDep,  # Read-only session, on a replica when configured
+    request: Request,  # Request carrying the client's If-None-Match header
     # current_user: models.Users = Depends(get_current_user),  # [Commented Out] Current authenticated user
 ):
-    # Get the post from the database by its ID
-    post = session.get(models.Post, post_id)
+    # Serve the post from the response cache without touching the database
+    response_cache = get_response_cache()
+    # A client that just wrote skips the cache, which another worker or a lagging
+    # replica read may have filled without its write
+    cache_key = ("post", post_id)
+    cached = None if wrote_recently(request) else response_cache.get(cache_key)
+    if cached is not None:
+        return cached_json_response(request, cached)
+    version = response_cache.version
+
+    # Get the post with its owner and vote count from the database by its ID
+    query = post_with_votes_query().where(models.Post.id == post_id)
+    row = (await session.exec(query)).first()
 
     # If the post does not exist, raise a 404 error
-    if not post:
+    if not row:
         raise HTTPException(
             status_code=404, detail=f"Post with post_id of {post_id} not found"
         )
@@ -138,12 +392,21 @@ def read_post(
     # [Commented Out]         detail="Not authorized to perform request action",
     # [Commented Out]     )
 
-    # Return the retrieved post
-    return post
+    # Cache and return the retrieved post with its owner and vote count
+    body = schema.post_vote_adapter.dump_json(to_post_vote(row))
+    ttl = response_cache_ttl(session)
+    return cached_json_response(
+        request, response_cache.set(cache_key, version, body, ttl=ttl)
+    )
 
 
-@router.delete("/{post_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_post(
+# Query budget: user lookup, load, delete
+@router.delete(
+    "/{post_id}",
+    status_code=status.HTTP_204_NO_CONTENT,
+    dependencies=[query_budget(3)],
+)
+async def delete_post(
     post_id: int,  # ID of the post to delete
     session: SessionDep,  # Database session dependency
     current_user: models.Users = Depends(
@@ -151,7 +414,7 @@ def delete_post(
     ),  # Current authenticated user
 ):
     # Get the post from the database by its ID
-    post = session.get(models.Post, post_id)
+    post = await session.get(models.Post, post_id)
 
     # If the post does not exist, raise a 404 error
     if not post:
@@ -168,19 +431,26 @@ def delete_post(
         )
 
     # Delete the post from the database
-    session.delete(post)
+    await session.delete(post)
 
     # Commit the transaction to persist the deletion
-    session.commit()
+    await session.commit()
+
+    # Drop the cached post and the cached lists that included it
+    get_response_cache().invalidate(post_id)
 
     # Return a success message
     return {"message": "Post deleted successfully"}
 
 
+# Query budget: user lookup, load, update, refresh
 @router.put(
-    "/{post_id}", status_code=status.HTTP_200_OK, response_model=schema.PostPublic
+    "/{post_id}",
+    status_code=status.HTTP_200_OK,
+    response_model=schema.PostPublic,
+    dependencies=[query_budget(4)],
 )
-def update_post(
+async def update_post(
     post_id: int,  # ID of the post to update
     post: schema.PostUpdate,  # Updated post data
     session: SessionDep,  # Database session dependency
@@ -189,7 +459,7 @@ def update_post(
     ),  # Current authenticated user
 ):
     # Get the post from the database by its ID
-    db_post = session.get(models.Post, post_id)
+    db_post = await session.get(models.Post, post_id)
 
     # If the post does not exist, raise a 404 error
     if not db_post:
@@ -214,17 +484,23 @@ def update_post(
     session.add(db_post)
 
     # Commit the transaction to persist the changes
-    session.commit()
+    await session.commit()
+
+    # Drop the cached post and the cached lists that included it
+    get_response_cache().invalidate(post_id)
 
     # Refresh the model to get the latest data from the database
-    session.refresh(db_post)
+    await session.refresh(db_post)
 
-    # Return the updated post
-    return db_post
+    # Return the updated post, owned by the current user
+    return to_post_public(db_post, schema.UserPublic.model_validate(current_user))
 
 
-@router.patch("/{post_id}", response_model=schema.PostPublic)
-def update_post(
+# Query budget: user lookup, load, update, refresh
+@router.patch(
+    "/{post_id}", response_model=schema.PostPublic, dependencies=[query_budget(4)]
+)
+async def update_post(
     post_id: int,  # ID of the post to update
     post: schema.PostUpdate,  # Updated post data
     session: SessionDep,  # Database session dependency
@@ -233,7 +509,7 @@ def update_post(
     ),  # Current authenticated user
 ):
     # Get the post from the database by its ID
-    post_db = session.get(models.Post, post_id)
+    post_db = await session.get(models.Post, post_id)
 
     # If the post does not exist, raise a 404 error
     if not post_db:
@@ -258,10 +534,13 @@ def update_post(
     session.add(post_db)
 
     # Commit the transaction to persist the changes
-    session.commit()
+    await session.commit()
+
+    # Drop the cached post and the cached lists that included it
+    get_response_cache().invalidate(post_id)
 
     # Refresh the model to get the latest data from the database
-    session.refresh(post_db)
+    await session.refresh(post_db)
 
-    # Return the updated post
-    return post_db
+    # Return the updated post, owned by the current user
+    return to_post_public(post_db, schema.UserPublic.model_validate(current_user))
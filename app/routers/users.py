@@ -1,36 +1,48 @@
 # Import necessary modules from FastAPI for handling HTTP exceptions, query parameters, status codes, API routing, and dependencies
-from fastapi import HTTPException, Query, status, APIRouter, Depends
+from fastapi import HTTPException, Query, status, APIRouter, Depends, Response
 
-# Import Annotated from typing for adding metadata to function parameters
-from typing import Annotated
+# Import Annotated and Optional from typing for adding metadata to function parameters
+from typing import Annotated, Optional
 
 # Import select from sqlmodel for building SQL queries
 from sqlmodel import select
 
 # Import UserPublic and UserCreate schemas for input/output validation
-from ..schema import UserPublic, UserCreate
+from ..schema import UserPublic, UserCreate, users_public_adapter
 
 # Import Users model for database operations
 from ..models import Users
 
-# Import get_password_hash utility for hashing passwords
-from ..utils import get_password_hash
+# Import the hashing pool for hashing passwords off the event loop
+from ..utils import hashing_pool
 
-# Import SessionDep for database session dependency
-from ..database import SessionDep
+# Import SessionDep for writes and ReadSessionDep for read-only endpoints
+from ..database import ReadSessionDep, SessionDep
 
-# Import get_current_user for authentication
-from ..config import get_current_user
+# Import get_current_user for authentication and invalidate_user for the user cache
+from ..config import get_current_user, invalidate_user
+
+# Import keyset cursor helpers for pagination
+from ..pagination import NEXT_CURSOR_HEADER, decode_cursor, encode_cursor
+
+# Import query_budget to declare how many SQL statements each endpoint may run
+from ..profiler import query_budget
 
 # Create an APIRouter instance with prefix and tags for Swagger documentation
 router = APIRouter(prefix="/users", tags=["Users"])
 
 
 # Define a POST endpoint to create a new user with status code 201 (Created)
-@router.post("/", status_code=status.HTTP_201_CREATED, response_model=UserPublic)
-def create_user(user: UserCreate, session: SessionDep):
+# Query budget: insert, refresh
+@router.post(
+    "/",
+    status_code=status.HTTP_201_CREATED,
+    response_model=UserPublic,
+    dependencies=[query_budget(2)],
+)
+async def create_user(user: UserCreate, session: SessionDep):
     # Hash the user's password for secure storage
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await hashing_pool.hash(user.password)
     # Update the user's password with the hashed value
     user.password = hashed_password
 
@@ -39,34 +51,62 @@ def create_user(user: UserCreate, session: SessionDep):
     # Add the new user to the database session
     session.add(db_user)
     # Commit the transaction to save the user
-    session.commit()
+    await session.commit()
     # Refresh the session to get the updated user instance
-    session.refresh(db_user)
+    await session.refresh(db_user)
+    # Drop any stale cached entry for this user ID
+    invalidate_user(db_user.id)
     # Return the created user
     return db_user
 
 
 # Define a GET endpoint to read multiple users
-@router.get("/", response_model=list[UserPublic])
-def read_users(
-    session: SessionDep,
+# Query budget: user lookup, one select for the page
+@router.get("/", response_model=list[UserPublic], dependencies=[query_budget(2)])
+async def read_users(
+    session: ReadSessionDep,
     current_user: Users = Depends(get_current_user),
     offset: int = 0,
     limit: Annotated[int, Query(le=100)] = 100,
+    cursor: Optional[str] = None,
 ):
+    # Build a query ordered by primary key so pages are stable
+    statement = select(Users).order_by(Users.id).limit(limit)
+    # Use keyset pagination when a cursor is given, otherwise fall back to offset
+    if cursor:
+        (last_id,) = decode_cursor(cursor, int)
+        statement = statement.where(Users.id > last_id)
+    else:
+        statement = statement.offset(offset)
     # Execute a query to get users with pagination
-    users = session.exec(select(Users).offset(offset).limit(limit)).all()
-    # Return the list of users
-    return users
+    result = await session.exec(statement)
+    users = result.all()
+    # Return a cursor for the next page when this page is full
+    headers = {}
+    if users and len(users) == limit:
+        headers[NEXT_CURSOR_HEADER] = encode_cursor(users[-1].id)
+    # Serialize the users straight to JSON, skipping response_model validation
+    body = users_public_adapter.dump_json(
+        [
+            UserPublic.model_construct(
+                id=user.id, email=user.email, created_at=user.created_at
+            )
+            for user in users
+        ]
+    )
+    return Response(body, media_type="application/json", headers=headers)
 
 
 # Define a GET endpoint to read a single user by ID
-@router.get("/{user_id}", response_model=UserPublic)
-def read_user(
-    user_id: int, session: SessionDep, current_user: Users = Depends(get_current_user)
+# Query budget: user lookup, load
+@router.get("/{user_id}", response_model=UserPublic, dependencies=[query_budget(2)])
+async def read_user(
+    user_id: int,
+    session: ReadSessionDep,
+    current_user: Users = Depends(get_current_user),
 ):
     # Get the user from the database by ID
-    user = session.get(Users, user_id)
+    user = await session.get(Users, user_id)
     # Raise 404 if user not found
     if not user:
         raise HTTPException(
@@ -1,11 +1,23 @@
 # Import necessary modules from FastAPI for creating API routes and handling HTTP requests
-from fastapi import APIRouter, status, HTTPException, Depends
+from fastapi import APIRouter, status, HTTPException, Depends, Response
 
-# Import SQLModel's select function for database queries
-from sqlmodel import select
+# Import typing helpers for annotating the bulk request body
+from typing import Annotated, Any
 
-# Import the VoteCreate schema from the schema module
-from ..schema import VoteCreate
+# Import SQLModel's delete and select functions for database statements
+from sqlmodel import delete, select
+
+# Import the PostgreSQL insert construct for ON CONFLICT DO NOTHING
+from sqlalchemy.dialects.postgresql import insert
+
+# Import IntegrityError to detect votes on posts that do not exist
+from sqlalchemy.exc import IntegrityError
+
+# Import the VoteCreate and bulk result schemas from the schema module
+from ..schema import BulkItemResult, BulkResult, VoteCreate
+
+# Import helpers for declaring, validating and summarizing bulk requests
+from ..bulk import bulk_body, bulk_result, validate_items
 
 # Import the configuration for getting the current user
 from ..config import get_current_user
@@ -16,6 +28,19 @@ from ..database import SessionDep
 # Import the Vote and Post models from the models module
 from ..models import Vote, Post
 
+# Import the vote counter helper to keep post.votes in step
+from ..counters import apply_vote_deltas, invalidate_vote_counts
+
+# Import the settings and the write-behind vote buffer
+from ..config import settings
+from ..vote_buffer import vote_buffer
+
+# Import query_budget to declare how many SQL statements each endpoint may run
+from ..profiler import query_budget
+
+# SQLSTATE raised by Postgres when a foreign key points at a missing row
+FOREIGN_KEY_VIOLATION = "23503"
+
 # Create an APIRouter instance with the prefix "/votes" and tag "Vote" for Swagger documentation
 router = APIRouter(
     prefix="/votes",
@@ -24,12 +49,15 @@ router = APIRouter(
 
 
 # Define a POST endpoint for creating votes with a 201 status code
-@router.post("/", status_code=status.HTTP_201_CREATED)
-def create_vote(
+# Query budget: user lookup, insert or delete, counter update (or post lookup on a miss)
+@router.post("/", status_code=status.HTTP_201_CREATED, dependencies=[query_budget(3)])
+async def create_vote(
     # The vote data to be created, following the VoteCreate schema
     vote: VoteCreate,
     # The database session to interact with the database
     session: SessionDep,
+    # The response, used to report 202 Accepted for buffered votes
+    response: Response,
     # The currently authenticated user (retrieved using get_current_user)
     current_user=Depends(get_current_user),
 ):
@@ -42,52 +70,191 @@ def create_vote(
             detail="You must be logged in to vote",
         )
 
-    # Try to get the post from the database using the post_id from the vote data
-    post = session.get(Post, vote.post_id)
-    # If the post does not exist, raise an HTTPException with a 404 status code
-    if not post:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Post with id {vote.post_id} does not exist",
-        )
+    # In write-behind mode, queue the vote and acknowledge it without a transaction
+    if settings.vote_buffer_enabled:
+        vote_buffer.submit(current_user.id, vote.post_id, vote.dir)
+        response.status_code = status.HTTP_202_ACCEPTED
+        return {"message": "Vote accepted"}
 
-    # Create a SQL query to check if the user has already voted on this post
-    statement = select(Vote).where(
-        Vote.user_id == current_user.id, Vote.post_id == vote.post_id
+    # Create an HTTP exception for votes on posts that do not exist
+    post_not_found = HTTPException(
+        status_code=status.HTTP_404_NOT_FOUND,
+        detail=f"Post with id {vote.post_id} does not exist",
     )
-    # Execute the query and get the first result
-    existing_vote = session.exec(statement).first()
 
     # If the vote direction is 1 (upvote)
     if vote.dir == 1:
-        # If there is already an existing vote, raise a 409 conflict error
-        if existing_vote:
+        # Insert the vote in one round trip; an existing vote makes it a no-op
+        statement = (
+            insert(Vote)
+            .values(user_id=current_user.id, post_id=vote.post_id)
+            .on_conflict_do_nothing()
+            .returning(Vote.post_id)
+        )
+        try:
+            # Execute the insert and get the inserted row, if any
+            result = await session.exec(statement)
+            inserted = result.first()
+        except IntegrityError as e:
+            # A foreign-key violation means the post does not exist
+            await session.rollback()
+            if e.orig.sqlstate == FOREIGN_KEY_VIOLATION:
+                raise post_not_found
+            raise
+        # If nothing was inserted the user has already voted, raise a 409 conflict error
+        if inserted is None:
             raise HTTPException(
                 status_code=status.HTTP_409_CONFLICT,
                 detail=f"You have already voted on post {vote.post_id}.",
             )
-        # Create a new vote instance with the current user's ID and the post ID
-        new_vote = Vote(user_id=current_user.id, post_id=vote.post_id)
-        # Add the new vote to the database session
-        session.add(new_vote)
+        # Increment the post's vote count in the same transaction
+        await apply_vote_deltas(session, {vote.post_id: 1})
         # Commit the transaction to save the vote
-        session.commit()
-        # Refresh the new_vote object to get the generated database fields
-        session.refresh(new_vote)
+        await session.commit()
+        # Drop cached responses that show the old vote count
+        invalidate_vote_counts([vote.post_id])
         # Return a success message with the created vote
         return {"message": "Vote created successfully"}
 
     # If the vote direction is -1 (downvote)
     else:
-        # If there is no existing vote to delete, raise a 404 error
-        if not existing_vote:
+        # Delete the vote in one round trip, returning it if it existed
+        statement = (
+            delete(Vote)
+            .where(Vote.user_id == current_user.id, Vote.post_id == vote.post_id)
+            .returning(Vote.post_id)
+        )
+        # Execute the delete and get the deleted row, if any
+        result = await session.exec(statement)
+        deleted = result.first()
+        # If there was no vote to delete, tell a missing post from a missing vote
+        if deleted is None:
+            if not await session.get(Post, vote.post_id):
+                raise post_not_found
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
-                detail=f"Vote with id {vote.id} does not exist",
+                detail=f"Vote on post {vote.post_id} does not exist",
             )
-        # Delete the existing vote from the database
-        session.delete(existing_vote)
+        # Decrement the post's vote count in the same transaction
+        await apply_vote_deltas(session, {vote.post_id: -1})
         # Commit the transaction to save the deletion
-        session.commit()
+        await session.commit()
+        # Drop cached responses that show the old vote count
+        invalidate_vote_counts([vote.post_id])
         # Return a success message after deleting the vote
         return {"message": "Vote deleted successfully"}
+
+
+# Define a POST endpoint for creating and removing many votes in one transaction
+# Query budget: user lookup, post lookup, insert, delete, counter update
+@router.post(
+    "/bulk",
+    status_code=status.HTTP_200_OK,
+    response_model=BulkResult,
+    dependencies=[query_budget(5)],
+)
+async def create_votes_bulk(
+    # The database session to interact with the database
+    session: SessionDep,
+    # The votes to be applied, validated one by one against VoteCreate
+    votes: Annotated[list[dict[str, Any]], bulk_body(VoteCreate)],
+    # The currently authenticated user (retrieved using get_current_user)
+    current_user=Depends(get_current_user),
+):
+    # Validate every item in one pass, keeping the invalid ones as results
+    valid, results = validate_items(VoteCreate, votes)
+
+    # Reject repeated votes on the same post, since their outcome would be ambiguous
+    by_post: dict[int, tuple[int, VoteCreate]] = {}
+    for index, vote in valid:
+        if vote.post_id in by_post:
+            results.append(
+                BulkItemResult(
+                    index=index,
+                    status=status.HTTP_409_CONFLICT,
+                    detail=f"Post {vote.post_id} appears more than once in the request.",
+                )
+            )
+        else:
+            by_post[vote.post_id] = (index, vote)
+
+    # Look up which of the referenced posts exist with a single query
+    result = await session.exec(select(Post.id).where(Post.id.in_(list(by_post))))
+    existing_posts = set(result.all())
+    for post_id in by_post.keys() - existing_posts:
+        results.append(
+            BulkItemResult(
+                index=by_post.pop(post_id)[0],
+                status=status.HTTP_404_NOT_FOUND,
+                detail=f"Post with id {post_id} does not exist",
+            )
+        )
+
+    # Split the remaining votes into upvotes and removals
+    upvotes = [post_id for post_id, (_, vote) in by_post.items() if vote.dir == 1]
+    removals = [post_id for post_id, (_, vote) in by_post.items() if vote.dir != 1]
+
+    try:
+        # Insert all upvotes with one multi-row statement, skipping existing votes
+        inserted = set()
+        if upvotes:
+            statement = (
+                insert(Vote)
+                .values([{"user_id": current_user.id, "post_id": id} for id in upvotes])
+                .on_conflict_do_nothing()
+                .returning(Vote.post_id)
+            )
+            inserted = set((await session.exec(statement)).scalars().all())
+
+        # Delete all removals with one statement, returning the votes that existed
+        deleted = set()
+        if removals:
+            statement = (
+                delete(Vote)
+                .where(Vote.user_id == current_user.id, Vote.post_id.in_(removals))
+                .returning(Vote.post_id)
+            )
+            deleted = set((await session.exec(statement)).scalars().all())
+    except IntegrityError as e:
+        # A post was deleted while the request ran; ask the client to retry
+        await session.rollback()
+        if e.orig.sqlstate == FOREIGN_KEY_VIOLATION:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Posts changed while voting, please retry",
+            )
+        raise
+
+    # Update the vote counters for every vote that changed, then commit
+    deltas = {post_id: 1 for post_id in inserted}
+    deltas.update({post_id: -1 for post_id in deleted})
+    await apply_vote_deltas(session, deltas)
+    await session.commit()
+    invalidate_vote_counts(list(deltas))
+
+    # Report the outcome of each vote: 201 for a created vote, 200 for a removed one
+    for post_id in upvotes:
+        index = by_post[post_id][0]
+        if post_id in inserted:
+            results.append(BulkItemResult(index=index, status=status.HTTP_201_CREATED))
+        else:
+            results.append(
+                BulkItemResult(
+                    index=index,
+                    status=status.HTTP_409_CONFLICT,
+                    detail=f"You have already voted on post {post_id}.",
+                )
+            )
+    for post_id in removals:
+        index = by_post[post_id][0]
+        if post_id in deleted:
+            results.append(BulkItemResult(index=index, status=status.HTTP_200_OK))
+        else:
+            results.append(
+                BulkItemResult(
+                    index=index,
+                    status=status.HTTP_404_NOT_FOUND,
+                    detail=f"Vote on post {post_id} does not exist",
+                )
+            )
+    return bulk_result(results)
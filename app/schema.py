@@ -7,6 +7,9 @@ from typing import Optional
 # Import EmailStr from pydantic to validate email addresses
 from pydantic import EmailStr
 
+# Import TypeAdapter to precompile serializers for list responses
+from pydantic import TypeAdapter
+
 # Import SQLModel and Field from sqlmodel for database modeling
 from sqlmodel import SQLModel, Field
 
@@ -108,3 +111,31 @@ class VotePublic(SQLModel):
     user_id: int
     # Timestamp when the vote was created
     created_at: datetime
+
+
+# Define a BulkItemResult class reporting the outcome of one item in a bulk request
+class BulkItemResult(SQLModel):
+    # Position of the item in the request body
+    index: int
+    # HTTP status code the item would have received on its own
+    status: int
+    # ID of the created resource, if any
+    id: Optional[int] = None
+    # Error message for items that were not written
+    detail: Optional[str] = None
+
+
+# Define a BulkResult class summarizing a bulk request
+class BulkResult(SQLModel):
+    # Number of items written
+    succeeded: int
+    # Number of items rejected
+    failed: int
+    # Per-item outcomes in request order
+    results: list[BulkItemResult]
+
+
+# Serializers built once at import, turning response models straight into JSON bytes
+post_vote_adapter = TypeAdapter(PostVote)
+post_votes_adapter = TypeAdapter(list[PostVote])
+users_public_adapter = TypeAdapter(list[UserPublic])
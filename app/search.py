@@ -0,0 +1,60 @@
+# Import re to split a search string into phrases, prefix terms and plain words
+import re
+
+# Import func from SQLModel to build Postgres full-text search expressions
+from sqlmodel import func
+
+# Text search configuration shared by the indexed column and the queries
+SEARCH_CONFIG = "english"
+
+# Match a quoted phrase, left to websearch_to_tsquery as it is, or a word ending in
+# "*" (e.g. "pyth*", or "-pyth*" to exclude), which requests a prefix match
+SEARCH_TOKEN = re.compile(r'"[^"]*"?|(?<![\w-])(-?)(\w+)\*')
+
+
+# Function to build the tsvector expression stored in post.search_vector
+def search_vector_expression() -> str:
+    # Weight title matches above content matches when ranking
+    return (
+        f"setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(title, '')), 'A') || "
+        f"setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(content, '')), 'B')"
+    )
+
+
+# Function to turn a user search string into a tsquery expression, or None if empty
+def search_query(search: str | None):
+    # Treat a missing or blank search as no filter
+    if not search or not search.strip():
+        return None
+
+    # Collect prefix terms outside phrases as (negated, word) and remove them from
+    # the websearch part
+    prefixes = []
+
+    def take_prefix(match):
+        if match.group(2) is None:
+            return match.group(0)
+        prefixes.append((match.group(1) == "-", match.group(2)))
+        return " "
+
+    remainder = SEARCH_TOKEN.sub(take_prefix, search).strip()
+
+    # Let websearch_to_tsquery handle quoted phrases, "or" and "-" negation
+    queries = []
+    if remainder.strip('"- '):
+        queries.append(func.websearch_to_tsquery(SEARCH_CONFIG, remainder))
+
+    # Build a prefix query for every word ending in "*": term:*, or !term:* to exclude
+    for negated, prefix in prefixes:
+        operator = "!" if negated else ""
+        queries.append(func.to_tsquery(SEARCH_CONFIG, f"{operator}{prefix}:*"))
+
+    # Return None if nothing searchable was left (e.g. only punctuation)
+    if not queries:
+        return None
+
+    # Require every part of the query to match
+    ts_query = queries[0]
+    for query in queries[1:]:
+        ts_query = ts_query.op("&&")(query)
+    return ts_query
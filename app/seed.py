@@ -0,0 +1,224 @@
+# Import argparse to read the dataset size and skew from the command line
+import argparse
+
+# Import random for reproducible synthetic data
+import random
+
+# Import sys to report progress on stderr
+import sys
+
+# Import time to report load rates
+import time
+
+# Import datetime to spread creation times over a period
+from datetime import datetime, timedelta, timezone
+
+# Import psycopg to load rows with COPY
+import psycopg
+
+# Import the database URL builder from the config module
+from .config import get_database_url
+
+# Import the password hashing helper to hash the shared password once
+from .utils import get_password_hash
+
+# Words used for post titles and content, so full-text search has something to match
+WORDS = (
+    "alpha bravo charlie delta echo foxtrot golf hotel india juliet kilo lima mike "
+    "november oscar papa quebec romeo sierra tango uniform victor whiskey xray "
+    "yankee zulu python postgres vote search cache index query fast slow"
+).split()
+
+
+# Function to report progress on stderr
+def report(message: str):
+    print(message, file=sys.stderr, flush=True)
+
+
+# Function to split total into count shares of at most cap following a Zipf law
+# with exponent skew, raising ValueError when they cannot hold the total
+def zipf_shares(total: int, count: int, skew: float, cap: int, rng) -> list[int]:
+    if total > count * cap:
+        raise ValueError(
+            f"cannot split {total:,} into {count:,} shares of at most {cap:,}"
+        )
+    # Weight rank r by 1 / r**skew, then shuffle so popularity is unrelated to ID
+    weights = [1 / rank**skew for rank in range(1, count + 1)]
+    rng.shuffle(weights)
+    scale = total / sum(weights)
+    # Round down, capping each share, then hand out the remainder by weight. Picks
+    # that land on a share filled up in the same round are drawn again among the
+    # shares still open, until the whole total is handed out
+    shares = [min(cap, int(weight * scale)) for weight in weights]
+    remainder = total - sum(shares)
+    while remainder > 0:
+        open_slots = [i for i, share in enumerate(shares) if share < cap]
+        picks = rng.choices(
+            open_slots, weights=[weights[i] for i in open_slots], k=remainder
+        )
+        for i in picks:
+            if shares[i] < cap:
+                shares[i] += 1
+                remainder -= 1
+    return shares
+
+
+# Function to load rows into table with COPY, reporting the rate
+def copy_rows(cursor, table: str, columns: tuple[str, ...], rows):
+    started = time.perf_counter()
+    loaded = 0
+    with cursor.copy(f"COPY {table} ({', '.join(columns)}) FROM STDIN") as copy:
+        for row in rows:
+            copy.write_row(row)
+            loaded += 1
+            if loaded % 1_000_000 == 0:
+                report(f"  {table}: {loaded:,} rows")
+    elapsed = time.perf_counter() - started
+    report(f"Loaded {loaded:,} {table} rows in {elapsed:.1f}s")
+    return loaded
+
+
+# Fill the users, post and vote tables with a skewed synthetic dataset
+def seed(args):
+    rng = random.Random(args.seed)
+    now = datetime.now(timezone.utc)
+    period = timedelta(days=args.days).total_seconds()
+
+    # Hash the shared password once; bcrypt would dominate the load otherwise
+    password_hash = get_password_hash(args.password)
+
+    with psycopg.connect(get_database_url()) as conn:
+        conn.execute("SET synchronous_commit = off")
+        with conn.cursor() as cursor:
+            if args.truncate:
+                cursor.execute(
+                    "TRUNCATE vote, votecountshard, posttrend, trendingpost, post, "
+                    "users RESTART IDENTITY"
+                )
+
+            # New rows get IDs after the existing ones
+            cursor.execute("SELECT coalesce(max(id), 0) FROM users")
+            first_user = cursor.fetchone()[0] + 1
+            cursor.execute("SELECT coalesce(max(id), 0) FROM post")
+            first_post = cursor.fetchone()[0] + 1
+
+            # Users, all sharing the precomputed password hash
+            copy_rows(
+                cursor,
+                "users",
+                ("id", "email", "password", "phone_num", "created_at"),
+                (
+                    (
+                        first_user + i,
+                        f"seed{first_user + i}@example.com",
+                        password_hash,
+                        "",
+                        now - timedelta(seconds=rng.random() * period),
+                    )
+                    for i in range(args.users)
+                ),
+            )
+
+            # Posts, with a power-law number of posts per user
+            posts_per_user = zipf_shares(
+                args.posts, args.users, args.post_skew, args.posts, rng
+            )
+            owners = (
+                first_user + user
+                for user, count in enumerate(posts_per_user)
+                for _ in range(count)
+            )
+            # Zipf-distributed votes per post; a post has at most one vote per user
+            votes_per_post = zipf_shares(
+                args.votes, args.posts, args.vote_skew, args.users, rng
+            )
+            # Age of each post in seconds, so its votes can be cast after it
+            post_ages = [rng.random() * period for _ in range(len(votes_per_post))]
+            copy_rows(
+                cursor,
+                "post",
+                (
+                    "id",
+                    "title",
+                    "content",
+                    "published",
+                    "created_at",
+                    "votes",
+                    "owner_id",
+                ),
+                (
+                    (
+                        first_post + i,
+                        " ".join(rng.sample(WORDS, 3)),
+                        " ".join(rng.choices(WORDS, k=20)),
+                        True,
+                        now - timedelta(seconds=post_ages[i]),
+                        votes_per_post[i],
+                        owner,
+                    )
+                    for i, owner in enumerate(owners)
+                ),
+            )
+
+            # Votes, drawing distinct voters for each post and a time after the post
+            copy_rows(
+                cursor,
+                "vote",
+                ("user_id", "post_id", "created_at"),
+                (
+                    (
+                        first_user + user,
+                        first_post + i,
+                        now - timedelta(seconds=rng.random() * post_ages[i]),
+                    )
+                    for i, count in enumerate(votes_per_post)
+                    for user in rng.sample(range(args.users), count)
+                ),
+            )
+
+            # Move the ID sequences past the explicit IDs and refresh planner stats
+            for table in ("users", "post"):
+                cursor.execute(
+                    f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                    f"(SELECT max(id) FROM {table}))"
+                )
+        conn.commit()
+        conn.autocommit = True
+        for table in ("users", "post", "vote"):
+            conn.execute(f"ANALYZE {table}")
+    report("Score the new votes with: python -m app.trending --rebuild")
+
+
+# Allow seeding from the command line: python -m app.seed --votes 10000000
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Fill the database with a skewed synthetic dataset using COPY."
+    )
+    parser.add_argument("--users", type=int, default=100_000, help="users to create")
+    parser.add_argument("--posts", type=int, default=1_000_000, help="posts to create")
+    parser.add_argument("--votes", type=int, default=10_000_000, help="votes to create")
+    parser.add_argument(
+        "--vote-skew", type=float, default=1.1, help="Zipf exponent of votes per post"
+    )
+    parser.add_argument(
+        "--post-skew",
+        type=float,
+        default=1.2,
+        help="power-law exponent of posts per user",
+    )
+    parser.add_argument("--days", type=float, default=365, help="period of created_at")
+    parser.add_argument(
+        "--password", default="password123", help="password of every user"
+    )
+    parser.add_argument("--seed", type=int, default=1, help="random seed")
+    parser.add_argument(
+        "--truncate", action="store_true", help="empty the tables before seeding"
+    )
+    args = parser.parse_args()
+    # Every post has at most one vote per user
+    if args.votes > args.posts * args.users:
+        parser.error(
+            f"--votes {args.votes:,} is more than --posts times --users "
+            f"({args.posts * args.users:,})"
+        )
+    seed(args)
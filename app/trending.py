@@ -0,0 +1,143 @@
+# Import argparse to choose between a refresh and a rebuild from the command line
+import argparse
+
+# Import asyncio to run the background refresh loop
+import asyncio
+
+# Import logging to report failed refreshes
+import logging
+
+# Import math to size the vote window of a rebuild
+import math
+
+# Import SQLModel helpers for building the trending statements
+from sqlmodel import text
+
+# Import AsyncSession for non-blocking database sessions
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+# Import the settings, async engine and response cache getters from the config module
+from .config import get_async_engine, get_response_cache, settings
+
+# Advisory lock key, so only one worker refreshes the feed at a time
+REFRESH_LOCK_KEY = 0x7472656E64
+
+# A trend score decayed to the current time
+DECAYED_SCORE = """
+    score * power(0.5, least(1000, CAST(extract(
+        epoch FROM localtimestamp - updated_at
+    ) AS float) / :half_life))
+    """
+
+# Drop posts whose decayed score fell below the minimum, skipping rows being voted on
+PRUNE_TRENDS_SQL = text(f"""
+    DELETE FROM posttrend WHERE post_id IN (
+        SELECT post_id FROM posttrend
+        WHERE {DECAYED_SCORE} < :min_score
+        FOR UPDATE SKIP LOCKED
+    )
+    """)
+
+# Rank the top posts by decayed score into the trending feed
+RANK_TRENDS_SQL = text(f"""
+    INSERT INTO trendingpost (rank, post_id, score)
+    SELECT row_number() OVER (ORDER BY score DESC, post_id), post_id, score
+    FROM (
+        SELECT post_id, {DECAYED_SCORE} AS score FROM posttrend
+        ORDER BY score DESC, post_id
+        LIMIT :size
+    ) AS top
+    WHERE score >= :min_score
+    """)
+
+# Recompute every trend score from the votes cast within window seconds
+REBUILD_TRENDS_SQL = text("""
+    INSERT INTO posttrend (post_id, score, updated_at)
+    SELECT post_id, sum(power(0.5, CAST(extract(
+        epoch FROM localtimestamp - created_at
+    ) AS float) / :half_life)), localtimestamp
+    FROM vote
+    WHERE created_at > localtimestamp - make_interval(secs => :window)
+    GROUP BY post_id
+    """)
+
+# Logger for trending feed maintenance
+logger = logging.getLogger(__name__)
+
+
+# Function to rebuild the trending feed from the trend scores, returning its size
+async def refresh_trending(session: AsyncSession) -> int | None:
+    # Another worker is already refreshing; its feed will do
+    locked = await session.exec(
+        text("SELECT pg_try_advisory_xact_lock(:key)"),
+        params={"key": REFRESH_LOCK_KEY},
+    )
+    if not locked.one()[0]:
+        await session.rollback()
+        return None
+    params = {
+        "half_life": settings.trending_half_life,
+        "min_score": settings.trending_min_score,
+        "size": settings.trending_size,
+    }
+    await session.exec(PRUNE_TRENDS_SQL, params=params)
+    # Replace the feed in one transaction, so readers see the old or the new one
+    await session.exec(text("DELETE FROM trendingpost"))
+    result = await session.exec(RANK_TRENDS_SQL, params=params)
+    await session.commit()
+    # Drop cached trending pages that show the old ranking
+    get_response_cache().invalidate()
+    return result.rowcount
+
+
+# Function to recompute every trend score from vote times, returning the posts scored
+async def rebuild_trends(session: AsyncSession) -> int:
+    # Block vote writes while recomputing so no vote is missed or counted twice
+    await session.exec(text("LOCK TABLE vote, posttrend IN SHARE ROW EXCLUSIVE MODE"))
+    await session.exec(text("DELETE FROM posttrend"))
+    # Older votes weigh less than the minimum score, so leave them out
+    window = settings.trending_half_life * math.log2(1 / settings.trending_min_score)
+    result = await session.exec(
+        REBUILD_TRENDS_SQL,
+        params={"half_life": settings.trending_half_life, "window": window},
+    )
+    await session.commit()
+    return result.rowcount
+
+
+# Background task that periodically refreshes the trending feed
+async def run_trending_refresh_loop():
+    while True:
+        try:
+            async with AsyncSession(get_async_engine()) as session:
+                await refresh_trending(session)
+        except Exception:
+            # Keep refreshing on the next tick if the database is briefly unavailable
+            logger.exception("Trending feed refresh failed")
+        await asyncio.sleep(settings.trending_refresh_interval)
+
+
+# Allow refreshing from the command line: python -m app.trending [--rebuild]
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Refresh the trending feed.")
+    parser.add_argument(
+        "--rebuild",
+        action="store_true",
+        help="recompute every trend score from vote times first",
+    )
+    args = parser.parse_args()
+
+    # Rebuild the scores if asked, then refresh the feed and report its size
+    async def main():
+        async with AsyncSession(get_async_engine()) as session:
+            if args.rebuild:
+                scored = await rebuild_trends(session)
+                print(f"Rebuilt trend scores of {scored} posts.")
+            ranked = await refresh_trending(session)
+        if ranked is None:
+            print("Another process is refreshing the trending feed.")
+        else:
+            print(f"Refreshed the trending feed, {ranked} posts ranked.")
+        await get_async_engine().dispose()
+
+    asyncio.run(main())
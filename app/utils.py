@@ -1,22 +1,126 @@
+# Import asyncio to await hashing work running in other processes
+import asyncio
+
+# Import time to measure hashing latency during calibration
+import time
+
+# Import ProcessPoolExecutor to run bcrypt outside the web worker's process
+from concurrent.futures import ProcessPoolExecutor
+
+# Import HTTPException and status to push back when the hashing queue is full
+from fastapi import HTTPException, status
+
 # Import the CryptContext class from passlib's context module
 # This class provides methods for password hashing and verification
 from passlib.context import CryptContext
 
-# Create a password context using bcrypt hashing algorithm
+# Import the bcrypt handler to time hashes at arbitrary cost factors
+from passlib.hash import bcrypt
+
+# Import cache to build the password context once, on first use
+from functools import cache
+
+# Import settings for the bcrypt cost and hashing pool limits
+from .config import settings
+
+
+# Function to create the password context using bcrypt hashing algorithm on first use
 # The "deprecated='auto'" parameter allows the use of older hashing schemes
 # when verifying passwords while preferring newer schemes by default
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Hashes made with a different cost than bcrypt_rounds are reported by needs_update
+@cache
+def get_pwd_context() -> CryptContext:
+    return CryptContext(
+        schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=settings.bcrypt_rounds
+    )
 
 
 # Function to verify if a plain text password matches a hashed password
 def verify_password(plain_password, hashed_password):
     # Use the verify method of the password context to check the password
     # Returns True if the plain_password matches the hashed_password
-    return pwd_context.verify(plain_password, hashed_password)
+    return get_pwd_context().verify(plain_password, hashed_password)
 
 
 # Function to generate a hashed password from a plain text password
 def get_password_hash(password):
     # Use the hash method of the password context to create a password hash
     # Returns the hashed version of the input password
-    return pwd_context.hash(password)
+    return get_pwd_context().hash(password)
+
+
+# Function to check whether a stored hash should be replaced with the current cost
+def password_needs_rehash(hashed_password) -> bool:
+    return get_pwd_context().needs_update(hashed_password)
+
+
+# Function to pick the highest bcrypt cost whose hash stays within target_ms
+def calibrate_bcrypt_rounds(target_ms: float) -> int:
+    # Start from bcrypt's minimum cost; each extra round doubles the work
+    rounds = 4
+    while rounds < 31:
+        started = time.perf_counter()
+        bcrypt.using(rounds=rounds + 1).hash("calibration password")
+        if (time.perf_counter() - started) * 1000 > target_ms:
+            break
+        rounds += 1
+    return rounds
+
+
+# Bounded pool of processes that hash and verify passwords off the event loop
+class HashingPool:
+    def __init__(self):
+        # Process pool, created on first use so importing the app stays cheap
+        self.executor: ProcessPoolExecutor | None = None
+        # Number of hashing jobs submitted and not yet finished
+        self.pending = 0
+
+    # Run fn(*args) in the pool, rejecting work when too much is already queued
+    async def run(self, fn, *args):
+        if self.pending >= settings.hash_pool_max_pending:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many concurrent logins, please retry shortly",
+                headers={"Retry-After": "1"},
+            )
+        if settings.hash_pool_workers == 0:
+            return fn(*args)
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=settings.hash_pool_workers)
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, fn, *args)
+        finally:
+            self.pending -= 1
+
+    # Verify a password against its hash in the pool
+    async def verify(self, plain_password, hashed_password) -> bool:
+        return await self.run(verify_password, plain_password, hashed_password)
+
+    # Hash a password in the pool using the configured cost
+    async def hash(self, password) -> str:
+        return await self.run(get_password_hash, password)
+
+    # Stop the worker processes; called from the application lifespan
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.executor = None
+
+
+# Shared hashing pool used by the login and signup endpoints
+hashing_pool = HashingPool()
+
+
+# Allow calibrating the bcrypt cost from the command line: python -m app.utils 250
+if __name__ == "__main__":
+    # Import argparse to read the target latency
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Pick the bcrypt cost for a target hashing latency."
+    )
+    parser.add_argument("target_ms", type=float, help="target latency per hash in ms")
+    args = parser.parse_args()
+    print(f"BCRYPT_ROUNDS={calibrate_bcrypt_rounds(args.target_ms)}")
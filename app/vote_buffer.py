@@ -0,0 +1,199 @@
+# Import asyncio for the in-memory queue and the background flusher
+import asyncio
+
+# Import logging to report failed flushes
+import logging
+
+# Import HTTPException and status to push back on clients when the buffer is full
+from fastapi import HTTPException, status
+
+# Import SQLModel helpers for building the batch statements
+from sqlmodel import text
+
+# Import IntegrityError to detect a batch that raced with a post deletion
+from sqlalchemy.exc import IntegrityError
+
+# Import AsyncSession for non-blocking database sessions
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+# Import the settings and the async engine getter from the config module
+from .config import get_async_engine, settings
+
+# Import the vote counter helper to keep post.votes in step
+from .counters import apply_vote_deltas, invalidate_vote_counts
+
+# Insert many upvotes at once, skipping duplicates and posts that do not exist
+INSERT_VOTES_SQL = text("""
+    INSERT INTO vote (user_id, post_id)
+    SELECT v.user_id, v.post_id
+    FROM unnest(CAST(:user_ids AS integer[]), CAST(:post_ids AS integer[]))
+        AS v(user_id, post_id)
+    WHERE EXISTS (SELECT 1 FROM post WHERE post.id = v.post_id)
+    ON CONFLICT DO NOTHING
+    RETURNING post_id
+    """)
+
+# Delete many votes at once, returning the ones that existed
+DELETE_VOTES_SQL = text("""
+    DELETE FROM vote
+    USING unnest(CAST(:user_ids AS integer[]), CAST(:post_ids AS integer[]))
+        AS v(user_id, post_id)
+    WHERE vote.user_id = v.user_id AND vote.post_id = v.post_id
+    RETURNING vote.post_id
+    """)
+
+# Logger for vote buffer failures
+logger = logging.getLogger(__name__)
+
+
+# Write-behind buffer that acknowledges votes immediately and writes them in batches
+class VoteBuffer:
+    def __init__(self):
+        # Bounded queue of (user_id, post_id, dir) tuples awaiting a flush
+        self.queue: asyncio.Queue | None = None
+        # Background task that flushes the queue
+        self.flusher: asyncio.Task | None = None
+        # Number of accepted votes never written because every flush of them failed
+        self.dropped = 0
+
+    # Start the background flusher; called from the application lifespan
+    def start(self):
+        self.queue = asyncio.Queue(maxsize=settings.vote_buffer_max_size)
+        self.flusher = asyncio.create_task(self.run())
+
+    # Queue a vote, rejecting it with 503 when the buffer is full or not running
+    def submit(self, user_id: int, post_id: int, dir: int):
+        if self.queue is None:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Vote buffer is not running, please retry shortly",
+                headers={"Retry-After": "1"},
+            )
+        try:
+            self.queue.put_nowait((user_id, post_id, dir))
+        except asyncio.QueueFull:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Vote buffer is full, please retry shortly",
+                headers={"Retry-After": "1"},
+            )
+
+    # Flush everything still queued and stop the flusher
+    async def close(self):
+        if self.queue is None:
+            return
+        # The sentinel is queued behind every accepted vote, so they all get written
+        await self.queue.put(None)
+        await self.flusher
+        # Reject votes until the buffer is started again
+        self.queue = self.flusher = None
+
+    # Flush a batch whenever it fills up or the flush interval elapses
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        closing = False
+        while not closing:
+            # Wait for the first vote of the next batch
+            vote = await self.queue.get()
+            if vote is None:
+                return
+            batch = [vote]
+            deadline = loop.time() + settings.vote_buffer_flush_interval
+            # Keep collecting until the batch is full or the deadline passes
+            while len(batch) < settings.vote_buffer_batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    vote = await asyncio.wait_for(self.queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+                if vote is None:
+                    closing = True
+                    break
+                batch.append(vote)
+            await self.flush_with_retries(batch)
+
+    # Flush a batch, writing it again with exponential backoff while it fails. The
+    # votes were already acknowledged, so they are only dropped, and counted, once
+    # every retry failed; meanwhile the queue fills and pushes back on new votes
+    async def flush_with_retries(self, batch: list):
+        for attempt in range(settings.vote_buffer_flush_retries + 1):
+            try:
+                await self.flush(batch)
+                return
+            except Exception:
+                # A failed flush rolled back, so writing the batch again is safe
+                if attempt < settings.vote_buffer_flush_retries:
+                    logger.warning(
+                        "Vote buffer flush failed, retrying %d votes",
+                        len(batch),
+                        exc_info=True,
+                    )
+                    await asyncio.sleep(settings.vote_buffer_retry_delay * 2**attempt)
+                    continue
+                # Keep serving later batches if the database stays unavailable
+                self.dropped += len(batch)
+                logger.exception(
+                    "Vote buffer flush failed %d times, %d votes dropped",
+                    attempt + 1,
+                    len(batch),
+                )
+
+    # Write a batch of votes in one transaction with multi-row statements
+    async def flush(self, batch: list):
+        # Keep only the last vote per (user, post), which decides the final state
+        latest = {(user_id, post_id): dir for user_id, post_id, dir in batch}
+        upvotes = [key for key, dir in latest.items() if dir == 1]
+        removals = [key for key, dir in latest.items() if dir != 1]
+
+        async with AsyncSession(get_async_engine()) as session:
+            try:
+                deltas = await self.write(session, upvotes, removals)
+                await session.commit()
+            except IntegrityError:
+                # A post was deleted mid-flush; retry each vote on its own
+                await session.rollback()
+                deltas = {}
+                for key, dir in latest.items():
+                    try:
+                        async with session.begin_nested():
+                            changes = await self.write(
+                                session,
+                                [key] if dir == 1 else [],
+                                [] if dir == 1 else [key],
+                            )
+                    except IntegrityError:
+                        continue
+                    for post_id, delta in changes.items():
+                        deltas[post_id] = deltas.get(post_id, 0) + delta
+                await session.commit()
+        # Drop cached responses that show the old vote counts
+        invalidate_vote_counts(list(deltas))
+        return deltas
+
+    # Insert and delete the given votes, returning the net count change per post
+    async def write(self, session: AsyncSession, upvotes: list, removals: list):
+        deltas: dict[int, int] = {}
+        for keys, statement, delta in (
+            (upvotes, INSERT_VOTES_SQL, 1),
+            (removals, DELETE_VOTES_SQL, -1),
+        ):
+            if not keys:
+                continue
+            result = await session.exec(
+                statement,
+                params={
+                    "user_ids": [user_id for user_id, _ in keys],
+                    "post_ids": [post_id for _, post_id in keys],
+                },
+            )
+            for (post_id,) in result.all():
+                deltas[post_id] = deltas.get(post_id, 0) + delta
+        # Update the vote counters for the votes that actually changed
+        await apply_vote_deltas(session, deltas)
+        return deltas
+
+
+# Shared vote buffer used by the votes router when buffering is enabled
+vote_buffer = VoteBuffer()
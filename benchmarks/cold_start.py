@@ -0,0 +1,208 @@
+# Cold start benchmark: how long a fresh worker takes from process start to its
+# first successful response. Like the load test it starts a throwaway Postgres
+# cluster and seeds it, then starts the app under uvicorn several times, with and
+# without the startup warm-up. For each start it records the time until
+# /health/ready answers, the time until the first request to --path succeeds and how
+# long that request took, and how long the worker takes to drain and exit after
+# SIGTERM. The import time of app.main is measured in a separate interpreter. Run it
+# from the repository root as a non-root user:
+#
+#     python -m benchmarks.cold_start --runs 5 --output cold_start.json
+#
+# With --max-seconds it exits with status 1 when the median time to the first
+# response with warm-up goes over the budget, so a build can fail on regressions.
+
+# Import argparse to read the benchmark options
+import argparse
+
+# Import json to write the report
+import json
+
+# Import os to build the environment of the app processes
+import os
+
+# Import platform to record where the report was produced
+import platform
+
+# Import statistics for the median of the runs
+import statistics
+
+# Import subprocess to run uvicorn and the import timer
+import subprocess
+
+# Import sys to start the app with the same interpreter
+import sys
+
+# Import time to measure startup and shutdown
+import time
+
+# Import datetime to timestamp the report
+from datetime import datetime, timezone
+
+# Import httpx to poll the app and send the first request
+import httpx
+
+# Reuse the load test's throwaway database, seeding and helpers
+from benchmarks.loadtest import free_port, git_commit, local_postgres, prepare_database
+
+# Program that prints how long importing the app takes, in seconds
+IMPORT_TIMER = (
+    "import time; started = time.perf_counter(); import app.main; "
+    "print(time.perf_counter() - started)"
+)
+
+# Settings that turn the startup warm-up off, for the comparison
+NO_WARMUP = {"DB_WARMUP_CONNECTIONS": "0", "WARMUP_PATHS": "[]"}
+
+
+# Function to start the app once and return its startup and shutdown timings
+def measure_start(env: dict, path: str, timeout: float) -> dict:
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1"]
+        + ["--port", str(port), "--log-level", "warning"],
+        env=env,
+    )
+    try:
+        # Poll readiness; connections are refused until the lifespan has started
+        with httpx.Client(base_url=base_url) as client:
+            while True:
+                try:
+                    if client.get("/health/ready").status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                if process.poll() is not None:
+                    raise SystemExit("The app exited during startup; see above")
+                if time.perf_counter() - started > timeout:
+                    raise SystemExit("The app did not become ready in time")
+                time.sleep(0.005)
+            ready = time.perf_counter() - started
+
+            request_started = time.perf_counter()
+            response = client.get(path)
+            response.raise_for_status()
+            first_response = time.perf_counter() - started
+            first_request = time.perf_counter() - request_started
+
+        # Ask the worker to drain and exit, as a deployment would
+        stopping = time.perf_counter()
+        process.terminate()
+        process.wait(timeout=timeout)
+        stopped = time.perf_counter() - stopping
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+
+    return {
+        "ready_s": ready,
+        "first_response_s": first_response,
+        "first_request_ms": first_request * 1000,
+        "shutdown_s": stopped,
+    }
+
+
+# Function to return the median of each timing over the runs
+def summarize(runs: list[dict]) -> dict:
+    return {key: statistics.median(run[key] for run in runs) for key in runs[0]}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure the time from process start to the first response."
+    )
+    parser.add_argument("--runs", type=int, default=5, help="starts per mode")
+    parser.add_argument("--path", default="/posts/", help="first request")
+    parser.add_argument("--users", type=int, default=100, help="seeded users")
+    parser.add_argument("--posts", type=int, default=5000, help="seeded posts")
+    parser.add_argument("--seed", type=int, default=1, help="random seed")
+    parser.add_argument("--timeout", type=float, default=60, help="seconds per start")
+    parser.add_argument(
+        "--max-seconds",
+        type=float,
+        help="fail when the median time to the first response with warm-up is over",
+    )
+    parser.add_argument("--pg-bin", help="directory with initdb and pg_ctl")
+    parser.add_argument("--output", default="cold_start.json", help="report path")
+    args = parser.parse_args()
+
+    with local_postgres(args.pg_bin) as pg_port:
+        env = {
+            **os.environ,
+            "DATABASE_HOSTNAME": "127.0.0.1",
+            "DATABASE_PORT": str(pg_port),
+            "DATABASE_USERNAME": "postgres",
+            "DATABASE_PASSWORD": "cold-start",
+            "DATABASE_NAME": "postgres",
+            "SECRET_KEY": os.environ.get("SECRET_KEY", "cold-start-secret"),
+            "ALGORITHM": os.environ.get("ALGORITHM", "HS256"),
+            "ACCESS_TOKEN_EXPIRE_MINUTES": "600",
+            "LOG_LEVEL": os.environ.get("LOG_LEVEL", "WARNING"),
+            # Measure the drain itself, not the wait for load balancers to notice
+            "SHUTDOWN_DRAIN_DELAY": "0",
+        }
+        prepare_database(env, args.users, args.posts, args.seed)
+
+        imports = [
+            float(
+                subprocess.run(
+                    [sys.executable, "-c", IMPORT_TIMER],
+                    env=env,
+                    capture_output=True,
+                    text=True,
+                    check=True,
+                ).stdout
+            )
+            for _ in range(args.runs)
+        ]
+        # Alternate the modes so drift in the machine's load hits both alike
+        runs = {"warmup": [], "no_warmup": []}
+        for _ in range(args.runs):
+            runs["warmup"].append(measure_start(env, args.path, args.timeout))
+            runs["no_warmup"].append(
+                measure_start({**env, **NO_WARMUP}, args.path, args.timeout)
+            )
+
+    results = {
+        "import_s": statistics.median(imports),
+        "modes": {mode: summarize(mode_runs) for mode, mode_runs in runs.items()},
+        "runs": runs,
+    }
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "options": {
+                key: value for key, value in vars(args).items() if key != "output"
+            },
+        },
+        **results,
+    }
+    with open(args.output, "w") as report_file:
+        json.dump(report, report_file, indent=2, sort_keys=True)
+        report_file.write("\n")
+
+    # Print a short table alongside the full report
+    print(f"import app.main {results['import_s']:.3f}s (median)")
+    print(f"{'mode':10} {'ready s':>9} {'first s':>9} {'first ms':>9} {'stop s':>9}")
+    for mode, summary in results["modes"].items():
+        print(
+            f"{mode:10} {summary['ready_s']:9.3f} {summary['first_response_s']:9.3f} "
+            f"{summary['first_request_ms']:9.1f} {summary['shutdown_s']:9.3f}"
+        )
+    print(f"Report written to {args.output}")
+
+    budget = args.max_seconds
+    first_response = results["modes"]["warmup"]["first_response_s"]
+    if budget is not None and first_response > budget:
+        print(f"FAIL first response after {first_response:.3f}s, budget {budget}s")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
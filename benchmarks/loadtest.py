@@ -0,0 +1,519 @@
+# Reproducible HTTP load test for the whole API. The harness starts a throwaway
+# Postgres cluster (initdb/pg_ctl), creates the schema, seeds users and posts,
+# starts the app under uvicorn, logs every virtual user in through /login and then
+# runs a weighted mix of requests for a fixed duration. It writes a JSON report
+# with per-endpoint throughput and p50/p95/p99 latency, meant to be diffed between
+# commits. Run it from the repository root as a non-root user:
+#
+#     python -m benchmarks.loadtest --duration 30 --concurrency 32 \
+#         --mix list=55,search=15,create=15,vote=15 --output loadtest.json
+#
+# The bulk endpoints are compared with the single-item ones by their share of the
+# mix, e.g. --mix list=55,create=10,bulk_create=5,vote=20,bulk_vote=10. The login
+# operation measures password hashing, e.g. with HASH_POOL_WORKERS=0 against the
+# default process pool.
+#
+# Application settings are passed through from the environment or set with --env,
+# which also records them in the report, so the same harness compares
+# configurations as well as commits:
+#
+#     python -m benchmarks.loadtest --mix vote=100 --env VOTE_BUFFER_ENABLED=true
+#
+# With --app-ref the app runs from a temporary git worktree of that commit while
+# the harness stays the current one, e.g. the sync baseline against the async stack:
+#
+#     python -m benchmarks.loadtest --app-ref 775338c --ready-path /health \
+#         --mix list=55,create=15,vote=15 --output sync.json
+
+# Import argparse to read the load test options
+import argparse
+
+# Import asyncio to run the virtual users concurrently
+import asyncio
+
+# Import json to write the report
+import json
+
+# Import os to build the environment of the database and app processes
+import os
+
+# Import platform to record where the report was produced
+import platform
+
+# Import random to pick requests reproducibly from the mix
+import random
+
+# Import shutil to find the Postgres binaries and remove the cluster afterwards
+import shutil
+
+# Import socket to pick free ports
+import socket
+
+# Import subprocess to run Postgres and uvicorn
+import subprocess
+
+# Import sys to start the app with the same interpreter
+import sys
+
+# Import tempfile for the throwaway cluster directory
+import tempfile
+
+# Import time to measure latency and throughput
+import time
+
+# Import contextmanager to tear down the processes reliably
+from contextlib import contextmanager
+
+# Import datetime to timestamp the report
+from datetime import datetime, timezone
+
+# Import httpx as the async HTTP client
+import httpx
+
+# Import psycopg to create and seed the benchmark database
+import psycopg
+
+# Import bcrypt to precompute the shared password hash of the seeded users
+from passlib.hash import bcrypt
+
+# Requests the mix can contain, with the default weight of each; bulk_create and
+# bulk_vote send BULK_ITEMS items per request and, like login, are off unless given
+# a weight
+DEFAULT_MIX = "list=55,search=15,create=15,vote=15"
+
+# Items sent in each bulk request of the mix
+BULK_ITEMS = 20
+
+# Words used for post content and search terms
+WORDS = (
+    "alpha bravo charlie delta echo foxtrot golf hotel india juliet kilo lima "
+    "mike november oscar papa quebec romeo sierra tango uniform victor whiskey"
+).split()
+
+# Password shared by every seeded user
+PASSWORD = "loadtest-password"
+
+
+# Function to return the email of the seeded user number i
+def user_email(i: int) -> str:
+    return f"user{i}@loadtest.example.com"
+
+
+# Function to return a TCP port nothing is listening on
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+# Function to parse "list=55,search=15" into {"list": 55, "search": 15}
+def parse_mix(mix: str) -> dict[str, int]:
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        if name not in OPERATIONS:
+            raise SystemExit(f"Unknown request type in --mix: {name}")
+        weights[name] = int(weight)
+    return weights
+
+
+# Function to find a Postgres binary in --pg-bin, on PATH, or via pg_config
+def pg_binary(name: str, pg_bin: str | None) -> str:
+    if pg_bin:
+        return os.path.join(pg_bin, name)
+    found = shutil.which(name)
+    if found:
+        return found
+    pg_config = shutil.which("pg_config")
+    if pg_config:
+        bindir = subprocess.run(
+            [pg_config, "--bindir"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+        return os.path.join(bindir, name)
+    raise SystemExit(f"{name} not found; install Postgres or pass --pg-bin")
+
+
+# Start a throwaway Postgres cluster and yield its port
+@contextmanager
+def local_postgres(pg_bin: str | None):
+    if hasattr(os, "geteuid") and os.geteuid() == 0:
+        raise SystemExit("Postgres refuses to run as root; run the load test as a user")
+    directory = tempfile.mkdtemp(prefix="loadtest-pg-")
+    data = os.path.join(directory, "data")
+    port = free_port()
+    subprocess.run(
+        [pg_binary("initdb", pg_bin), "-D", data, "-U", "postgres"]
+        + ["--auth=trust", "--encoding=UTF8", "--no-sync"],
+        check=True,
+        capture_output=True,
+    )
+    subprocess.run(
+        [pg_binary("pg_ctl", pg_bin), "-D", data, "-w", "-l"]
+        + [os.path.join(directory, "postgres.log"), "start", "-o"]
+        + [f"-p {port} -k {directory} -c listen_addresses=127.0.0.1 -c fsync=off"],
+        check=True,
+        capture_output=True,
+    )
+    try:
+        yield port
+    finally:
+        subprocess.run(
+            [pg_binary("pg_ctl", pg_bin), "-D", data, "-m", "fast", "stop"],
+            capture_output=True,
+        )
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+# Check out ref into a temporary git worktree and yield its directory, or yield the
+# current directory when no ref is given
+@contextmanager
+def app_checkout(ref: str | None):
+    if ref is None:
+        yield os.getcwd()
+        return
+    directory = tempfile.mkdtemp(prefix="loadtest-app-")
+    subprocess.run(
+        ["git", "worktree", "add", "--detach", directory, ref],
+        check=True,
+        capture_output=True,
+    )
+    try:
+        yield directory
+    finally:
+        subprocess.run(
+            ["git", "worktree", "remove", "--force", directory], capture_output=True
+        )
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+# Function to create the schema and seed users and posts, returning the user emails
+def prepare_database(
+    env: dict, users: int, posts: int, seed: int, app_dir: str | None = None
+) -> list[str]:
+    # Create the schema the same way the app does, in a separate interpreter
+    subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "from app.database import create_db_and_tables as c; c()",
+        ],
+        env=env,
+        cwd=app_dir,
+        check=True,
+    )
+    rng = random.Random(seed)
+    emails = [user_email(i) for i in range(users)]
+    # Every user shares one hash, computed once at the app's default cost
+    hashed = bcrypt.using(rounds=int(env.get("BCRYPT_ROUNDS", 12))).hash(PASSWORD)
+    with psycopg.connect(
+        host="127.0.0.1",
+        port=env["DATABASE_PORT"],
+        user=env["DATABASE_USERNAME"],
+        dbname=env["DATABASE_NAME"],
+    ) as conn:
+        with conn.cursor() as cursor:
+            cursor.executemany(
+                "INSERT INTO users (email, password, phone_num, created_at) "
+                "VALUES (%s, %s, '', now())",
+                [(email, hashed) for email in emails],
+            )
+            cursor.executemany(
+                "INSERT INTO post (title, content, published, created_at, owner_id) "
+                "VALUES (%s, %s, true, now() - make_interval(secs => %s), %s)",
+                [
+                    (
+                        " ".join(rng.sample(WORDS, 3)),
+                        " ".join(rng.choices(WORDS, k=30)),
+                        rng.random() * 86400 * 30,
+                        rng.randint(1, users),
+                    )
+                    for _ in range(posts)
+                ],
+            )
+    return emails
+
+
+# Start the app under uvicorn and yield its base URL once ready_path answers 200
+@contextmanager
+def app_server(
+    env: dict,
+    workers: int,
+    app_dir: str | None = None,
+    ready_path: str = "/health/ready",
+):
+    port = free_port()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1"]
+        + ["--port", str(port), "--workers", str(workers), "--log-level", "warning"],
+        env=env,
+        cwd=app_dir,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                if httpx.get(f"{base_url}{ready_path}").status_code == 200:
+                    break
+            except httpx.TransportError:
+                pass
+            if process.poll() is not None or time.monotonic() > deadline:
+                raise SystemExit("The app did not start; see its output above")
+            time.sleep(0.2)
+        yield base_url
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+
+# Request builders for each type in the mix; each returns (method, url, kwargs)
+def list_posts(rng, args):
+    return "GET", f"/posts/?limit=20&offset={rng.randrange(0, 200, 20)}", {}
+
+
+def search_posts(rng, args):
+    return "GET", f"/posts/?limit=20&search={rng.choice(WORDS)}", {}
+
+
+def post_body(rng):
+    return {
+        "title": " ".join(rng.sample(WORDS, 3)),
+        "content": " ".join(rng.choices(WORDS, k=30)),
+        "published": True,
+    }
+
+
+def create_post(rng, args):
+    return "POST", "/posts/", {"json": post_body(rng)}
+
+
+def create_posts_bulk(rng, args):
+    body = [post_body(rng) for _ in range(BULK_ITEMS)]
+    return "POST", "/posts/bulk", {"json": body}
+
+
+def vote(rng, args):
+    body = {"post_id": rng.randint(1, args.posts), "dir": rng.choice((0, 1))}
+    return "POST", "/votes/", {"json": body}
+
+
+def vote_bulk(rng, args):
+    post_ids = rng.sample(range(1, args.posts + 1), min(BULK_ITEMS, args.posts))
+    body = [{"post_id": post_id, "dir": rng.choice((0, 1))} for post_id in post_ids]
+    return "POST", "/votes/bulk", {"json": body}
+
+
+def log_in(rng, args):
+    form = {"username": user_email(rng.randrange(args.users)), "password": PASSWORD}
+    return "POST", "/login", {"data": form}
+
+
+OPERATIONS = {
+    "list": list_posts,
+    "search": search_posts,
+    "create": create_post,
+    "bulk_create": create_posts_bulk,
+    "vote": vote,
+    "bulk_vote": vote_bulk,
+    "login": log_in,
+}
+
+
+# Function to log in as email and return its bearer token
+async def login(client: httpx.AsyncClient, email: str) -> str:
+    response = await client.post(
+        "/login", data={"username": email, "password": PASSWORD}
+    )
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+
+# Run the mix until the deadline, appending (operation, seconds, status) samples
+async def virtual_user(client, token, rng, weights, args, deadline, samples):
+    names, values = list(weights), list(weights.values())
+    headers = {"Authorization": f"Bearer {token}"}
+    while time.perf_counter() < deadline:
+        name = rng.choices(names, weights=values)[0]
+        method, url, kwargs = OPERATIONS[name](rng, args)
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, url, headers=headers, **kwargs)
+            status = response.status_code
+        except httpx.TransportError:
+            status = 0
+        samples.append((name, time.perf_counter() - started, status))
+
+
+# Function to return the nearest-rank percentile of sorted values
+def percentile(values: list[float], fraction: float) -> float:
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+# Function to summarize latency samples for one endpoint; latencies are null when
+# no request finished in time
+def summarize(samples: list, duration: float) -> dict:
+    latencies = sorted(seconds * 1000 for _, seconds, _ in samples)
+    statuses: dict[str, int] = {}
+    for _, _, status in samples:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    latency_ms = dict.fromkeys(("p50", "p95", "p99", "mean", "max"))
+    if latencies:
+        latency_ms = {
+            "p50": round(percentile(latencies, 0.50), 3),
+            "p95": round(percentile(latencies, 0.95), 3),
+            "p99": round(percentile(latencies, 0.99), 3),
+            "mean": round(sum(latencies) / len(latencies), 3),
+            "max": round(latencies[-1], 3),
+        }
+    return {
+        "requests": len(samples),
+        "throughput_rps": round(len(samples) / duration, 2),
+        "errors": sum(1 for _, _, status in samples if status == 0 or status >= 500),
+        "statuses": statuses,
+        "latency_ms": latency_ms,
+    }
+
+
+# Log in every virtual user, run the mix and return the per-endpoint report
+async def run_load(base_url, emails, args, weights) -> dict:
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(
+        base_url=base_url, limits=limits, timeout=30
+    ) as client:
+        tokens = await asyncio.gather(
+            *(login(client, emails[i % len(emails)]) for i in range(args.concurrency))
+        )
+        # Warm up caches and connection pools before measuring
+        samples: list = []
+        deadline = time.perf_counter() + args.warmup
+        await asyncio.gather(
+            *(
+                virtual_user(
+                    client, token, random.Random(i), weights, args, deadline, []
+                )
+                for i, token in enumerate(tokens)
+            )
+        )
+        started = time.perf_counter()
+        deadline = started + args.duration
+        await asyncio.gather(
+            *(
+                virtual_user(
+                    client,
+                    token,
+                    random.Random(args.seed + i),
+                    weights,
+                    args,
+                    deadline,
+                    samples,
+                )
+                for i, token in enumerate(tokens)
+            )
+        )
+        duration = time.perf_counter() - started
+
+    by_operation: dict[str, list] = {}
+    for sample in samples:
+        by_operation.setdefault(sample[0], []).append(sample)
+    # Report every operation in the mix, including any that recorded no samples
+    return {
+        "endpoints": {
+            name: summarize(by_operation.get(name, []), duration)
+            for name in sorted(weights)
+        },
+        "total": summarize(samples, duration),
+    }
+
+
+# Function to return the commit checked out in directory (by default the current
+# one), if it is a git checkout
+def git_commit(directory: str | None = None) -> str | None:
+    result = subprocess.run(
+        ["git", "rev-parse", "HEAD"], capture_output=True, text=True, cwd=directory
+    )
+    return result.stdout.strip() or None
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Load test the API against a throwaway local Postgres."
+    )
+    parser.add_argument("--duration", type=float, default=30, help="seconds measured")
+    parser.add_argument("--warmup", type=float, default=5, help="seconds not measured")
+    parser.add_argument("--concurrency", type=int, default=32, help="virtual users")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="weighted request mix")
+    parser.add_argument("--users", type=int, default=100, help="seeded users")
+    parser.add_argument("--posts", type=int, default=5000, help="seeded posts")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers")
+    parser.add_argument("--seed", type=int, default=1, help="random seed")
+    parser.add_argument(
+        "--env",
+        action="append",
+        default=[],
+        metavar="NAME=VALUE",
+        help="app setting for this run, recorded in the report (repeatable)",
+    )
+    parser.add_argument("--app-ref", help="git commit to run the app from")
+    parser.add_argument(
+        "--ready-path",
+        default="/health/ready",
+        help="path that answers 200 once the app serves (/health before readiness)",
+    )
+    parser.add_argument("--pg-bin", help="directory with initdb and pg_ctl")
+    parser.add_argument("--output", default="loadtest.json", help="report path")
+    args = parser.parse_args()
+    weights = parse_mix(args.mix)
+
+    with app_checkout(args.app_ref) as app_dir, local_postgres(args.pg_bin) as pg_port:
+        env = {
+            **os.environ,
+            "DATABASE_HOSTNAME": "127.0.0.1",
+            "DATABASE_PORT": str(pg_port),
+            "DATABASE_USERNAME": "postgres",
+            "DATABASE_PASSWORD": "loadtest",
+            "DATABASE_NAME": "postgres",
+            "SECRET_KEY": os.environ.get("SECRET_KEY", "loadtest-secret"),
+            "ALGORITHM": os.environ.get("ALGORITHM", "HS256"),
+            "ACCESS_TOKEN_EXPIRE_MINUTES": "600",
+            "LOG_LEVEL": os.environ.get("LOG_LEVEL", "WARNING"),
+            **dict(setting.split("=", 1) for setting in args.env),
+        }
+        emails = prepare_database(env, args.users, args.posts, args.seed, app_dir)
+        with app_server(env, args.workers, app_dir, args.ready_path) as base_url:
+            results = asyncio.run(run_load(base_url, emails, args, weights))
+        app_commit = git_commit(app_dir)
+
+    report = {
+        "meta": {
+            "commit": app_commit,
+            "harness_commit": git_commit(),
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "options": {
+                key: value for key, value in vars(args).items() if key != "output"
+            },
+            "mix": weights,
+        },
+        **results,
+    }
+    with open(args.output, "w") as report_file:
+        json.dump(report, report_file, indent=2, sort_keys=True)
+        report_file.write("\n")
+
+    # Print a short table alongside the full report
+    print(f"{'endpoint':12} {'req/s':>10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for name, summary in {**results["endpoints"], "total": results["total"]}.items():
+        latency = [
+            "-" if value is None else f"{value:.2f}"
+            for value in (summary["latency_ms"][key] for key in ("p50", "p95", "p99"))
+        ]
+        print(
+            f"{name:12} {summary['throughput_rps']:10.1f} {latency[0]:>9} "
+            f"{latency[1]:>9} {latency[2]:>9}"
+        )
+    print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+# Measure how much request throughput per-request print() diagnostics cost compared
+# with the queue-backed logging in app.log. Run it from the repository root with
+# stdout going where it goes in production, e.g. a pipe to a log collector:
+#
+#     python -m benchmarks.logging_overhead --requests 5000 | cat > /dev/null
+#
+# Results are written to stderr so they survive the redirection.
+
+# Import argparse to read the benchmark options
+import argparse
+
+# Import asyncio to drive the requests concurrently
+import asyncio
+
+# Import logging to exercise the same calls the application makes
+import logging
+
+# Import sys to report results on stderr
+import sys
+
+# Import time to measure throughput
+import time
+
+# Import httpx to call the application in process through its ASGI interface
+import httpx
+
+# Import FastAPI to build the two variants of the endpoint
+from fastapi import FastAPI
+
+# Import the queue-backed logging setup used by the application
+from app.log import setup_logging, shutdown_logging
+
+# A realistic bearer token and decoded payload, as printed by the old diagnostics
+TOKEN = (
+    "eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9."
+    "eyJpZCI6MSwiZXhwIjoxNzkyMjk5MTMyLCJzdWIiOiIxIn0."
+    "RIgU1mYEu37ZAxaH7Gx1aCAghMFYAcTNvuC0DCYmgQI"
+)
+PAYLOAD = {"id": 1, "exp": 1792299132, "sub": "1"}
+
+app = FastAPI()
+logger = logging.getLogger("app.config")
+
+
+# The diagnostics get_current_user and create_post used to print on every request
+@app.get("/print")
+async def with_print():
+    print(f"Decoding token: {TOKEN}")
+    print(f"Decoded payload: {PAYLOAD}")
+    print(f"Querying user with ID: {PAYLOAD['id']}")
+    print("Authenticated user: user@example.com")
+    print("user@example.com")
+    return {"ok": True}
+
+
+# The same request with the sampled debug record that replaced them
+@app.get("/log")
+async def with_logging():
+    logger.debug("Authenticated user %s", PAYLOAD["id"], extra={"sampled": True})
+    return {"ok": True}
+
+
+# The request with no diagnostics at all, as a ceiling
+@app.get("/none")
+async def without_diagnostics():
+    return {"ok": True}
+
+
+# Function to send requests to path with the given concurrency, returning requests/s
+async def measure(path: str, requests: int, concurrency: int) -> float:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://bench"
+    ) as client:
+        remaining = iter(range(requests))
+
+        async def worker():
+            for _ in remaining:
+                response = await client.get(path)
+                response.raise_for_status()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return requests / (time.perf_counter() - started)
+
+
+async def main():
+    parser = argparse.ArgumentParser(
+        description="Compare request throughput with print() and queued logging."
+    )
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+
+    setup_logging()
+    # Keep the client's own per-request records out of the measurement
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    # Warm up the app once so the first variant is not charged for it
+    await measure("/none", 100, 10)
+    results = {}
+    for path in ("/none", "/log", "/print"):
+        results[path] = await measure(path, args.requests, args.concurrency)
+    shutdown_logging()
+
+    baseline = results["/none"]
+    for path, rate in results.items():
+        cost = (1 - rate / baseline) * 100
+        print(
+            f"{path:8} {rate:10.0f} req/s  {cost:5.1f}% below baseline", file=sys.stderr
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
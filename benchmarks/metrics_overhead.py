@@ -0,0 +1,67 @@
+# Measure the per-request cost of MetricsMiddleware by calling a bare ASGI app
+# directly, with and without the middleware, so no network or framework time is
+# included. Run it from the repository root:
+#
+#     python -m benchmarks.metrics_overhead --requests 200000
+
+# Import argparse to read the benchmark options
+import argparse
+
+# Import asyncio to drive the ASGI calls
+import asyncio
+
+# Import time to measure elapsed time
+import time
+
+# Import the middleware under test
+from app.metrics import MetricsMiddleware
+
+
+# Stand-in for a matched route, as FastAPI stores it in the scope
+class Route:
+    path = "/posts/{post_id}"
+
+
+# Minimal ASGI app that matches a route and sends an empty 200 response
+async def endpoint(scope, receive, send):
+    scope["route"] = Route
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b""})
+
+
+async def receive():
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+
+async def send(message):
+    pass
+
+
+# Function to return the mean time per request for app, in microseconds
+async def measure(app, requests: int) -> float:
+    started = time.perf_counter()
+    for _ in range(requests):
+        await app({"type": "http", "method": "GET", "path": "/posts/1"}, receive, send)
+    return (time.perf_counter() - started) / requests * 1e6
+
+
+async def main():
+    parser = argparse.ArgumentParser(
+        description="Measure the per-request overhead of the metrics middleware."
+    )
+    parser.add_argument("--requests", type=int, default=200000)
+    args = parser.parse_args()
+
+    middleware = MetricsMiddleware(endpoint)
+    # Warm up both paths before measuring
+    await measure(endpoint, 1000)
+    await measure(middleware, 1000)
+    bare = await measure(endpoint, args.requests)
+    instrumented = await measure(middleware, args.requests)
+    print(f"without middleware {bare:8.2f} us/request")
+    print(f"with middleware    {instrumented:8.2f} us/request")
+    print(f"overhead           {instrumented - bare:8.2f} us/request")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,182 @@
+# Shared fixtures for the test suite. The tests run the whole app in-process against
+# a real Postgres, configured through the usual DATABASE_* variables (or .env). They
+# use a separate database, DATABASE_NAME with a "_test" suffix unless
+# TEST_DATABASE_NAME is set, which is created on first use and emptied before every
+# test, so a development database is never touched. Run them from the repository
+# root:
+#
+#     python -m pytest -q
+
+# Import asyncio to send requests concurrently
+import asyncio
+
+# Import os to point the app at the test database before its settings are read
+import os
+
+# Import httpx to send concurrent requests to the app in-process
+import httpx
+
+# Import psycopg to create the test database
+import psycopg
+
+# Import pytest for fixtures
+import pytest
+
+# Import SQLModel and text to create and empty the tables
+from sqlmodel import SQLModel, text
+
+# Import TestClient to drive the API in-process
+from fastapi.testclient import TestClient
+
+# Import the settings, engine, caches and token helper from the config module
+from app import config
+
+# Fast password hashes and no warm-up requests keep the suite quick, and bursts of
+# concurrent requests are served rather than shed
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+os.environ.setdefault("WARMUP_PATHS", "[]")
+os.environ.setdefault("ADMISSION_CONTROL_ENABLED", "false")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+# Use the test database from here on; the settings are read again on next use
+os.environ["DATABASE_NAME"] = (
+    os.environ.get("TEST_DATABASE_NAME") or f"{config.Settings().database_name}_test"
+)
+config.get_settings.cache_clear()
+
+# Import the app only once the settings point at the test database
+from app.main import app  # noqa: E402
+from app.utils import get_password_hash  # noqa: E402
+
+# Password of every user created by make_users
+PASSWORD = "test-password"
+
+# Tables emptied before every test
+TABLES = "users, post, vote, votecountshard, posttrend, trendingpost"
+
+
+# Add the option that records the current query plans as the baseline
+def pytest_addoption(parser):
+    parser.addoption(
+        "--update-plans",
+        action="store_true",
+        help="record the current query plans in tests/explain_baseline.json",
+    )
+
+
+# Function to create the test database if it does not exist yet
+def create_test_database():
+    settings = config.get_settings()
+    with psycopg.connect(
+        host=settings.database_hostname,
+        port=settings.database_port,
+        user=settings.database_username,
+        password=settings.database_password,
+        dbname="postgres",
+        autocommit=True,
+    ) as conn:
+        exists = conn.execute(
+            "SELECT 1 FROM pg_database WHERE datname = %s", (settings.database_name,)
+        ).fetchone()
+        if not exists:
+            conn.execute(f'CREATE DATABASE "{settings.database_name}"')
+
+
+# Create a fresh schema once per test run
+@pytest.fixture(scope="session", autouse=True)
+def database():
+    create_test_database()
+    engine = config.get_engine()
+    SQLModel.metadata.drop_all(engine)
+    SQLModel.metadata.create_all(engine)
+    yield engine
+
+
+# Start the app once, with its lifespan, for every test
+@pytest.fixture(scope="session")
+def client(database):
+    with TestClient(app) as client:
+        yield client
+
+
+# Empty the tables and in-process caches before every test
+@pytest.fixture(autouse=True)
+def clean(database):
+    with database.begin() as conn:
+        conn.execute(text(f"TRUNCATE {TABLES} RESTART IDENTITY CASCADE"))
+    config.get_response_cache().clear()
+    config.get_user_cache().data.clear()
+    config.get_token_cache().data.clear()
+
+
+# Function to create users sharing PASSWORD, returning their IDs
+@pytest.fixture
+def make_users(database):
+    hashed = get_password_hash(PASSWORD)
+
+    def make(count: int) -> list[int]:
+        with database.begin() as conn:
+            return list(
+                conn.execute(
+                    text(
+                        "INSERT INTO users (email, password, phone_num, created_at) "
+                        "SELECT 'user' || i || '@example.com', :password, '', now() "
+                        "FROM generate_series(1, :count) AS i RETURNING id"
+                    ),
+                    {"password": hashed, "count": count},
+                ).scalars()
+            )
+
+    return make
+
+
+# Function to create posts owned by a user, returning their IDs
+@pytest.fixture
+def make_posts(database):
+    def make(owner_id: int, count: int) -> list[int]:
+        with database.begin() as conn:
+            return list(
+                conn.execute(
+                    text(
+                        "INSERT INTO post (title, content, published, created_at, "
+                        "owner_id) SELECT 'post ' || i, 'content of post ' || i, "
+                        "true, now() - make_interval(secs => i), :owner_id "
+                        "FROM generate_series(1, :count) AS i RETURNING id"
+                    ),
+                    {"owner_id": owner_id, "count": count},
+                ).scalars()
+            )
+
+    return make
+
+
+# Function to return the Authorization header of a user
+@pytest.fixture
+def auth():
+    def headers(user_id: int) -> dict[str, str]:
+        token = config.create_access_token({"id": user_id})
+        return {"Authorization": f"Bearer {token}"}
+
+    return headers
+
+
+# Function to send requests to the app concurrently, on the app's own event loop so
+# they share its connection pools, returning the responses in order
+@pytest.fixture
+def send_concurrently(client):
+    def send(requests: list[tuple]) -> list[httpx.Response]:
+        async def send_all():
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(
+                transport=transport, base_url="http://testserver"
+            ) as async_client:
+                return await asyncio.gather(
+                    *(
+                        async_client.request(method, url, **kwargs)
+                        for method, url, kwargs in requests
+                    )
+                )
+
+        return client.portal.call(send_all)
+
+    return send
@@ -0,0 +1,163 @@
+# Admission control tests: which requests an overloaded worker sheds, what the 503
+# looks like to browsers and metrics, and how the concurrency limit adapts
+
+# Import time to move the admission window along
+import time
+
+# Import pytest for fixtures and parametrization
+import pytest
+
+# Import the admission module to swap in a controller with a known state
+from app import admission
+
+# Import the settings getter to switch admission control on
+from app.config import get_settings
+
+# Import the request metrics to find the rejected requests
+from app.metrics import request_metrics
+
+# Requests an overloaded worker keeps serving, and the ones it sheds first
+CRITICAL_REQUESTS = [
+    ("GET", "/health", {}),
+    ("POST", "/login", {"data": {"username": "x@example.com", "password": "x"}}),
+]
+LOW_REQUESTS = [
+    ("GET", "/posts/export", {}),
+    ("GET", "/posts/", {"params": {"search": "python"}}),
+]
+
+
+# Switch admission control on with a fresh controller for one test
+@pytest.fixture
+def controller(monkeypatch):
+    monkeypatch.setattr(get_settings(), "admission_control_enabled", True)
+    controller = admission.AdmissionController()
+    # Half of admission_max_in_flight, leaving room for critical requests
+    controller.limit = 100
+    # Count pool waits from zero rather than from earlier tests
+    controller.pool_totals = (0.0, 0, 0)
+    monkeypatch.setattr(admission, "admission_controller", controller)
+    return controller
+
+
+# Function to close the controller's window with the given pool counters
+def close_window(controller, totals, monkeypatch):
+    monkeypatch.setattr(controller, "read_pool_totals", lambda: totals)
+    controller.adjust(controller.window_started + get_settings().admission_window)
+
+
+@pytest.mark.parametrize("method, url, kwargs", CRITICAL_REQUESTS)
+def test_overloaded_worker_serves_critical_requests(
+    client, controller, method, url, kwargs
+):
+    controller.overloaded = True
+    # Every normal slot is taken as well
+    controller.in_flight = controller.limit
+
+    response = client.request(method, url, **kwargs)
+
+    assert response.status_code != 503
+
+
+@pytest.mark.parametrize("method, url, kwargs", LOW_REQUESTS)
+def test_overloaded_worker_sheds_low_priority_requests(
+    client, controller, method, url, kwargs
+):
+    controller.overloaded = True
+
+    response = client.request(method, url, **kwargs)
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+    assert controller.rejected[admission.LOW] == 1
+    # Plain listings still fit under the limit
+    assert client.get("/posts/").status_code == 200
+
+
+def test_full_worker_sheds_normal_requests(client, controller):
+    controller.in_flight = controller.limit
+
+    assert client.get("/posts/").status_code == 503
+    assert client.get("/health").status_code == 200
+
+
+def test_shed_response_has_cors_headers(client, controller):
+    controller.overloaded = True
+
+    response = client.get("/posts/export", headers={"Origin": "https://example.com"})
+
+    assert response.status_code == 503
+    assert response.headers["Access-Control-Allow-Origin"] == "*"
+
+
+def test_shed_response_is_counted_under_its_route(client, controller):
+    controller.overloaded = True
+    key = ("GET", "/posts/{post_id}", 503)
+    before = request_metrics.requests.get(key, 0)
+
+    controller.in_flight = controller.limit
+    assert client.get("/posts/1").status_code == 503
+
+    assert request_metrics.requests.get(key, 0) == before + 1
+
+
+def test_limit_shrinks_when_checkouts_wait(controller, monkeypatch):
+    settings = get_settings()
+    controller.peak_in_flight = 100
+    # 10 checkouts waited 0.2s each on average, over the target delay
+    close_window(controller, (2.0, 10, 0), monkeypatch)
+
+    assert controller.overloaded
+    assert controller.limit == 75
+    assert not controller.admit(admission.LOW, None)
+
+    # It never drops below the connections the pool can hand out
+    controller.peak_in_flight = 0
+    close_window(controller, (4.0, 20, 0), monkeypatch)
+    assert controller.limit == settings.db_pool_size + settings.db_max_overflow
+
+
+def test_limit_shrinks_on_checkout_timeouts(controller, monkeypatch):
+    controller.peak_in_flight = 100
+    close_window(controller, (0.0, 1, 1), monkeypatch)
+
+    assert controller.overloaded
+    assert controller.limit == 75
+
+
+def test_limit_shrinks_when_the_proxy_queues(controller, monkeypatch):
+    controller.peak_in_flight = 100
+    # The proxy held a request for a second before passing it on
+    controller.admit(admission.NORMAL, 1.0)
+    controller.release()
+    close_window(controller, (0.0, 0, 0), monkeypatch)
+
+    assert controller.overloaded
+    assert controller.limit == 75
+
+
+def test_limit_grows_when_requests_reach_it(controller, monkeypatch):
+    settings = get_settings()
+    monkeypatch.setattr(settings, "admission_max_in_flight", 210)
+    controller.overloaded = True
+    controller.peak_in_flight = 100
+    close_window(controller, (0.0, 10, 0), monkeypatch)
+
+    assert not controller.overloaded
+    assert controller.limit == 105
+
+    # Growth stops at admission_max_in_flight
+    controller.limit = 205
+    controller.peak_in_flight = 205
+    close_window(controller, (0.0, 20, 0), monkeypatch)
+    assert controller.limit == 210
+
+
+def test_limit_holds_while_the_window_is_open(controller, monkeypatch):
+    controller.peak_in_flight = 100
+    monkeypatch.setattr(controller, "read_pool_totals", lambda: (2.0, 10, 0))
+
+    controller.adjust(time.monotonic())
+
+    assert not controller.overloaded
+    assert controller.limit == 100
@@ -0,0 +1,158 @@
+# Authentication tests: the password check runs without a pooled connection checked
+# out, hashes made with an outdated cost are upgraded on login, verified tokens are
+# cached by digest only until they expire, and changed users are not served stale
+# from the authenticated-user cache
+
+# Import time to wait for a token to expire
+import time
+
+# Import timedelta to issue short-lived tokens
+from datetime import timedelta
+
+# Import jwt to read a token's expiry
+import jwt
+
+# Import text to read the stored hash back
+from sqlmodel import text
+
+# Import the token helper, async engine and cache getters
+from app.config import (
+    create_access_token,
+    get_async_engine,
+    get_token_cache,
+    get_user_cache,
+)
+
+# Import the Users model to plant a stale cache entry
+from app.models import Users
+
+# Import the hashing pool whose verify is watched, and the rehash check
+from app.utils import get_pwd_context, hashing_pool, password_needs_rehash
+
+# Import the password of the test users
+from conftest import PASSWORD
+
+
+# Function to return the exp claim of a token, without checking its signature
+def jwt_exp(token: str) -> float:
+    return jwt.decode(token, options={"verify_signature": False})["exp"]
+
+
+# Function to return the stored password hash of a user
+def stored_hash(database, user_id: int) -> str:
+    with database.connect() as conn:
+        return conn.execute(
+            text("SELECT password FROM users WHERE id = :id"), {"id": user_id}
+        ).scalar_one()
+
+
+# Function to replace a user's hash with one made with a higher cost than the
+# configured one, returning it
+def store_outdated_hash(database, user_id: int) -> str:
+    old_hash = get_pwd_context().handler().using(rounds=5).hash(PASSWORD)
+    with database.begin() as conn:
+        conn.execute(
+            text("UPDATE users SET password = :hash WHERE id = :id"),
+            {"hash": old_hash, "id": user_id},
+        )
+    return old_hash
+
+
+def login(client):
+    return client.post(
+        "/login", data={"username": "user1@example.com", "password": PASSWORD}
+    )
+
+
+def test_login_releases_the_connection_before_verifying(
+    client, make_users, monkeypatch
+):
+    make_users(1)
+    verify = hashing_pool.verify
+    checked_out = []
+
+    # Record how many connections are checked out while the password is checked
+    async def watched_verify(plain_password, hashed_password):
+        checked_out.append(get_async_engine().pool.checkedout())
+        return await verify(plain_password, hashed_password)
+
+    monkeypatch.setattr(hashing_pool, "verify", watched_verify)
+    response = login(client)
+
+    assert response.status_code == 200
+    assert checked_out == [0]
+
+
+def test_login_upgrades_an_outdated_hash(client, database, make_users):
+    (user_id,) = make_users(1)
+    old_hash = store_outdated_hash(database, user_id)
+    assert password_needs_rehash(old_hash)
+
+    response = login(client)
+
+    assert response.status_code == 200
+    new_hash = stored_hash(database, user_id)
+    assert new_hash != old_hash
+    assert not password_needs_rehash(new_hash)
+    # The upgraded hash still accepts the password
+    assert login(client).status_code == 200
+
+
+def test_cached_token_expires_with_the_token(client, make_users, make_posts):
+    (user_id,) = make_users(1)
+    (post_id,) = make_posts(user_id, 1)
+    token = create_access_token({"id": user_id}, expires_delta=timedelta(seconds=2))
+    headers = {"Authorization": f"Bearer {token}"}
+    post = {"title": "updated", "content": "by a short-lived token", "published": True}
+
+    response = client.put(f"/posts/{post_id}", json=post, headers=headers)
+    assert response.status_code == 200
+
+    # The cache is keyed by the token's digest and never holds the token itself
+    entries = get_token_cache().data
+    assert len(entries) == 1
+    ((key, (_, cached_id)),) = entries.items()
+    assert isinstance(key, bytes) and len(key) == 32
+    assert token.encode() not in key and cached_id == user_id
+
+    # Once the token's exp has passed, the cached claims are not used either
+    exp = jwt_exp(token)
+    time.sleep(max(0.0, exp - time.time()) + 0.1)
+    response = client.put(f"/posts/{post_id}", json=post, headers=headers)
+    assert response.status_code == 401
+    assert len(entries) == 0
+
+
+def test_signup_replaces_a_cached_user_with_the_same_id(client, auth):
+    # A user cached before the ID was handed out again, e.g. after a restore
+    get_user_cache().set(1, Users(id=1, email="old@example.com", password="old"))
+
+    response = client.post(
+        "/users/", json={"email": "new@example.com", "password": PASSWORD}
+    )
+    assert response.status_code == 201
+    assert response.json()["id"] == 1
+
+    post = {"title": "mine", "content": "owned by the new user", "published": True}
+    response = client.post("/posts/", json=post, headers=auth(1))
+    assert response.status_code == 201
+    assert response.json()["owner"]["email"] == "new@example.com"
+
+
+def test_rehash_drops_the_cached_user(client, database, make_users, make_posts, auth):
+    (user_id,) = make_users(1)
+    (post_id,) = make_posts(user_id, 1)
+    old_hash = store_outdated_hash(database, user_id)
+    post = {"title": "updated", "content": "new content", "published": True}
+    # Authenticating caches the user with its outdated hash
+    response = client.put(f"/posts/{post_id}", json=post, headers=auth(user_id))
+    assert response.status_code == 200
+    assert get_user_cache().get(user_id).password == old_hash
+
+    assert login(client).status_code == 200
+
+    # The next request loads the user with the upgraded hash
+    assert get_user_cache().get(user_id) is None
+    response = client.put(f"/posts/{post_id}", json=post, headers=auth(user_id))
+    assert response.status_code == 200
+    assert get_user_cache().get(user_id).password == stored_hash(database, user_id)
@@ -0,0 +1,48 @@
+# Tests for the bulk endpoints' per-item results and their published request schema
+
+# Import pytest for parametrization
+import pytest
+
+# Import the item schemas the bulk endpoints validate against
+from app.schema import PostCreate, VoteCreate
+
+
+def test_bulk_votes_report_each_item(client, make_users, make_posts, auth):
+    (user_id,) = make_users(1)
+    first, second, third = make_posts(user_id, 3)
+    headers = auth(user_id)
+    client.post("/votes/", json={"post_id": second, "dir": 1}, headers=headers)
+
+    response = client.post(
+        "/votes/bulk",
+        json=[
+            {"post_id": first, "dir": 1},
+            {"post_id": second, "dir": 0},
+            {"post_id": third, "dir": 0},
+            {"post_id": first, "dir": 0},
+            {"post_id": 999999, "dir": 1},
+            {"post_id": "not a number", "dir": 1},
+        ],
+        headers=headers,
+    )
+
+    assert response.status_code == 200
+    assert [item["status"] for item in response.json()["results"]] == [
+        201,  # created
+        200,  # removed
+        404,  # no vote to remove
+        409,  # same post twice
+        404,  # no such post
+        422,  # invalid item
+    ]
+
+
+@pytest.mark.parametrize(
+    "path, model", [("/posts/bulk", PostCreate), ("/votes/bulk", VoteCreate)]
+)
+def test_bulk_item_schema_is_published(client, path, model):
+    operation = client.get("/openapi.json").json()["paths"][path]["post"]
+
+    schema = operation["requestBody"]["content"]["application/json"]["schema"]
+    assert schema["type"] == "array"
+    assert schema["items"] == model.model_json_schema()
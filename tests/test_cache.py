@@ -0,0 +1,119 @@
+# Tests for the response cache: its entries, conditional GETs answered without the
+# database, and invalidation by the writes that change a cached response
+
+# Import the response cache and its getter
+from app.cache import ResponseCache
+from app.config import get_response_cache
+
+# Import the header holding the number of SQL statements a request ran
+from app.profiler import QUERY_COUNT_HEADER
+
+# Import the posts router to slow a read down until a write lands
+from app.routers import posts
+
+
+def test_entries_do_not_share_headers():
+    cache = ResponseCache(maxsize=10, ttl=60)
+    first = cache.set("a", cache.version, b"[]")
+    second = cache.set("b", cache.version, b"[]")
+    first.headers["X-Next-Cursor"] = "leaked"
+
+    assert second.headers == {}
+    assert cache.set("c", cache.version, b"[]").headers == {}
+
+
+def test_entries_copy_the_callers_headers():
+    cache = ResponseCache(maxsize=10, ttl=60)
+    headers = {"X-Next-Cursor": "first"}
+    entry = cache.set("a", cache.version, b"[]", headers)
+    headers["X-Next-Cursor"] = "changed"
+
+    assert entry.headers == {"X-Next-Cursor": "first"}
+
+
+def test_unchanged_list_is_not_modified_without_queries(client, make_users, make_posts):
+    (user_id,) = make_users(1)
+    make_posts(user_id, 3)
+    first = client.get("/posts/")
+    assert first.headers[QUERY_COUNT_HEADER] == "1"
+
+    response = client.get("/posts/", headers={"If-None-Match": first.headers["ETag"]})
+
+    assert response.status_code == 304
+    assert response.headers["ETag"] == first.headers["ETag"]
+    assert response.headers[QUERY_COUNT_HEADER] == "0"
+
+
+def test_vote_changes_the_etag(client, make_users, make_posts, auth):
+    owner, voter = make_users(2)
+    (post_id,) = make_posts(owner, 1)
+    list_etag = client.get("/posts/").headers["ETag"]
+    post_etag = client.get(f"/posts/{post_id}").headers["ETag"]
+
+    response = client.post(
+        "/votes/", json={"post_id": post_id, "dir": 1}, headers=auth(voter)
+    )
+    assert response.status_code == 201
+
+    response = client.get("/posts/", headers={"If-None-Match": list_etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != list_etag
+    assert response.json()[0]["votes"] == 1
+    response = client.get(f"/posts/{post_id}", headers={"If-None-Match": post_etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != post_etag
+    assert response.json()["votes"] == 1
+
+
+def test_update_changes_the_etag(client, make_users, make_posts, auth):
+    (user_id,) = make_users(1)
+    (post_id,) = make_posts(user_id, 1)
+    list_etag = client.get("/posts/").headers["ETag"]
+    post_etag = client.get(f"/posts/{post_id}").headers["ETag"]
+    post = {"title": "updated", "content": "new content", "published": True}
+
+    response = client.put(f"/posts/{post_id}", json=post, headers=auth(user_id))
+    assert response.status_code == 200
+
+    response = client.get("/posts/", headers={"If-None-Match": list_etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != list_etag
+    assert response.json()[0]["PostPublic"]["title"] == "updated"
+    response = client.get(f"/posts/{post_id}", headers={"If-None-Match": post_etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != post_etag
+    assert response.json()["PostPublic"]["title"] == "updated"
+
+
+def test_read_finishing_after_a_write_is_not_cached(
+    client, make_users, make_posts, monkeypatch
+):
+    (user_id,) = make_users(1)
+    (post_id,) = make_posts(user_id, 1)
+    to_post_vote = posts.to_post_vote
+
+    # A write lands after the reads queried the database but before they are cached
+    def to_post_vote_then_write(row):
+        get_response_cache().invalidate(post_id)
+        return to_post_vote(row)
+
+    monkeypatch.setattr(posts, "to_post_vote", to_post_vote_then_write)
+    assert client.get("/posts/").status_code == 200
+    assert client.get(f"/posts/{post_id}").status_code == 200
+    monkeypatch.setattr(posts, "to_post_vote", to_post_vote)
+
+    # Neither body was stored, so both reads go back to the database
+    assert client.get("/posts/").headers[QUERY_COUNT_HEADER] == "1"
+    assert client.get(f"/posts/{post_id}").headers[QUERY_COUNT_HEADER] == "1"
+
+
+def test_entry_built_before_an_invalidation_is_not_stored():
+    cache = ResponseCache(maxsize=10, ttl=60)
+    version = cache.version
+    cache.invalidate(1)
+
+    cache.set(("post", 1), version, b"{}")
+    cache.set(("posts", 0, 100, "", None), version, b"[]")
+
+    assert cache.get(("post", 1)) is None
+    assert cache.get(("posts", 0, 100, "", None)) is None
@@ -0,0 +1,18 @@
+# Tests for the CORS headers browsers need to page through posts
+
+# Import the header carrying the keyset cursor
+from app.pagination import NEXT_CURSOR_HEADER
+
+
+def test_cursor_and_etag_are_exposed(client, make_users, make_posts):
+    (owner,) = make_users(1)
+    make_posts(owner, 3)
+
+    response = client.get(
+        "/posts/", params={"limit": 2}, headers={"Origin": "https://example.com"}
+    )
+
+    exposed = response.headers["Access-Control-Expose-Headers"].lower().split(", ")
+    assert NEXT_CURSOR_HEADER.lower() in exposed
+    assert "etag" in exposed
+    assert NEXT_CURSOR_HEADER in response.headers
@@ -0,0 +1,128 @@
+# Tests for the sharded vote counters: folding and reconciling, alone or while votes
+# keep arriving, must leave post.votes equal to the number of votes of each post
+
+# Import asyncio to reconcile while votes are being cast
+import asyncio
+
+# Import httpx to cast votes on the app's event loop
+import httpx
+
+# Import pytest for fixtures
+import pytest
+
+# Import text to read the counters back and make them drift
+from sqlmodel import text
+
+# Import AsyncSession to run the fold and the reconciler
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+# Import the app that takes the votes
+from app.main import app
+
+# Import the settings and async engine getters
+from app.config import get_async_engine, get_settings
+
+# Import the fold and the reconciler under test
+from app.counters import fold_vote_shards, reconcile_vote_counts
+
+# Number of posts and of users voting on every post
+POSTS = 5
+VOTERS = 8
+
+
+# Function to return the posts whose post.votes differs from their vote rows, and
+# the number of pending shard deltas
+def drift(database) -> tuple[list, int]:
+    with database.connect() as conn:
+        drifted = conn.execute(
+            text(
+                "SELECT post.id, post.votes, (SELECT count(*) FROM vote "
+                "WHERE vote.post_id = post.id) AS counted FROM post "
+                "WHERE post.votes <> (SELECT count(*) FROM vote "
+                "WHERE vote.post_id = post.id)"
+            )
+        ).all()
+        pending = conn.execute(text("SELECT count(*) FROM votecountshard")).scalar()
+    return drifted, pending
+
+
+# Function to fold the pending shard deltas
+async def fold():
+    async with AsyncSession(get_async_engine()) as session:
+        await fold_vote_shards(session)
+
+
+# Function to reconcile every post's vote count
+async def reconcile():
+    async with AsyncSession(get_async_engine()) as session:
+        return await reconcile_vote_counts(session)
+
+
+# Switch to sharded counters and create posts with users to vote on them
+@pytest.fixture
+def sharded(client, make_users, make_posts, monkeypatch):
+    monkeypatch.setattr(get_settings(), "vote_counter_mode", "sharded")
+    # Small batches make the reconciler take several transactions
+    monkeypatch.setattr(get_settings(), "vote_reconcile_batch_size", 2)
+    owner, *users = make_users(VOTERS + 1)
+    return make_posts(owner, POSTS), users
+
+
+# Function to cast one vote of every user on every post, with the reconciler running
+# at the same time if asked, returning the vote status codes
+def vote_on_everything(client, auth, posts, users, direction, with_reconcile=False):
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://testserver"
+        ) as async_client:
+            votes = [
+                async_client.post(
+                    "/votes/",
+                    json={"post_id": post_id, "dir": direction},
+                    headers=auth(user),
+                )
+                for post_id in posts
+                for user in users
+            ]
+            tasks = votes + ([reconcile()] if with_reconcile else [])
+            return await asyncio.gather(*tasks)
+
+    results = client.portal.call(run)
+    return [response.status_code for response in results[: len(posts) * len(users)]]
+
+
+def test_reconcile_keeps_pending_trend_deltas(client, database, sharded, auth):
+    posts, users = sharded
+    assert set(vote_on_everything(client, auth, posts, users, 1)) == {201}
+    # Votes are still in the shards, and the counts drifted on top of that
+    with database.begin() as conn:
+        conn.execute(
+            text("UPDATE post SET votes = 100 WHERE id = :id"), {"id": posts[0]}
+        )
+
+    # The folded deltas fix every post but the one that drifted
+    assert client.portal.call(reconcile) == 1
+
+    assert drift(database) == ([], 0)
+    with database.connect() as conn:
+        trends = conn.execute(
+            text("SELECT count(*) FROM posttrend WHERE score > 0")
+        ).scalar()
+    assert trends == POSTS
+
+
+def test_fold_and_reconcile_converge_while_voting(client, database, sharded, auth):
+    posts, users = sharded
+    assert set(vote_on_everything(client, auth, posts, users, 1)) == {201}
+    client.portal.call(fold)
+    assert drift(database) == ([], 0)
+
+    # Take the votes back while the reconciler recounts, then fold what is left
+    statuses = vote_on_everything(client, auth, posts, users, 0, with_reconcile=True)
+    assert set(statuses) == {201}
+    client.portal.call(fold)
+
+    assert drift(database) == ([], 0)
+    with database.connect() as conn:
+        assert conn.execute(text("SELECT sum(votes) FROM post")).scalar() == 0
@@ -0,0 +1,72 @@
+# Tests for the worker lifecycle under a real uvicorn process, which owns the signal
+# handling that TestClient bypasses
+
+# Import os to pass the test settings to the server
+import os
+
+# Import signal to ask the server to stop
+import signal
+
+# Import socket to pick a free port
+import socket
+
+# Import subprocess to run uvicorn
+import subprocess
+
+# Import sys to start uvicorn with the same interpreter
+import sys
+
+# Import time to poll the server
+import time
+
+# Import httpx to call the server
+import httpx
+
+# Seconds the server keeps serving after SIGTERM in this test
+DRAIN_DELAY = 2.0
+
+
+# Function to wait until the server at base_url reports ready
+def wait_until_ready(process, base_url: str, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"{base_url}/health/ready").status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        assert process.poll() is None, "uvicorn exited during startup"
+        time.sleep(0.05)
+    raise AssertionError("uvicorn did not become ready")
+
+
+def test_sigterm_reports_draining_while_serving():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    base_url = f"http://127.0.0.1:{port}"
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1"]
+        + ["--port", str(port), "--log-level", "warning"],
+        env={**os.environ, "SHUTDOWN_DRAIN_DELAY": str(DRAIN_DELAY)},
+    )
+    try:
+        wait_until_ready(process, base_url)
+        process.send_signal(signal.SIGTERM)
+        sent = time.monotonic()
+        time.sleep(0.2)
+
+        # Still serving, but no longer ready
+        ready = httpx.get(f"{base_url}/health/ready")
+        assert ready.status_code == 503
+        assert ready.json() == {"status": "draining"}
+        assert httpx.get(f"{base_url}/posts/").status_code == 200
+
+        # Then the server stops once the delay is over; uvicorn re-raises the
+        # signal after its graceful shutdown
+        assert process.wait(timeout=DRAIN_DELAY + 10) in (0, -signal.SIGTERM)
+        assert time.monotonic() - sent >= DRAIN_DELAY
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
@@ -0,0 +1,103 @@
+# Keyset pagination tests: following the next page cursor visits every row exactly
+# once, even when rows share a created_at, and malformed cursors are rejected
+
+# Import base64 and json to forge cursors that decode to the wrong position
+import base64
+import json
+
+# Import pytest for parametrization
+import pytest
+
+# Import text to create posts that share a creation time
+from sqlmodel import text
+
+# Import the cursor helper and the header carrying the next page cursor
+from app.pagination import NEXT_CURSOR_HEADER, encode_cursor
+
+
+# Function to encode any JSON value the way cursors are encoded
+def forge_cursor(position) -> str:
+    raw = json.dumps(position).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+# Cursors that are not base64 JSON, or decode to a position of the wrong shape
+MALFORMED_CURSORS = [
+    "not a cursor!",
+    forge_cursor({"id": 1}),
+    forge_cursor([1, 2, 3]),
+    forge_cursor(["yesterday", 1]),
+    forge_cursor([True]),
+    forge_cursor([{"dt": "not a date"}, 1]),
+]
+
+
+# Function to follow the next page cursor from the first page, returning the IDs of
+# every page
+def collect_pages(client, url: str, key, **kwargs) -> list[list[int]]:
+    pages = []
+    params = {"limit": 3}
+    while True:
+        response = client.get(url, params=params, **kwargs)
+        assert response.status_code == 200
+        pages.append([key(item) for item in response.json()])
+        cursor = response.headers.get(NEXT_CURSOR_HEADER)
+        if cursor is None:
+            return pages
+        params = {"limit": 3, "cursor": cursor}
+
+
+def test_posts_with_tied_created_at_are_paged_once(client, database, make_users):
+    (user_id,) = make_users(1)
+    # Groups of four posts share a creation time, so pages end inside the groups
+    with database.begin() as conn:
+        conn.execute(
+            text(
+                "INSERT INTO post (title, content, published, created_at, owner_id) "
+                "SELECT 'post ' || i, 'tied', true, "
+                "date_trunc('second', now()) - make_interval(secs => i / 4), :owner "
+                "FROM generate_series(0, 13) AS i"
+            ),
+            {"owner": user_id},
+        )
+        expected = list(
+            conn.execute(
+                text("SELECT id FROM post ORDER BY created_at DESC, id DESC")
+            ).scalars()
+        )
+
+    pages = collect_pages(client, "/posts/", lambda item: item["PostPublic"]["id"])
+
+    assert [len(page) for page in pages] == [3, 3, 3, 3, 2]
+    assert [post_id for page in pages for post_id in page] == expected
+
+
+def test_users_are_paged_once(client, make_users, auth):
+    user_ids = make_users(8)
+
+    pages = collect_pages(
+        client, "/users/", lambda item: item["id"], headers=auth(user_ids[0])
+    )
+
+    assert [len(page) for page in pages] == [3, 3, 2]
+    assert [user_id for page in pages for user_id in page] == sorted(user_ids)
+
+
+@pytest.mark.parametrize("cursor", MALFORMED_CURSORS)
+def test_malformed_post_cursor_is_rejected(client, cursor):
+    response = client.get("/posts/", params={"cursor": cursor})
+
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid pagination cursor"
+
+
+@pytest.mark.parametrize(
+    "cursor", MALFORMED_CURSORS + [encode_cursor("1"), forge_cursor([1, 2])]
+)
+def test_malformed_user_cursor_is_rejected(client, make_users, auth, cursor):
+    (user_id,) = make_users(1)
+
+    response = client.get("/users/", params={"cursor": cursor}, headers=auth(user_id))
+
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid pagination cursor"
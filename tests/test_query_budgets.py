@@ -0,0 +1,142 @@
+# Query budget tests: every route is called with cold caches, its worst case, and
+# must stay within the number of SQL statements it declares with query_budget
+
+# Import datetime to pick an export range that includes the test posts
+from datetime import datetime, timedelta
+
+# Import pytest for fixtures and parametrization
+import pytest
+
+# Import APIRoute to list the routes of the app
+from fastapi.routing import APIRoute
+
+# Import the settings and cache getters from the config module
+from app.config import get_response_cache, get_token_cache, get_user_cache, settings
+
+# Import the app whose routes are checked
+from app.main import app
+
+# Import the helper that compares a response's query count with its budget
+from app.profiler import assert_within_query_budget
+
+# Import the password of the test users
+from conftest import PASSWORD
+
+# A valid post body
+POST = {"title": "budget", "content": "query budget test", "published": True}
+
+# Routes that run no SQL of their own and declare no budget
+UNBUDGETED = {"/health", "/health/ready", "/health/pool", "/metrics"}
+
+# One request per route: method, route path, URL and request options, with {user_id}
+# and {post_id} filled in from the seeded data
+CASES = [
+    (
+        "POST",
+        "/users/",
+        "/users/",
+        {"json": {"email": "new@example.com", "password": "x"}},
+    ),
+    ("GET", "/users/", "/users/", {"auth": True}),
+    ("GET", "/users/{user_id}", "/users/{user_id}", {"auth": True}),
+    (
+        "POST",
+        "/login",
+        "/login",
+        {"data": {"username": "user1@example.com", "password": PASSWORD}},
+    ),
+    ("POST", "/posts/", "/posts/", {"json": POST, "auth": True}),
+    ("POST", "/posts/bulk", "/posts/bulk", {"json": [POST] * 10, "auth": True}),
+    ("GET", "/posts/", "/posts/", {}),
+    ("GET", "/posts/", "/posts/?search=post", {}),
+    ("GET", "/posts/trending", "/posts/trending", {}),
+    ("GET", "/posts/export", "/posts/export?created_from={since}", {}),
+    ("GET", "/posts/{post_id}", "/posts/{post_id}", {}),
+    ("PUT", "/posts/{post_id}", "/posts/{post_id}", {"json": POST, "auth": True}),
+    ("PATCH", "/posts/{post_id}", "/posts/{post_id}", {"json": POST, "auth": True}),
+    ("DELETE", "/posts/{post_id}", "/posts/{post_id}", {"auth": True}),
+    (
+        "POST",
+        "/votes/",
+        "/votes/",
+        {"json": {"post_id": "{post_id}", "dir": 1}, "auth": True},
+    ),
+    (
+        "POST",
+        "/votes/bulk",
+        "/votes/bulk",
+        {"json": [{"post_id": "{post_id}", "dir": 1}], "auth": True},
+    ),
+]
+
+
+# Function to empty every in-process cache, so the request runs all of its queries
+def clear_caches():
+    get_response_cache().clear()
+    get_user_cache().data.clear()
+    get_token_cache().data.clear()
+
+
+# Function to replace "{post_id}" placeholders in a JSON body
+def fill_ids(body, post_id: int):
+    if isinstance(body, list):
+        return [fill_ids(item, post_id) for item in body]
+    if isinstance(body, dict):
+        return {key: fill_ids(value, post_id) for key, value in body.items()}
+    return post_id if body == "{post_id}" else body
+
+
+# Create a user with a few posts for the requests to read and change
+@pytest.fixture
+def seeded(make_users, make_posts):
+    (user_id,) = make_users(1)
+    post_id = make_posts(user_id, 5)[0]
+    return user_id, post_id
+
+
+@pytest.mark.parametrize(
+    "method, route, url, options", CASES, ids=[f"{c[0]} {c[2]}" for c in CASES]
+)
+def test_route_within_budget(client, seeded, auth, method, route, url, options):
+    user_id, post_id = seeded
+    fill = {
+        "user_id": user_id,
+        "post_id": post_id,
+        "since": (datetime.now() - timedelta(days=1)).isoformat(),
+    }
+    kwargs = {key: value for key, value in options.items() if key != "auth"}
+    if "json" in kwargs:
+        # Put the seeded post ID into vote bodies
+        kwargs["json"] = fill_ids(kwargs["json"], post_id)
+    if options.get("auth"):
+        kwargs["headers"] = auth(user_id)
+
+    clear_caches()
+    response = client.request(method, url.format(**fill), **kwargs)
+
+    assert response.status_code < 400, response.text
+    assert_within_query_budget(response)
+
+
+def test_bulk_create_at_the_size_limit(client, seeded, auth):
+    user_id, _ = seeded
+    clear_caches()
+    response = client.post(
+        "/posts/bulk", json=[POST] * settings.bulk_max_items, headers=auth(user_id)
+    )
+
+    assert response.status_code == 200
+    assert response.json()["succeeded"] == settings.bulk_max_items
+    assert_within_query_budget(response)
+
+
+def test_every_route_is_checked():
+    checked = {(method, route) for method, route, _, _ in CASES}
+    routes = {
+        (method, route.path)
+        for route in app.routes
+        if isinstance(route, APIRoute) and route.path not in UNBUDGETED
+        for method in route.methods
+    }
+
+    assert routes - checked == set()
@@ -0,0 +1,345 @@
+# Query plan tests for every SQL statement the routers issue. The tests seed a skewed
+# synthetic dataset, drive the API through a fixed scenario of reads and writes,
+# capture each statement with its parameters and run EXPLAIN on it. They fail when a
+# plan sequentially scans a large table, when it differs from the plans recorded in
+# explain_baseline.json, or when a foreign key of a large table has no index, since
+# cascades and joins on it scan the whole table. After an intended plan change,
+# record the new plans and commit tests/explain_baseline.json:
+#
+#     python -m pytest -q tests/test_query_plans.py --update-plans
+
+# Import argparse to pass the dataset size to the seeder
+import argparse
+
+# Import json to read and write the baseline plans
+import json
+
+# Import ContextVar to tell the scenario's statements from background tasks'
+from contextvars import ContextVar
+
+# Import datetime to build a bounded export range
+from datetime import datetime, timedelta
+
+# Import Path to locate the baseline next to this module
+from pathlib import Path
+
+# Import httpx to send the scenario's requests from the app's event loop
+import httpx
+
+# Import pytest for fixtures
+import pytest
+
+# Import SQLAlchemy's event API to capture statements
+from sqlalchemy import event, text
+
+# Import AsyncSession to build the trending feed from the seeded votes
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+# Import the app, its engine and cache getters, and the token helper
+from app.config import (
+    create_access_token,
+    get_async_engine,
+    get_response_cache,
+    get_token_cache,
+    get_user_cache,
+)
+from app.main import app
+from app.pagination import NEXT_CURSOR_HEADER
+from app.seed import seed
+from app.trending import rebuild_trends, refresh_trending
+
+# Import the password of the test users and the tables to empty afterwards
+from conftest import PASSWORD, TABLES
+
+# Location of the recorded plans
+BASELINE_PATH = Path(__file__).with_name("explain_baseline.json")
+
+# Size of the seeded dataset; large enough that the planner prefers indexes
+DATASET = {"users": 10_000, "posts": 50_000, "votes": 250_000, "days": 60}
+
+# Tables with at least this many rows count as large
+MIN_ROWS = 5_000
+
+# Statements worth explaining; transaction control and the like are skipped
+EXPLAINABLE = ("select", "insert", "update", "delete", "with")
+
+# Foreign keys whose columns are not the leading columns of any index
+UNINDEXED_FOREIGN_KEYS_SQL = text("""
+    SELECT c.conrelid::regclass::text, c.conname, c.reltuples
+    FROM (
+        SELECT con.conrelid, con.conname, con.conkey, cls.reltuples
+        FROM pg_constraint con JOIN pg_class cls ON cls.oid = con.conrelid
+        WHERE con.contype = 'f' AND con.connamespace = 'public'::regnamespace
+    ) AS c
+    WHERE NOT EXISTS (
+        SELECT 1 FROM pg_index i
+        WHERE i.indrelid = c.conrelid
+            AND (string_to_array(i.indkey::text, ' ')::int2[])[1:cardinality(c.conkey)]
+                @> c.conkey
+    )
+    ORDER BY 1, 2
+    """)
+
+# Estimated row count of every table, for telling large tables from small ones
+TABLE_ROWS_SQL = text("""
+    SELECT relname, reltuples FROM pg_class
+    WHERE relkind = 'r' AND relnamespace = 'public'::regnamespace
+    """)
+
+# Label of the scenario step whose request is running, None outside the scenario
+step_label: ContextVar[str | None] = ContextVar("step_label", default=None)
+
+
+# Records the statements run by each labelled scenario step
+class StatementCapture:
+    def __init__(self):
+        # Captured (statement, parameters) pairs by step label, in run order
+        self.statements: dict[str, list[tuple[str, dict]]] = {}
+
+    # Function to record a statement sent by the async engine
+    def before_cursor_execute(
+        self, conn, cursor, statement, parameters, context, executemany
+    ):
+        label = step_label.get()
+        if label is None or not statement.lstrip().lower().startswith(EXPLAINABLE):
+            return
+        # Explain the first row of a batch; every row shares its plan (batched
+        # INSERT ... VALUES statements arrive with their parameters already merged)
+        if executemany and not isinstance(parameters, dict):
+            parameters = parameters[0]
+        self.statements.setdefault(label, []).append((statement, parameters))
+
+
+# Function to run every route against the seeded data, labelling each step
+def run_scenario(client, database):
+    with database.connect() as conn:
+        user_id, email = conn.execute(
+            text("SELECT id, email FROM users ORDER BY id LIMIT 1")
+        ).one()
+        (post_id,) = conn.execute(text("SELECT max(id) FROM post")).one()
+    auth = {"Authorization": f"Bearer {create_access_token({'id': user_id})}"}
+
+    # Send one request on the app's event loop with the step label set, so only its
+    # statements are captured and not those of the lifespan's background tasks
+    async def send(label: str, method: str, url: str, **kwargs):
+        step_label.set(label)
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://testserver"
+        ) as async_client:
+            return await async_client.request(method, url, **kwargs)
+
+    # Function to run one request as a labelled step with cold caches, requiring it
+    # to succeed
+    def call(label: str, method: str, url: str, **kwargs):
+        get_response_cache().clear()
+        response = client.portal.call(lambda: send(label, method, url, **kwargs))
+        assert response.status_code < 400, f"{label}: {response.text}"
+        return response
+
+    call(
+        "POST /login", "POST", "/login", data={"username": email, "password": PASSWORD}
+    )
+    page = call("GET /posts/", "GET", "/posts/", params={"limit": 100})
+    call("GET /posts/ offset", "GET", "/posts/", params={"limit": 100, "offset": 1000})
+    call(
+        "GET /posts/ cursor",
+        "GET",
+        "/posts/",
+        params={"limit": 100, "cursor": page.headers[NEXT_CURSOR_HEADER]},
+    )
+    # A rare phrase, since any word of the small seeded vocabulary is in most posts
+    call(
+        "GET /posts/ search",
+        "GET",
+        "/posts/",
+        params={"search": '"query plan audit"'},
+    )
+    call("GET /posts/trending", "GET", "/posts/trending", params={"limit": 100})
+    call(
+        "GET /posts/export",
+        "GET",
+        "/posts/export",
+        params={"created_from": (datetime.now() - timedelta(hours=1)).isoformat()},
+    )
+    call("GET /posts/{post_id}", "GET", f"/posts/{post_id}")
+    call("GET /users/", "GET", "/users/", params={"limit": 100}, headers=auth)
+    call("GET /users/{user_id}", "GET", f"/users/{user_id}", headers=auth)
+
+    post = {"title": "audit", "content": "query plan audit", "published": True}
+    created = call("POST /posts/", "POST", "/posts/", json=post, headers=auth).json()
+    new_id = created["id"]
+    call("PUT /posts/{post_id}", "PUT", f"/posts/{new_id}", json=post, headers=auth)
+    call(
+        "PATCH /posts/{post_id}",
+        "PATCH",
+        f"/posts/{new_id}",
+        json={**post, "title": "audited"},
+        headers=auth,
+    )
+    call(
+        "POST /votes/ up",
+        "POST",
+        "/votes/",
+        json={"post_id": new_id, "dir": 1},
+        headers=auth,
+    )
+    call(
+        "POST /votes/ down",
+        "POST",
+        "/votes/",
+        json={"post_id": new_id, "dir": 0},
+        headers=auth,
+    )
+    bulk = call(
+        "POST /posts/bulk", "POST", "/posts/bulk", json=[post, post], headers=auth
+    )
+    bulk_ids = [result["id"] for result in bulk.json()["results"]]
+    call(
+        "POST /votes/bulk up",
+        "POST",
+        "/votes/bulk",
+        json=[{"post_id": id, "dir": 1} for id in bulk_ids],
+        headers=auth,
+    )
+    call(
+        "POST /votes/bulk down",
+        "POST",
+        "/votes/bulk",
+        json=[{"post_id": id, "dir": 0} for id in bulk_ids],
+        headers=auth,
+    )
+    for id in [new_id, *bulk_ids]:
+        call("DELETE /posts/{post_id}", "DELETE", f"/posts/{id}", headers=auth)
+
+
+# Function to render a plan node and its children as one line, e.g.
+# "Limit(Index Scan using ix_post_created_at_id on post)"
+def plan_shape(node: dict) -> str:
+    shape = node["Node Type"]
+    if "Index Name" in node:
+        shape += f" using {node['Index Name']}"
+    if "Relation Name" in node:
+        shape += f" on {node['Relation Name']}"
+    children = node.get("Plans", [])
+    if children:
+        shape += "(" + ", ".join(plan_shape(child) for child in children) + ")"
+    return shape
+
+
+# Function to list the tables a plan reads with a sequential scan
+def sequential_scans(node: dict) -> list[str]:
+    tables = [node["Relation Name"]] if node["Node Type"] == "Seq Scan" else []
+    for child in node.get("Plans", []):
+        tables += sequential_scans(child)
+    return tables
+
+
+# Function to score the seeded votes and build the trending feed from them
+async def build_trending():
+    async with AsyncSession(get_async_engine()) as session:
+        await rebuild_trends(session)
+        await refresh_trending(session)
+
+
+# The tests of this module share one seeded dataset instead of empty tables
+@pytest.fixture
+def clean():
+    pass
+
+
+# Seed the dataset once for the module and empty the tables again afterwards
+@pytest.fixture(scope="module")
+def seeded(client, database):
+    with database.begin() as conn:
+        conn.execute(text(f"TRUNCATE {TABLES} RESTART IDENTITY CASCADE"))
+    # Users cached by earlier tests would spare the scenario its user lookups
+    get_user_cache().clear()
+    get_token_cache().clear()
+    seed(
+        argparse.Namespace(
+            **DATASET,
+            vote_skew=1.1,
+            post_skew=1.2,
+            password=PASSWORD,
+            seed=1,
+            truncate=False,
+        )
+    )
+    client.portal.call(build_trending)
+    yield database
+    with database.begin() as conn:
+        conn.execute(text(f"TRUNCATE {TABLES} RESTART IDENTITY CASCADE"))
+
+
+# Run the scenario and explain every captured statement, returning the plans and
+# statements of each step
+@pytest.fixture(scope="module")
+def plans(client, seeded) -> dict[str, list[tuple[dict, str]]]:
+    capture = StatementCapture()
+    listener = (
+        get_async_engine().sync_engine,
+        "before_cursor_execute",
+        capture.before_cursor_execute,
+    )
+    event.listen(*listener)
+    try:
+        run_scenario(client, seeded)
+    finally:
+        event.remove(*listener)
+
+    plans = {}
+    with seeded.connect() as conn:
+        for label, statements in capture.statements.items():
+            plans[label] = []
+            for statement, parameters in statements:
+                result = conn.exec_driver_sql(
+                    f"EXPLAIN (FORMAT JSON) {statement}", parameters
+                )
+                plans[label].append((result.scalar()[0]["Plan"], statement))
+            conn.rollback()
+    return plans
+
+
+# Estimated row count of every table in the seeded database
+@pytest.fixture(scope="module")
+def table_rows(seeded) -> dict[str, float]:
+    with seeded.connect() as conn:
+        return dict(conn.execute(TABLE_ROWS_SQL).all())
+
+
+def test_foreign_keys_of_large_tables_are_indexed(seeded):
+    with seeded.connect() as conn:
+        unindexed = [
+            f"{table}: {constraint}"
+            for table, constraint, rows in conn.execute(UNINDEXED_FOREIGN_KEYS_SQL)
+            if rows >= MIN_ROWS
+        ]
+
+    assert unindexed == []
+
+
+def test_no_sequential_scans_of_large_tables(plans, table_rows):
+    scans = [
+        f"{label}: {table} (~{table_rows[table]:,.0f} rows) in {statement.strip()}"
+        for label, explained in plans.items()
+        for plan, statement in explained
+        for table in sequential_scans(plan)
+        if table_rows.get(table, 0) >= MIN_ROWS
+    ]
+
+    assert scans == []
+
+
+def test_plans_match_the_baseline(plans, pytestconfig):
+    shapes = {
+        label: [plan_shape(plan) for plan, _ in explained]
+        for label, explained in plans.items()
+    }
+    if pytestconfig.getoption("update_plans"):
+        BASELINE_PATH.write_text(json.dumps(shapes, indent=2, sort_keys=True) + "\n")
+        pytest.skip(f"Recorded the plans in {BASELINE_PATH.name}")
+
+    # Any plan that differs from the baseline is a regression until recorded
+    baseline = json.loads(BASELINE_PATH.read_text())
+    assert shapes == baseline
@@ -0,0 +1,67 @@
+# Tests for full-text search on GET /posts/: prefix terms, phrases and pagination
+
+# Import pytest for fixtures
+import pytest
+
+# Import text to create posts with chosen titles and content
+from sqlmodel import text
+
+# Import the header carrying the keyset cursor
+from app.pagination import NEXT_CURSOR_HEADER
+
+
+# Create posts with known content, returning their IDs by title
+@pytest.fixture
+def posts(database, make_users):
+    (owner,) = make_users(1)
+    contents = {
+        "basics": "learning python basics",
+        "reversed": "python learning notes",
+        "pythonic": "writing pythonic code",
+        "rust": "learning rust ownership",
+    }
+    with database.begin() as conn:
+        ids = conn.execute(
+            text(
+                "INSERT INTO post (title, content, published, created_at, owner_id) "
+                "SELECT title, content, true, now(), :owner "
+                "FROM unnest(CAST(:titles AS text[]), CAST(:contents AS text[])) "
+                "AS p(title, content) RETURNING id"
+            ),
+            {
+                "owner": owner,
+                "titles": list(contents),
+                "contents": list(contents.values()),
+            },
+        ).scalars()
+        return dict(zip(contents, ids))
+
+
+# Function to return the titles of the posts matching a search
+def search_titles(client, search: str) -> set[str]:
+    response = client.get("/posts/", params={"search": search})
+    assert response.status_code == 200
+    return {item["PostPublic"]["title"] for item in response.json()}
+
+
+def test_prefix_term(client, posts):
+    assert search_titles(client, "pyth*") == {"basics", "reversed", "pythonic"}
+
+
+def test_negated_prefix_term(client, posts):
+    assert search_titles(client, "-pyth*") == {"rust"}
+    assert search_titles(client, "learning -pyth*") == {"rust"}
+
+
+def test_prefix_inside_phrase_stays_in_phrase(client, posts):
+    # The phrase keeps its word order instead of becoming learning AND python:*
+    assert search_titles(client, '"learning python*"') == {"basics"}
+
+
+def test_ranked_search_has_no_cursor(client, posts):
+    ranked = client.get("/posts/", params={"search": "learning", "limit": 2})
+    assert len(ranked.json()) == 2
+    assert NEXT_CURSOR_HEADER not in ranked.headers
+
+    newest = client.get("/posts/", params={"limit": 2})
+    assert NEXT_CURSOR_HEADER in newest.headers
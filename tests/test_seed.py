@@ -0,0 +1,29 @@
+# Tests for the synthetic dataset's Zipf split
+
+# Import random for a seeded generator
+import random
+
+# Import pytest to check the error
+import pytest
+
+# Import the split used for posts per user and votes per post
+from app.seed import zipf_shares
+
+
+def test_shares_add_up_when_many_hit_the_cap():
+    # A steep skew puts most of the total on a few shares, which then hit the cap
+    shares = zipf_shares(200_000, 1_000, 1.5, 250, random.Random(1))
+
+    assert sum(shares) == 200_000
+    assert max(shares) <= 250
+
+
+def test_shares_fill_every_slot_at_capacity():
+    shares = zipf_shares(1_000, 100, 1.1, 10, random.Random(1))
+
+    assert shares == [10] * 100
+
+
+def test_total_over_capacity_is_rejected():
+    with pytest.raises(ValueError):
+        zipf_shares(1_001, 100, 1.1, 10, random.Random(1))
@@ -0,0 +1,210 @@
+# Concurrency tests for the vote counters: many users voting on the same post at once
+# must all succeed and leave post.votes equal to the number of votes, whether the
+# votes arrive one by one, in bulk requests or through the write-behind buffer, which
+# retries failed flushes before dropping and counting the votes
+
+# Import pytest for fixtures
+import pytest
+
+# Import text to read the counters back
+from sqlmodel import text
+
+# Import the settings getter to switch the vote buffer on
+from app.config import get_settings
+
+# Import the vote buffer to start and stop it around a test
+from app.vote_buffer import vote_buffer
+
+# Number of users voting on the post at once
+VOTERS = 40
+
+
+# Function to return the vote counter of a post and the number of its vote rows
+def vote_counts(database, post_id: int) -> tuple[int, int]:
+    with database.connect() as conn:
+        return conn.execute(
+            text(
+                "SELECT post.votes, (SELECT count(*) FROM vote "
+                "WHERE vote.post_id = post.id) FROM post WHERE post.id = :id"
+            ),
+            {"id": post_id},
+        ).one()
+
+
+# Create a post and VOTERS users to vote on it
+@pytest.fixture
+def voters(make_users, make_posts):
+    owner, *users = make_users(VOTERS + 1)
+    (post_id,) = make_posts(owner, 1)
+    return post_id, users
+
+
+def test_parallel_upvotes(database, voters, auth, send_concurrently):
+    post_id, users = voters
+    responses = send_concurrently(
+        [
+            (
+                "POST",
+                "/votes/",
+                {"json": {"post_id": post_id, "dir": 1}, "headers": auth(user)},
+            )
+            for user in users
+        ]
+    )
+
+    assert [response.status_code for response in responses] == [201] * VOTERS
+    assert vote_counts(database, post_id) == (VOTERS, VOTERS)
+
+
+def test_parallel_upvotes_and_removals(
+    database, make_posts, voters, auth, send_concurrently
+):
+    post_id, users = voters
+    # A second post makes each request lock more than one row
+    (other_id,) = make_posts(users[0], 1)
+    votes = [{"post_id": post_id, "dir": 1}, {"post_id": other_id, "dir": 1}]
+    removals = [{"post_id": post_id, "dir": 0}, {"post_id": other_id, "dir": 0}]
+
+    responses = send_concurrently(
+        [
+            ("POST", "/votes/bulk", {"json": votes, "headers": auth(user)})
+            for user in users
+        ]
+    )
+    assert [response.status_code for response in responses] == [200] * VOTERS
+    assert vote_counts(database, post_id) == (VOTERS, VOTERS)
+    assert vote_counts(database, other_id) == (VOTERS, VOTERS)
+
+    # Half of the users take both votes back while the others take back one
+    half = VOTERS // 2
+    responses = send_concurrently(
+        [
+            ("POST", "/votes/bulk", {"json": removals, "headers": auth(user)})
+            for user in users[:half]
+        ]
+        + [
+            (
+                "POST",
+                "/votes/",
+                {"json": {"post_id": post_id, "dir": 0}, "headers": auth(user)},
+            )
+            for user in users[half:]
+        ]
+    )
+    assert [response.status_code for response in responses] == [200] * half + [201] * (
+        VOTERS - half
+    )
+    assert vote_counts(database, post_id) == (0, 0)
+    assert vote_counts(database, other_id) == (half, half)
+
+
+def test_parallel_buffered_upvotes(
+    client, database, voters, auth, send_concurrently, monkeypatch
+):
+    post_id, users = voters
+    monkeypatch.setattr(get_settings(), "vote_buffer_enabled", True)
+    # Small batches make several flushes run while votes keep arriving
+    monkeypatch.setattr(get_settings(), "vote_buffer_batch_size", 8)
+    client.portal.call(vote_buffer.start)
+    try:
+        responses = send_concurrently(
+            [
+                (
+                    "POST",
+                    "/votes/",
+                    {"json": {"post_id": post_id, "dir": 1}, "headers": auth(user)},
+                )
+                for user in users
+            ]
+        )
+    finally:
+        # Closing flushes every accepted vote
+        client.portal.call(vote_buffer.close)
+
+    assert [response.status_code for response in responses] == [202] * VOTERS
+    assert vote_counts(database, post_id) == (VOTERS, VOTERS)
+
+
+def test_buffered_vote_before_start(client, voters, auth, monkeypatch):
+    post_id, users = voters
+    monkeypatch.setattr(get_settings(), "vote_buffer_enabled", True)
+
+    response = client.post(
+        "/votes/", json={"post_id": post_id, "dir": 1}, headers=auth(users[0])
+    )
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+
+
+# Function to cast every user's upvote through the write-behind buffer, with
+# vote_buffer.flush replaced by flush, returning the number of votes it dropped
+def buffered_upvotes(client, voters, auth, send_concurrently, monkeypatch, flush):
+    post_id, users = voters
+    monkeypatch.setattr(get_settings(), "vote_buffer_enabled", True)
+    monkeypatch.setattr(get_settings(), "vote_buffer_retry_delay", 0.01)
+    monkeypatch.setattr(vote_buffer, "flush", flush)
+    dropped = vote_buffer.dropped
+    client.portal.call(vote_buffer.start)
+    try:
+        responses = send_concurrently(
+            [
+                (
+                    "POST",
+                    "/votes/",
+                    {"json": {"post_id": post_id, "dir": 1}, "headers": auth(user)},
+                )
+                for user in users
+            ]
+        )
+    finally:
+        client.portal.call(vote_buffer.close)
+
+    assert [response.status_code for response in responses] == [202] * VOTERS
+    return vote_buffer.dropped - dropped
+
+
+def test_failed_buffer_flush_is_retried(
+    client, database, voters, auth, send_concurrently, monkeypatch
+):
+    post_id, _ = voters
+    flush = vote_buffer.flush
+    failures = []
+
+    # Fail the first two flushes, as if the database were briefly unavailable
+    async def flaky_flush(batch):
+        if len(failures) < 2:
+            failures.append(len(batch))
+            raise ConnectionError("database unavailable")
+        return await flush(batch)
+
+    dropped = buffered_upvotes(
+        client, voters, auth, send_concurrently, monkeypatch, flaky_flush
+    )
+
+    assert len(failures) == 2
+    assert dropped == 0
+    assert vote_counts(database, post_id) == (VOTERS, VOTERS)
+
+
+def test_buffer_counts_votes_dropped_after_every_retry(
+    client, database, voters, auth, send_concurrently, monkeypatch
+):
+    post_id, _ = voters
+    attempts = []
+
+    async def failing_flush(batch):
+        attempts.append(len(batch))
+        raise ConnectionError("database unavailable")
+
+    dropped = buffered_upvotes(
+        client, voters, auth, send_concurrently, monkeypatch, failing_flush
+    )
+
+    # Every batch was tried once and then retried before its votes were dropped
+    retries = get_settings().vote_buffer_flush_retries
+    assert sum(attempts) == VOTERS * (retries + 1)
+    assert dropped == VOTERS
+    assert vote_counts(database, post_id) == (0, 0)
+    metrics = client.get("/metrics").text
+    assert f"vote_buffer_dropped_total {vote_buffer.dropped}" in metrics